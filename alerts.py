@@ -0,0 +1,213 @@
+"""价格波动提醒
+
+每次导入后把新数据转换为 (品种, 供应商) 的长表，和历史价格做一次关联得到基准价，
+整列计算变化率，超过阈值的记录保存到 SQLite，首页显示最近的提醒。
+
+基准价有两种取法：
+- previous：该品种上一个报价日期的价格（同一日期取最新上传的一条）
+- median：该品种最近 window_weeks 周内各报价日期价格的中位数
+
+阈值按 品种 > 类别 > 默认 的顺序确定。类别用正则表达式匹配品种名称，例如
+{"油": {"match": "油", "threshold": 0.05}}。规则保存在 JSON 文件中，
+所有 worker 进程共用，文件变化后自动重新读取。
+"""
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from lazy_imports import lazy_module
+from locking import atomic_write
+
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+
+BASELINES = ('previous', 'median')
+# 浮点误差容差，避免恰好等于阈值的变化被漏掉
+_EPSILON = 1e-9
+
+
+class AlertRules:
+    """提醒阈值和基准价规则"""
+
+    def __init__(self, path=None, default=0.1, items=None, categories=None,
+                 baseline='previous', window_weeks=4):
+        if baseline not in BASELINES:
+            raise ValueError(f"不支持的基准价：{baseline}，可选：{', '.join(BASELINES)}")
+        self.path = os.path.abspath(path) if path else None
+        self.default = default
+        self.items = dict(items or {})
+        self.categories = dict(categories or {})
+        self.baseline = baseline
+        self.window_weeks = window_weeks
+        self._stat = None
+
+    @classmethod
+    def load(cls, path):
+        """从 JSON 文件读取规则，文件不存在时使用默认规则"""
+        rules = cls(path)
+        rules.refresh()
+        return rules
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def refresh(self):
+        """规则文件被其他进程修改后重新读取"""
+        if self.path is None:
+            return
+        stat = self._file_stat()
+        if stat is None or stat == self._stat:
+            return
+        with open(self.path, encoding='utf-8') as f:
+            loaded = type(self)(self.path, **json.load(f))
+        self.default, self.items, self.categories = loaded.default, loaded.items, loaded.categories
+        self.baseline, self.window_weeks = loaded.baseline, loaded.window_weeks
+        self._stat = stat
+
+    def to_dict(self):
+        return {
+            'default': self.default,
+            'items': self.items,
+            'categories': self.categories,
+            'baseline': self.baseline,
+            'window_weeks': self.window_weeks,
+        }
+
+    def save(self):
+        if self.path is None:
+            return
+        with atomic_write(self.path) as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        self._stat = self._file_stat()
+
+    def thresholds(self, items):
+        """返回与 items 对应的阈值数组"""
+        result = pd.Series(float(self.default), index=items.index)
+        # 先定义的类别优先，所以倒序覆盖
+        for rule in reversed(list(self.categories.values())):
+            result[items.str.contains(rule['match'], regex=True, na=False)] = float(rule['threshold'])
+        if self.items:
+            result = items.map(self.items).astype('float64').fillna(result)
+        return result.to_numpy()
+
+
+def _long_prices(df, price_columns):
+    """转换为 (品种, 价格列, 日期, 价格) 长表，去掉缺失的品种和价格"""
+    long = df.melt(id_vars=['品种', '日期'], value_vars=price_columns,
+                   var_name='价格列', value_name='价格')
+    long = long.dropna(subset=['品种', '日期', '价格'])
+    long['_日期'] = pd.to_datetime(long['日期'], format='%Y-%m-%d')
+    return long
+
+
+def compute_alerts(new_data, history, price_columns, rules):
+    """计算新数据相对于历史基准价的波动，返回超过阈值的记录（DataFrame）
+
+    history 为导入前的数据，按日期、上传时间倒序排列。
+    """
+    columns = ['品种', '供应商', '原价', '新价', '变化率', '变化比例', '变化日期', '日期', '阈值']
+    new = _long_prices(new_data, price_columns).drop_duplicates(['品种', '价格列', '日期'])
+    if new.empty:
+        return pd.DataFrame(columns=columns)
+    # 历史数据先按品种和日期范围筛掉用不到的行，再转换为长表
+    window = pd.Timedelta(weeks=rules.window_weeks)
+    keep = history['日期'] < new['日期'].max()
+    if rules.baseline == 'median':
+        keep &= history['日期'] >= (new['_日期'].min() - window).strftime('%Y-%m-%d')
+    history = history[keep]
+    history = history[history['品种'].isin(new['品种'].unique())]
+    # 倒序排列的历史数据中，每个 (品种, 供应商, 日期) 第一条是最新上传的
+    hist = _long_prices(history, [col for col in price_columns if col in history.columns])
+    hist = hist.drop_duplicates(['品种', '价格列', '日期'])
+    if hist.empty:
+        return pd.DataFrame(columns=columns)
+
+    if rules.baseline == 'previous':
+        base = hist[['品种', '价格列', '_日期', '日期', '价格']].rename(
+            columns={'日期': '基准日期', '价格': '原价'}).sort_values('_日期')
+        merged = pd.merge_asof(new.sort_values('_日期'), base, on='_日期', by=['品种', '价格列'],
+                               allow_exact_matches=False)
+    else:
+        pairs = new[['品种', '价格列', '_日期']].drop_duplicates().merge(
+            hist[['品种', '价格列', '_日期', '价格']], on=['品种', '价格列'], suffixes=('', '_历史'))
+        pairs = pairs[(pairs['_日期_历史'] < pairs['_日期'])
+                      & (pairs['_日期_历史'] >= pairs['_日期'] - window)]
+        medians = pairs.groupby(['品种', '价格列', '_日期'], as_index=False)['价格'].median()
+        merged = new.merge(medians.rename(columns={'价格': '原价'}), on=['品种', '价格列', '_日期'], how='left')
+
+    old = merged['原价'].to_numpy(dtype='float64')
+    new_price = merged['价格'].to_numpy(dtype='float64')
+    # 基准价缺失或为 0 时无法计算变化率，不产生提醒
+    valid = old > 0
+    change = np.full(len(merged), np.nan)
+    np.divide(new_price - old, old, out=change, where=valid)
+    threshold = rules.thresholds(merged['品种'])
+    hit = valid & (np.abs(np.nan_to_num(change)) >= threshold - _EPSILON)
+
+    alerts = merged.loc[hit, ['品种', '价格列', '原价', '价格', '日期']].rename(columns={'价格': '新价'})
+    alerts.insert(1, '供应商', alerts.pop('价格列').str.removesuffix('价'))
+    alerts['变化率'] = change[hit]
+    alerts['变化比例'] = [f'{c:.1%}' for c in change[hit]]
+    if rules.baseline == 'previous':
+        alerts['变化日期'] = [f'从 {start} 到 {end}' for start, end
+                          in zip(merged.loc[hit, '基准日期'], alerts['日期'])]
+    else:
+        alerts['变化日期'] = [f'近 {rules.window_weeks} 周中位数 到 {end}' for end in alerts['日期']]
+    alerts['阈值'] = threshold[hit]
+    return alerts[columns].reset_index(drop=True)
+
+
+class AlertStore:
+    """已产生的价格提醒，保存在 SQLite 中，所有 worker 进程共享"""
+
+    _FIELDS = ['品种', '供应商', '原价', '新价', '变化率', '变化比例', '变化日期', '日期', '阈值']
+
+    def __init__(self, db_path='price_alerts.db'):
+        self.db_path = os.path.abspath(db_path)
+        columns = ', '.join(f'"{name}"' for name in self._FIELDS)
+        with self._connect() as conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS price_alerts ('
+                         f'id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT, {columns})')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_price_alerts_item ON price_alerts ("品种")')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, alerts):
+        """保存一批提醒（DataFrame），返回保存的条数"""
+        if alerts.empty:
+            return 0
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        rows = alerts[self._FIELDS].astype(object).itertuples(index=False, name=None)
+        columns = ', '.join(f'"{name}"' for name in self._FIELDS)
+        placeholders = ', '.join('?' * (len(self._FIELDS) + 1))
+        with self._connect() as conn:
+            conn.executemany(f'INSERT INTO price_alerts (created_at, {columns}) VALUES ({placeholders})',
+                             ((created_at, *row) for row in rows))
+        return len(alerts)
+
+    def recent(self, limit=50, food_item=None):
+        """最近产生的提醒，同一批次内按变化幅度从大到小排列"""
+        where, params = ('WHERE "品种" = ?', (food_item,)) if food_item else ('', ())
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT * FROM price_alerts {where} '
+                                f'ORDER BY created_at DESC, abs("变化率") DESC, id DESC LIMIT ?',
+                                (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM price_alerts')
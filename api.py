@@ -0,0 +1,430 @@
+"""JSON 接口（/api/v1）
+
+提供最新价格、各品种最低报价、品种搜索、品种历史、价格趋势、日期比较、可用日期和供应商列表，
+供下游的成本核算脚本使用。POST /orders/optimize 一次为多份订单按最低价选择供应商，
+/orders 和 /orders/analytics/* 查询订单历史（不含明细）、消耗统计和采购预算，/orders/<编号> 只返回
+当前会话保存的订单的明细，/prices/forecast 为各品种的预测价格。
+/quarantine 列出导入时未通过校验的报价，POST /quarantine/review 审核（导入或拒绝）。
+/uploads 列出导入批次，/uploads/diff 比较两次导入，POST /uploads/<编号>/rollback、restore 回滚和恢复。
+
+通用查询参数：
+- page / per_page：分页，per_page 最大为 MAX_PER_PAGE
+- fields：逗号分隔的字段名，只返回这些字段
+- start_date / end_date：日期范围（YYYY-MM-DD，均包含在内）
+- upload：导入批次编号，/prices/latest 和 /items/<品种>/history 返回该批次导入完成时的数据
+
+列表接口返回 {"data": [...], "page", "per_page", "total", "pages"}，出错时返回
+{"error": 说明} 和对应的状态码。/history/export 按 NDJSON、CSV、Excel 或 Parquet 导出全部历史记录，
+数据分块从存储读取，内存占用不随历史数据量增长。
+
+多站点部署时 /sites/<站点>/api/v1/... 为该站点的接口，其余为默认站点的接口（见 sites.py）。
+"""
+import json
+import math
+from datetime import datetime
+
+from flask import Blueprint, Response, g, jsonify, request, session, stream_with_context
+
+from config import Config
+from exports import EXPORT_FORMATS as FILE_FORMATS, export_response
+from price_store import frame_columns
+from validation import STATUSES as QUARANTINE_STATUSES
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_PER_PAGE = 100
+MAX_PER_PAGE = 1000
+EXPORT_CHUNKSIZE = 10000
+EXPORT_FORMATS = ['ndjson', *FILE_FORMATS]
+MAX_SEARCH_LIMIT = 50
+UPLOAD_FIELDS = ['id', '上传时间', 'rows', 'items', '起始日期', '结束日期', 'active', 'history']
+QUARANTINE_FIELDS = ['id', 'created_at', 'status', 'reviewed_at', '品种', '单位', '日期', '上传时间', '价格', '原因']
+
+
+class ApiError(Exception):
+    """返回给调用方的错误"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(ApiError)
+def handle_api_error(e):
+    return jsonify({'error': e.message}), e.status
+
+
+def _tracker():
+    # 当前请求所属站点的价格跟踪器，由 app.select_site 设置
+    return g.site.tracker
+
+
+def _jsonable(value):
+    """NaN 不是合法的 JSON，逐层转换为 null"""
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _int_arg(name, default, minimum, maximum=None):
+    value = request.args.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ApiError(f'参数 {name} 必须是整数')
+    if value < minimum or (maximum is not None and value > maximum):
+        limit = f'{minimum}~{maximum}' if maximum is not None else f'不小于 {minimum}'
+        raise ApiError(f'参数 {name} 超出范围（{limit}）')
+    return value
+
+
+def _date_arg(name):
+    value = request.args.get(name) or None
+    if value is not None:
+        try:
+            datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise ApiError(f'参数 {name} 必须是 YYYY-MM-DD 格式的日期')
+    return value
+
+
+def _alpha_arg():
+    try:
+        alpha = float(request.args.get('alpha', 0.5))
+    except ValueError:
+        raise ApiError('参数 alpha 必须是数字')
+    if not 0 < alpha <= 1:
+        raise ApiError('参数 alpha 超出范围（0~1）')
+    return alpha
+
+
+def _select_fields(records, available):
+    """按 fields 参数只保留指定字段"""
+    fields = request.args.get('fields')
+    if not fields:
+        return records
+    fields = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ApiError(f"未知字段：{', '.join(unknown)}，可选：{', '.join(available)}")
+    return [{name: record[name] for name in fields} for record in records]
+
+
+def _page(records, available, **extra):
+    """分页并选择字段后返回 JSON 响应"""
+    page = _int_arg('page', 1, 1)
+    per_page = _int_arg('per_page', DEFAULT_PER_PAGE, 1, MAX_PER_PAGE)
+    total = len(records)
+    start = (page - 1) * per_page
+    data = _select_fields(_jsonable(records[start:start + per_page]), available)
+    return jsonify({
+        **extra,
+        'data': data,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': math.ceil(total / per_page),
+    })
+
+
+@api.route('/dates')
+def dates():
+    return jsonify({'data': list(_tracker().get_available_dates())})
+
+
+@api.route('/suppliers')
+def suppliers():
+    return jsonify({'data': _tracker().get_suppliers()})
+
+
+def _upload_arg():
+    """upload 参数，批次不存在时返回 404"""
+    upload = request.args.get('upload') or None
+    if upload is not None and _tracker().get_upload(upload) is None:
+        raise ApiError('未找到该导入批次', 404)
+    return upload
+
+
+@api.route('/prices/latest')
+def latest_prices():
+    tracker = _tracker()
+    upload = _upload_arg()
+    snapshot = tracker.get_snapshot_at(upload) if upload else tracker.get_latest_snapshot()
+    extra = {'upload': upload} if upload else {}
+    if snapshot is None:
+        return _page([], ['品种', '单位', '日期'] + tracker.get_price_columns(), date=None, **extra)
+    return _page(snapshot.rows, ['品种', '单位', '日期'] + snapshot.price_columns, date=snapshot.date, **extra)
+
+
+@api.route('/prices/cheapest')
+def cheapest_prices():
+    """每个品种报价最低的供应商，date 默认为最新日期"""
+    tracker = _tracker()
+    date = _date_arg('date')
+    if date and date not in tracker.get_available_dates():
+        raise ApiError(f'没有 {date} 的价格数据', 404)
+    cheapest = tracker.get_cheapest_suppliers(date)
+    return _page(cheapest.to_dict('records'), list(cheapest.columns),
+                 date=date or next(iter(tracker.get_available_dates()), None))
+
+
+@api.route('/items/search')
+def search_items():
+    """按名称、别名或拼音首字母搜索品种；q 为搜索词，latest=1 时只返回最新一期有报价的品种"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        raise ApiError('缺少参数 q')
+    limit = _int_arg('limit', 10, 1, MAX_SEARCH_LIMIT)
+    latest_only = request.args.get('latest') == '1'
+    return jsonify({'query': query, 'data': _tracker().search_items(query, limit, latest_only=latest_only)})
+
+
+@api.route('/items/<food_item>/history')
+def item_history(food_item):
+    upload = _upload_arg()
+    if upload:
+        history = _tracker().get_price_history_at(food_item, upload)
+    else:
+        history = _tracker().get_price_history(food_item)
+    if history is None:
+        raise ApiError('未找到该食材的价格记录', 404)
+    start_date, end_date = _date_arg('start_date'), _date_arg('end_date')
+    if start_date:
+        history = history[history['日期'] >= start_date]
+    if end_date:
+        history = history[history['日期'] <= end_date]
+    return _page(history.to_dict('records'), list(history.columns), item=food_item)
+
+
+@api.route('/items/<food_item>/trend')
+def item_trend(food_item):
+    """品种价格统计；freq 为 W（按周）或 M（按月），start_date / end_date 限定统计的周期"""
+    tracker = _tracker()
+    trend = tracker.get_item_price_trend(food_item)
+    if trend is None:
+        raise ApiError('未找到该食材的价格记录', 404)
+    freq = request.args.get('freq', 'M')
+    try:
+        periods = tracker.get_price_rollup(food_item, _date_arg('start_date'), _date_arg('end_date'), freq)
+    except ValueError as e:
+        raise ApiError(str(e))
+    trend.pop('历史记录')
+    return jsonify({'data': _jsonable({**trend, 'freq': freq, '周期统计': periods})})
+
+
+@api.route('/prices/forecast')
+def price_forecast():
+    """各品种之后几个周期的预测价格，每个 (品种, 周期) 一条；item 只返回该品种"""
+    tracker = _tracker()
+    food_item = request.args.get('item') or None
+    frame = tracker.get_price_forecast(food_item)
+    if food_item and frame.empty:
+        raise ApiError('未找到该食材的价格记录', 404)
+    return _page(frame.to_dict('records'), list(frame.columns), freq=Config.TIMESERIES_FREQ)
+
+
+@api.route('/compare')
+def compare():
+    tracker = _tracker()
+    start_date = _date_arg('start_date')
+    if not start_date:
+        raise ApiError('缺少参数 start_date')
+    end_date = _date_arg('end_date')
+    available = tracker.get_available_dates()
+    for date in (start_date, end_date):
+        if date and date not in available:
+            raise ApiError(f'没有 {date} 的价格数据', 404)
+    frame = tracker.get_price_comparison_frame(start_date, end_date)
+    return _page(frame.to_dict('records'), list(frame.columns),
+                 start_date=start_date, end_date=end_date or (available[0] if available else None))
+
+
+@api.route('/orders/optimize', methods=['POST'])
+def optimize_orders():
+    """按最新价格为多份订单选择最便宜的供应商
+
+    请求体为 JSON：{"baskets": {订单名称: {品种: 数量}}, "min_order": {供应商: 起订金额},
+    "preferred": 首选供应商, "tolerance": 首选供应商允许高出最低价的比例}，
+    除 baskets 外都可省略。一次请求即可算出所有厨房的订单。
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('baskets'), dict):
+        raise ApiError('请求体必须是包含 baskets 的 JSON 对象')
+    baskets = body['baskets']
+    for name, basket in baskets.items():
+        if not isinstance(basket, dict) or not all(
+                isinstance(qty, (int, float)) and not isinstance(qty, bool) and qty >= 0
+                for qty in basket.values()):
+            raise ApiError(f'订单 {name} 必须是 {{品种: 非负数量}} 的对象')
+    min_order = body.get('min_order') or {}
+    if not isinstance(min_order, dict):
+        raise ApiError('min_order 必须是 {供应商: 金额} 的对象')
+    try:
+        tolerance = float(body.get('tolerance', 0))
+        results = _tracker().optimize_orders(baskets, min_order=min_order,
+                                             preferred=body.get('preferred'), tolerance=tolerance)
+    except (TypeError, ValueError) as e:
+        raise ApiError(str(e))
+    return jsonify({'data': _jsonable(results)})
+
+
+@api.route('/orders')
+def orders():
+    """最近的订单（不含明细），可按 start_date / end_date 过滤"""
+    limit = _int_arg('limit', 50, 1, MAX_PER_PAGE)
+    records = _tracker().orders.recent(limit, _date_arg('start_date'), _date_arg('end_date'))
+    return jsonify({'data': records})
+
+
+@api.route('/orders/<int:order_id>')
+def order_detail(order_id):
+    """订单明细，只能查询当前会话（order_token）保存的订单，其他编号按不存在处理"""
+    last = g.site.order_sessions.get(session.get('order_token'))
+    order = _tracker().get_order(order_id) if last and last[0] == order_id else None
+    if order is None:
+        raise ApiError('未找到该订单', 404)
+    return jsonify({'data': order})
+
+
+@api.route('/orders/analytics/top')
+def top_spend_items():
+    """花费最多的品种，start_date / end_date 按所在周限定范围"""
+    records = _tracker().get_top_spend_items(_int_arg('limit', 10, 1, MAX_PER_PAGE),
+                                             _date_arg('start_date'), _date_arg('end_date'))
+    return jsonify({'data': records})
+
+
+@api.route('/orders/analytics/attribution')
+def spend_attribution():
+    """基期（base_start~base_end）到本期（start_date~end_date）花费变化的价格和数量归因"""
+    dates = [_date_arg(name) for name in ('base_start', 'base_end', 'start_date', 'end_date')]
+    if not all(dates):
+        raise ApiError('缺少参数 base_start、base_end、start_date 或 end_date')
+    frame = _tracker().get_spend_attribution(*dates)
+    return _page(frame.to_dict('records'), list(frame.columns))
+
+
+@api.route('/orders/analytics/forecast')
+def consumption_forecast():
+    """按最近 weeks 周的订购量预测下一周的消耗量，alpha 为平滑系数"""
+    frame = _tracker().get_consumption_forecast(_int_arg('weeks', 8, 1, 520), _alpha_arg(),
+                                                request.args.get('item') or None)
+    return _page(frame.to_dict('records'), list(frame.columns))
+
+
+@api.route('/orders/analytics/budget')
+def budget_forecast():
+    """下一周的采购预算：预测消耗量 × 最低的预测价格；total_amount 为有价格预测的品种的合计"""
+    frame = _tracker().get_budget_forecast(_int_arg('weeks', 8, 1, 520), _alpha_arg())
+    return _page(frame.to_dict('records'), list(frame.columns), total_amount=float(frame['预测金额'].sum()))
+
+
+@api.route('/quarantine')
+def quarantine():
+    """导入时未通过校验的报价，status 为 pending（默认）、approved、rejected 或 all"""
+    status = request.args.get('status', 'pending')
+    if status not in QUARANTINE_STATUSES + ('all',):
+        raise ApiError(f"参数 status 必须是 {'、'.join(QUARANTINE_STATUSES + ('all',))} 之一")
+    records = _tracker().get_quarantine(None if status == 'all' else status)
+    return _page(records, QUARANTINE_FIELDS, status=status)
+
+
+@api.route('/quarantine/review', methods=['POST'])
+def review_quarantine():
+    """审核隔离的报价
+
+    请求体为 JSON：{"ids": [编号], "action": "approve" 或 "reject", "corrections": {编号: {价格列: 价格}}}。
+    approve 把这些行导入价格数据，corrections 可省略，用于导入前修改价格；价格文本无法识别的行
+    必须在 corrections 中给出价格，否则返回 400，整批都不导入。已审核过的编号忽略。
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('ids'), list) or not all(
+            isinstance(item, int) and not isinstance(item, bool) for item in body['ids']):
+        raise ApiError('请求体必须是包含 ids（编号列表）的 JSON 对象')
+    action = body.get('action')
+    if action not in ('approve', 'reject'):
+        raise ApiError('action 必须是 approve 或 reject')
+    corrections = body.get('corrections') or {}
+    if not isinstance(corrections, dict) or not all(isinstance(value, dict) for value in corrections.values()):
+        raise ApiError('corrections 必须是 {编号: {价格列: 价格}} 的对象')
+    try:
+        reviewed, rows = _tracker().review_quarantine(body['ids'], action == 'approve', corrections)
+    except (TypeError, ValueError) as e:
+        raise ApiError(str(e))
+    return jsonify({'reviewed': reviewed, 'imported_rows': rows})
+
+
+@api.route('/uploads')
+def uploads():
+    """导入批次，最近的在前；active 为 false 的批次已回滚"""
+    return _page(_tracker().list_uploads(), UPLOAD_FIELDS)
+
+
+@api.route('/uploads/diff')
+def diff_uploads():
+    """比较两次导入（from 为较早的批次，to 为较晚的批次），每个品种一行"""
+    old, new = request.args.get('from'), request.args.get('to')
+    if not old or not new:
+        raise ApiError('缺少参数 from 或 to')
+    try:
+        frame = _tracker().diff_uploads(old, new)
+    except KeyError as e:
+        raise ApiError(e.args[0], 404)
+    return _page(frame.to_dict('records'), list(frame.columns), **{'from': old, 'to': new})
+
+
+@api.route('/uploads/<upload_id>/rollback', methods=['POST'])
+def rollback_upload(upload_id):
+    """回滚到该批次导入完成时的状态，之后的批次可以再恢复"""
+    tracker = _tracker()
+    if tracker.get_upload(upload_id) is None:
+        raise ApiError('未找到该导入批次', 404)
+    success, message = tracker.rollback_upload(upload_id)
+    if not success:
+        raise ApiError(message, 500)
+    return jsonify({'message': message})
+
+
+@api.route('/uploads/<upload_id>/restore', methods=['POST'])
+def restore_upload(upload_id):
+    """恢复已回滚的批次"""
+    tracker = _tracker()
+    if tracker.get_upload(upload_id) is None:
+        raise ApiError('未找到该导入批次', 404)
+    success, message = tracker.restore_upload(upload_id)
+    if not success:
+        raise ApiError(message, 500)
+    return jsonify({'message': message})
+
+
+@api.route('/history/export')
+def export_history():
+    """流式导出历史记录，format 为 ndjson（默认）、csv、xlsx 或 parquet，可按 item 和日期范围过滤"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        raise ApiError(f"不支持的导出格式：{fmt}，可选：{', '.join(EXPORT_FORMATS)}")
+    tracker = _tracker()
+    # 较早写入的数据块中可能没有后来新增的供应商列，统一按全部列输出
+    price_columns = tracker.get_price_columns()
+    columns = frame_columns(price_columns)
+    chunks = tracker.iter_price_history(food_item=request.args.get('item') or None,
+                                        start_date=_date_arg('start_date'),
+                                        end_date=_date_arg('end_date'),
+                                        chunksize=EXPORT_CHUNKSIZE)
+    if fmt != 'ndjson':
+        return export_response('price_history', fmt, columns, chunks, number_columns=price_columns,
+                               sheet_name='价格历史')
+
+    def generate():
+        for chunk in chunks:
+            yield ''.join(json.dumps(record, ensure_ascii=False) + '\n'
+                          for record in _jsonable(chunk.reindex(columns=columns).to_dict('records')))
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename=price_history.ndjson'
+    return response
@@ -1,16 +1,28 @@
-from flask import Flask, render_template, request, flash, redirect, url_for, session, send_file
-from food_price_tracker import FoodPriceTracker
+from flask import Flask, render_template, request, flash, redirect, url_for, session, jsonify, g, abort
+from werkzeug.local import LocalProxy
+from api import api
+from http_cache import PageCache
+import instrumentation
+from exports import EXPORT_FORMATS, export_response, frame_chunks
+from price_store import frame_columns, supplier_name
+from sites import ENVIRON_KEY as SITE_ENVIRON_KEY, SiteDispatcher, SiteRegistry
+from config import Config
 from werkzeug.utils import secure_filename
 import os
-import pandas as pd
-from io import BytesIO
-import xlsxwriter
+import time
+import uuid
+from datetime import datetime
+from lazy_imports import lazy_module
+
+pd = lazy_module('pandas')
+
+instrumentation.configure_logging(Config.LOG_LEVEL, Config.LOG_FORMAT)
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'  # 用于flash消息
 
 # 配置上传文件的存储路径
-UPLOAD_FOLDER = 'uploads'
+UPLOAD_FOLDER = Config.UPLOAD_FOLDER
 ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
 
 if not os.path.exists(UPLOAD_FOLDER):
@@ -21,25 +33,71 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-tracker = FoodPriceTracker()
+# 各站点（食堂）的组件在第一次收到该站点的请求时创建，/sites/<站点>/ 前缀由 SiteDispatcher 处理
+sites = SiteRegistry.from_config(Config)
+app.wsgi_app = SiteDispatcher(app.wsgi_app)
+# 当前请求所属站点的价格跟踪器、导入队列和下单会话
+tracker = LocalProxy(lambda: g.site.tracker)
+job_queue = LocalProxy(lambda: g.site.job_queue)
+order_sessions = LocalProxy(lambda: g.site.order_sessions)
+app.register_blueprint(api)
+
+@app.before_request
+def select_site():
+    name = request.environ.get(SITE_ENVIRON_KEY, sites.default)
+    if name not in sites:
+        abort(404)
+    g.site = sites.get(name)
+
+# 页面按站点和数据版本缓存，导入或清空数据后自动失效
+page_cache = PageCache(lambda: tracker.version.current(), scope=lambda: g.site.name,
+                       max_entries=Config.PAGE_CACHE_ENTRIES,
+                       max_bytes=Config.PAGE_CACHE_BYTES)
+page_cache.init_app(app)
+# 请求耗时、/metrics 和按需的请求分析
+instrumentation.init_app(app, profiling=Config.PROFILING, profile_dir=Config.PROFILE_DIR)
+instrumentation.register_page_cache(page_cache.cache)
+
+def warm_up():
+    """启动时预热：加载各价格来源的数据、建立缓存并编译页面模板，返回各步骤的耗时（毫秒）
+
+    gunicorn 的 preload_app 在主进程中调用（见 gunicorn.conf.py），waitress 在开始服务之前调用。
+    """
+    timings = sites.warm_up()
+    start = time.perf_counter()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    timings['templates'] = (time.perf_counter() - start) * 1000
+    return timings
+
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json' or request.args.get('format') == 'json'
 
 @app.route('/')
+@page_cache.cached(vary=lambda: repr((job_queue.recent(), tracker.quarantine.pending_count())))
 def index():
     try:
-        # 获取最新价格数据
-        latest_prices = tracker.get_latest_prices()
+        # 获取最新价格快照
+        snapshot = tracker.get_latest_snapshot()
+        latest_prices = snapshot.rows if snapshot is not None else None
         
         # 获取所有可用日期
         dates = tracker.get_available_dates()
         
         return render_template('index.html', 
                              latest_prices=latest_prices,
-                             dates=dates)
+                             price_columns=snapshot.price_columns if snapshot is not None else [],
+                             dates=dates,
+                             price_alerts=tracker.get_price_alerts(limit=20),
+                             quarantine=tracker.get_quarantine(limit=20),
+                             quarantine_count=tracker.quarantine.pending_count(),
+                             import_jobs=job_queue.recent())
     except Exception as e:
         flash(f'读取数据时出错：{str(e)}')
         return render_template('index.html', 
                              latest_prices=None,
-                             dates=[])
+                             dates=[],
+                             import_jobs=[])
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -54,26 +112,27 @@ def upload_file():
     
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        # 加上随机前缀，避免同名文件在导入完成前被覆盖
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f'{uuid.uuid4().hex[:8]}_{filename}')
         file.save(filepath)
         
-        # 导入数据
-        try:
-            success, message = tracker.import_from_excel(filepath)  # 获取返回的状态和消息
-            if success:
-                flash('数据导入成功！')
-            else:
-                flash(f'导入数据失败：{message}')
-        except Exception as e:
-            flash(f'导入数据时出错：{str(e)}')
-        finally:
-            # 删除上传的文件
-            if os.path.exists(filepath):
-                os.remove(filepath)
+        # 交给后台任务导入，上传的文件在任务结束后删除
+        job_id = job_queue.submit(filepath, filename=file.filename, date=request.form.get('date') or None)
+        if wants_json():
+            return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+        flash(f'文件已上传，正在后台导入（任务编号：{job_id}）')
     
     return redirect(url_for('index'))
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job)
+
 @app.route('/history/<food_item>')
+@page_cache.cached()
 def price_history(food_item):
     history = tracker.get_price_history(food_item)
     if isinstance(history, str):
@@ -82,9 +141,11 @@ def price_history(food_item):
     
     return render_template('history.html', 
                          food_item=food_item,
-                         history=history)
+                         history=history,
+                         price_columns=tracker.get_price_columns())
 
 @app.route('/compare')
+@page_cache.cached()
 def compare_prices():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -98,153 +159,206 @@ def compare_prices():
     
     return render_template('comparison.html',
                          comparison=comparison,
+                         price_columns=tracker.get_price_columns(),
                          start_date=start_date,
                          end_date=end_date or dates[0],
                          dates=dates)
 
 @app.route('/trend/<food_item>')
+@page_cache.cached()
 def price_trend(food_item):
     trend_data = tracker.get_item_price_trend(food_item)
     if trend_data is None:
         flash('未找到该食材的价格记录')
         return redirect(url_for('index'))
     
-    return render_template('trend.html', data=trend_data)
+    return render_template('trend.html', data=trend_data, price_columns=tracker.get_price_columns())
 
 @app.route('/clear_data', methods=['POST'])
 def clear_data():
     try:
         success, message = tracker.clear_price_data()
         if success:
-            flash('数据已成功清空')
+            flash(message)
         else:
             flash(f'清空数据失败：{message}')
     except Exception as e:
         flash(f'清空数据时出错：{str(e)}')
     return redirect(url_for('index'))
 
+def _order_token():
+    """当前浏览器的下单会话令牌，cookie 中只保存这个令牌"""
+    if 'order_token' not in session:
+        session['order_token'] = order_sessions.new_token()
+    return session['order_token']
+
+def _last_order_items():
+    """当前会话上次订单的品种和数量，用于“加载上次订单”"""
+    last = order_sessions.get(session.get('order_token'))
+    if last is None:
+        return None
+    return [{'品种': name, '数量': qty} for name, qty in last[1].items()]
+
+# 下单计算中“按最低价拆单”对应的 supplier 参数值
+CHEAPEST = '最低价'
+
+def _display_price(row, price_columns, supplier):
+    """下单页面显示的单价：指定供应商的价格，按最低价拆单时为各供应商的最低报价"""
+    if supplier != CHEAPEST:
+        return row[f'{supplier}价']
+    quoted = [row[col] for col in price_columns if row[col] > 0]
+    return min(quoted) if quoted else None
+
+def _order_supplier(suppliers):
+    """按哪个供应商的价格下单，默认为配置中的供应商；选择“最低价”时每个品种按报价最低的供应商下单"""
+    supplier = request.values.get('supplier', Config.ORDER_SUPPLIER)
+    if supplier != CHEAPEST and supplier not in suppliers:
+        supplier = suppliers[0]
+    return supplier
+
+def _item_option(row, price_columns, supplier):
+    """下单页面品种下拉框的一个选项（Select2 的数据格式）"""
+    price = _display_price(row, price_columns, supplier)
+    return {'id': row['品种'], 'text': row['品种'], 'unit': row['单位'],
+            'price': None if pd.isna(price) else price}
+
+def _last_order_options(snapshot, supplier):
+    """上次订单中最新一期仍有报价的品种，附带下拉框选项；品种下拉框通过 /items/search 联想搜索，
+    页面中只带上次订单用到的品种"""
+    last_order = _last_order_items() or []
+    for item in last_order:
+        row = snapshot.lookup(item['品种'])
+        item['option'] = row and _item_option(row, snapshot.price_columns, supplier)
+    return [item for item in last_order if item['option']]
+
+@app.route('/items/search')
+def search_items():
+    """下单页面的品种联想搜索，只返回最新一期有报价的品种"""
+    snapshot = tracker.get_latest_snapshot()
+    query = request.args.get('q', '').strip()
+    if snapshot is None or not query:
+        return jsonify({'results': []})
+    supplier = _order_supplier([supplier_name(col) for col in snapshot.price_columns])
+    matches = tracker.search_items(query, limit=20, latest_only=True)
+    return jsonify({'results': [_item_option(snapshot.lookup(match['品种']), snapshot.price_columns, supplier)
+                                for match in matches]})
+
 @app.route('/order', methods=['GET', 'POST'])
 def order_calculator():
-    # 获取最新价格数据
-    items = tracker.get_latest_prices()
-    if items is None:
+    # 获取最新价格快照
+    snapshot = tracker.get_latest_snapshot()
+    if snapshot is None:
         flash('没有可用的价格数据')
         return redirect(url_for('index'))
     
+    suppliers = [supplier_name(col) for col in snapshot.price_columns]
+    supplier = _order_supplier(suppliers)
+    # 首选供应商：价格不高于最低价的 (1 + tolerance) 倍时优先选它
+    preferred = request.values.get('preferred') or None
+    if preferred not in suppliers:
+        preferred = None
+    tolerance = request.values.get('tolerance', 0, type=float)
+    context = dict(supplier=supplier, suppliers=suppliers,
+                   cheapest=CHEAPEST, preferred=preferred, tolerance=tolerance)
+    
     if request.method == 'POST':
-        total = 0
-        order_items = []
-        
+        quantities = {}
         for key, value in request.form.items():
             if key.startswith('quantity_'):
                 food_name = key.replace('quantity_', '')
                 try:
-                    quantity = float(value)
-                    price_series = items.loc[items['品种'] == food_name, '康瑞达价']
-                    if price_series.empty:
-                        flash(f'未找到商品 {food_name} 的价格信息')
-                        continue
-                    
-                    price = float(price_series.iloc[0])
-                    subtotal = quantity * price
-                    total += subtotal
-                    
-                    order_items.append({
-                        '品种': food_name,
-                        '数量': quantity,
-                        '单位': items.loc[items['品种'] == food_name, '单位'].iloc[0],
-                        '单价': price,
-                        '小计': subtotal
-                    })
-                except (ValueError, TypeError) as e:
+                    quantities[food_name] = float(value)
+                except (ValueError, TypeError):
                     flash(f'计算错误：{food_name} 的数量或价格格式不正确')
                     return redirect(url_for('order_calculator'))
         
-        # 保存订单信息到 session
-        session['last_order'] = order_items
+        if supplier == CHEAPEST:
+            # 按最低价拆单，只对当前数据中有的供应商应用起订金额
+            min_order = {name: amount for name, amount in Config.SUPPLIER_MIN_ORDER.items() if name in suppliers}
+            result = tracker.optimize_orders({'订单': quantities}, min_order=min_order,
+                                             preferred=preferred, tolerance=tolerance)['订单']
+            order_items, total, missing = result['items'], result['total'], result['missing']
+            for name in result['below_minimum']:
+                flash(f'{name} 的订单金额未达到起订金额 {min_order[name]}')
+            context['optimization'] = result
+        else:
+            # 按所选供应商的价格一次算出整张订单
+            order_items, total, missing = snapshot.price_order(quantities, f'{supplier}价')
+        for food_name in missing:
+            flash(f'未找到商品 {food_name} 的价格信息')
+        
+        # 记入订单历史，用于消耗统计；会话中只保存订单编号和各品种数量
+        order_id = None
+        if order_items:
+            order_id = tracker.save_order(order_items, total, supplier=None if supplier == CHEAPEST else supplier)
+            if order_id is None:
+                flash('保存订单失败')
+        order_sessions.put(_order_token(), order_id, quantities)
         
         # 渲染结果页面，显示订单细和总价
         return render_template('order.html', 
-                             items=items, 
                              total=total, 
+                             order_id=order_id,
                              order_items=order_items,
-                             last_order=session.get('last_order'))
+                             last_order=_last_order_options(snapshot, supplier),
+                             **context)
     
     # GET 请求时渲染订单页面
     return render_template('order.html', 
-                         items=items,
-                         last_order=session.get('last_order'),
-                         order_items=[])  # 添加空的 order_items 列表
+                         last_order=_last_order_options(snapshot, supplier),
+                         order_items=[],  # 添加空的 order_items 列表
+                         **context)
 
 @app.route('/export_order')
 def export_order():
-    # 从 session 获取订单数据
-    order_items = session.get('last_order', [])
-    if not order_items:
+    # 只能导出当前会话保存的上次订单
+    last = order_sessions.get(session.get('order_token'))
+    order_id = last[0] if last else None
+    order = tracker.get_order(order_id) if order_id is not None else None
+    if not order or not order['items']:
         flash('没有可导出的订单数据')
         return redirect(url_for('order_calculator'))
     
-    # 创建一个内存中的 Excel 文件
-    output = BytesIO()
-    workbook = xlsxwriter.Workbook(output)
-    worksheet = workbook.add_worksheet('订单明细')
-    
-    # 添加标题样式
-    header_format = workbook.add_format({
-        'bold': True,
-        'align': 'center',
-        'valign': 'vcenter',
-        'bg_color': '#D9EAD3'
-    })
-    
-    # 写入表头
-    headers = ['品种', '数量', '单位', '单价', '小计']
-    for col, header in enumerate(headers):
-        worksheet.write(0, col, header, header_format)
-    
-    # 写入数据
-    for row, item in enumerate(order_items, start=1):
-        worksheet.write(row, 0, item['品种'])
-        worksheet.write(row, 1, item['数量'])
-        worksheet.write(row, 2, item['单位'])
-        worksheet.write(row, 3, item['单价'])
-        worksheet.write(row, 4, item['小计'])
-    
-    # 计算总计
-    total = sum(item['小计'] for item in order_items)
-    total_row = len(order_items) + 1
-    
-    # 添加总计行
-    bold_format = workbook.add_format({'bold': True})
-    worksheet.write(total_row, 3, '总计：', bold_format)
-    worksheet.write(total_row, 4, total, bold_format)
-    
-    # 设置列宽
-    worksheet.set_column('A:A', 20)  # 品种列宽
-    worksheet.set_column('B:B', 10)  # 数量列宽
-    worksheet.set_column('C:C', 8)   # 单位列宽
-    worksheet.set_column('D:E', 12)  # 单价和小计列宽
-    
-    # 设置数字格式
-    number_format = workbook.add_format({'num_format': '#,##0.00'})
-    worksheet.set_column('B:B', 10, number_format)  # 数量列使用数字格式
-    worksheet.set_column('D:E', 12, number_format)  # 单价和小计列使用数字格式
-    
-    workbook.close()
-    
-    # 将指针移到文件开头
-    output.seek(0)
-    
-    # 生成下载文件名（使用当前时间）
-    from datetime import datetime
-    filename = f"订单明细_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    columns = ['品种', '数量', '单位', '供应商', '单价', '小计']
+    return _export(f"订单明细_{order_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                   columns, frame_chunks(pd.DataFrame(order['items'], columns=columns)),
+                   number_columns=['数量', '单价', '小计'], sheet_name='订单明细',
+                   widths={'品种': 20, '数量': 10, '单位': 8, '供应商': 10},
+                   footer=[None, None, None, None, '总计：', order['total']])
+
+@app.route('/export/compare')
+def export_comparison():
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date') or None
+    if not start_date:
+        flash('请选择起始日期')
+        return redirect(url_for('index'))
     
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=filename
-    )
+    frame = tracker.get_price_comparison_frame(start_date, end_date)
+    price_columns = tracker.get_price_columns()
+    numbers = [f'{col}_{suffix}' for col in price_columns for suffix in ('起', '终', '变化率', '预测', '波动率')]
+    return _export(f"价格比较_{start_date}_{end_date or '最新'}", list(frame.columns), frame_chunks(frame),
+                   number_columns=numbers, sheet_name='价格比较', widths={'品种': 20, '单位': 8})
+
+@app.route('/export/history')
+def export_history():
+    # 不指定 item 时导出全部历史记录，数据分块从存储读取
+    food_item = request.args.get('item') or None
+    price_columns = tracker.get_price_columns()
+    columns = frame_columns(price_columns)
+    chunks = tracker.iter_price_history(food_item=food_item,
+                                        start_date=request.args.get('start_date') or None,
+                                        end_date=request.args.get('end_date') or None)
+    return _export(f"价格历史_{food_item or '全部'}", columns, chunks, number_columns=price_columns,
+                   sheet_name='价格历史', widths={'品种': 20, '单位': 8, '上传时间': 20})
+
+def _export(filename, columns, chunks, **options):
+    """按 format 参数（xlsx / csv / parquet，默认 xlsx）导出"""
+    fmt = request.args.get('format', 'xlsx')
+    if fmt not in EXPORT_FORMATS:
+        flash(f"不支持的导出格式：{fmt}，可选：{', '.join(EXPORT_FORMATS)}")
+        return redirect(url_for('index'))
+    return export_response(filename, fmt, columns, chunks, **options)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
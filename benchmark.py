@@ -0,0 +1,394 @@
+"""性能基准测试
+
+生成指定规模的模拟价格历史，在临时目录中：
+- 逐个调用 FoodPriceTracker 的方法（导入、最新价格、历史、趋势、比较、下单计算、订单保存和读取），
+  记录首次调用（缓存未建立）和重复调用的耗时，以及单次调用的内存峰值
+- 用 Flask 测试客户端请求各个页面和接口，统计延迟的百分位数
+- 启动耗时：在新的 Python 进程中导入应用、预热缓存和处理第一个请求的耗时，
+  以及不预热时第一个请求的耗时
+
+结果以 JSON 输出，可以和阈值文件或上一次的结果比较，超出时返回非 0 退出码，用于发现性能退化。
+
+    python benchmark.py --rows 10000 100000 --output bench.json
+    python benchmark.py --rows 100000 --thresholds bench_thresholds.json
+    python benchmark.py --rows 100000 --baseline bench.json --tolerance 0.3
+
+阈值文件为 {"<规模>.<分组>.<名称>.<指标>": 上限}，例如
+{"100000.tracker.get_latest_snapshot.median_ms": 5, "100000.routes.index.p90_ms": 50,
+ "100000.startup.import_app.median_ms": 300}。
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+# 与上一次结果比较的指标（百分位数在重复次数少时波动大）
+BASELINE_METRICS = ('median_ms', 'cold_ms', 'peak_mb')
+UNITS = ['斤', '公斤', '箱', '袋', '瓶', '元/公斤']
+
+
+def generate_history(rows, items=None, suppliers=('菜篮子', '康瑞达'), dates=None, missing=0.1, seed=0):
+    """生成模拟价格历史（DataFrame，列与存储中的价格数据相同）
+
+    items 和 dates 只给一个时按 rows 推算另一个，都不给时按每期 2000 个品种推算。
+    每个品种有一个基础价格，各供应商在此基础上按周随机波动；missing 为缺少报价的比例。
+    """
+    rng = np.random.default_rng(seed)
+    if items is None:
+        items = min(rows, 2000) if dates is None else -(-rows // dates)
+    if dates is None:
+        dates = -(-rows // items)
+    names = np.array([f'品种{i:05d}' for i in range(items)])
+    units = rng.choice(UNITS, items)
+    days = [(date(2020, 1, 6) + timedelta(weeks=k)).strftime('%Y-%m-%d') for k in range(dates)]
+
+    # 每期报价的品种集合相同，多出的行从最后一期截掉
+    item_idx = np.tile(np.arange(items), dates)[:rows]
+    date_idx = np.repeat(np.arange(dates), items)[:rows]
+    base = rng.uniform(2, 80, items)
+    frame = {'品种': names[item_idx], '单位': units[item_idx]}
+    for supplier in suppliers:
+        walk = np.cumsum(rng.normal(0, 0.02, (dates, items)), axis=0)
+        prices = np.round(base * np.exp(walk) * rng.uniform(0.9, 1.1, items), 2)[date_idx, item_idx]
+        prices[rng.random(rows) < missing] = np.nan
+        frame[f'{supplier}价'] = prices
+    frame['日期'] = np.array(days)[date_idx]
+    frame['上传时间'] = np.char.add(np.array(days)[date_idx], ' 08:00:00')
+    return pd.DataFrame(frame)
+
+
+def _stats(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        'median_ms': float(np.median(samples)),
+        'p90_ms': float(np.percentile(samples, 90)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'max_ms': float(samples.max()),
+    }
+
+
+def _time(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _peak_mb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上单位为字节，Linux 上为 KB
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def bench_tracker(tracker, history, repeat, memory=True):
+    """各方法的耗时：cold 为清空缓存后的第一次调用，其余为重复调用的统计"""
+    dates = sorted(history['日期'].unique())
+    items = history['品种'].unique()
+    item = items[len(items) // 2]
+    basket = {name: 1.5 for name in items[:50]}
+    baskets = {f'厨房{k}': basket for k in range(20)}
+    # 新一期数据：最后一期的品种，价格整体上调，日期为下一周
+    batch = history[history['日期'] == dates[-1]].copy()
+    next_date = (pd.Timestamp(dates[-1]) + pd.Timedelta(weeks=1)).strftime('%Y-%m-%d')
+    batch['日期'] = next_date
+    price_columns = [col for col in batch.columns if col.endswith('价')]
+    batch[price_columns] = batch[price_columns] * 1.05
+    batch = batch.drop(columns='上传时间')
+
+    snapshot = tracker.get_latest_snapshot()
+    order_items, total, _ = snapshot.price_order(basket, snapshot.price_columns[0])
+    order_id = tracker.save_order(order_items, total)
+    methods = {
+        'get_latest_snapshot': tracker.get_latest_snapshot,
+        'get_latest_prices': tracker.get_latest_prices,
+        'get_available_dates': tracker.get_available_dates,
+        'get_price_history': lambda: tracker.get_price_history(item),
+        'get_item_price_trend': lambda: tracker.get_item_price_trend(item),
+        'get_price_rollup': lambda: tracker.get_price_rollup(item, freq='M'),
+        'get_price_comparison_frame': lambda: tracker.get_price_comparison_frame(dates[0], dates[-1]),
+        'get_cheapest_suppliers': tracker.get_cheapest_suppliers,
+        'price_order': lambda: tracker.get_latest_snapshot().price_order(basket, snapshot.price_columns[0]),
+        'optimize_orders': lambda: tracker.optimize_orders(baskets),
+        'save_order': lambda: tracker.save_order(order_items, total),
+        'get_last_order': tracker.get_last_order,
+        'get_order': lambda: tracker.get_order(order_id),
+    }
+
+    results = {}
+    # 冷启动：丢弃内存缓存，第一次调用包括从存储读取和建立缓存
+    tracker.store.invalidate()
+    start = time.perf_counter()
+    tracker.store.get_frame()
+    results['load'] = {'cold_ms': (time.perf_counter() - start) * 1000}
+    for name, func in methods.items():
+        tracker.store.invalidate()
+        tracker.store.get_frame()
+        start = time.perf_counter()
+        func()
+        cold = (time.perf_counter() - start) * 1000
+        results[name] = {'cold_ms': cold, **_stats(_time(func, repeat))}
+        if memory:
+            tracker.store.invalidate()
+            tracker.store.get_frame()
+            results[name]['peak_mb'] = _peak_mb(func)
+
+    # 导入会改变数据，放在最后，只计时一次
+    start = time.perf_counter()
+    tracker.import_frames([batch])
+    results['import_frames'] = {'cold_ms': (time.perf_counter() - start) * 1000, 'rows': len(batch)}
+    start = time.perf_counter()
+    tracker.get_latest_snapshot()
+    results['get_latest_snapshot_after_import'] = {'cold_ms': (time.perf_counter() - start) * 1000}
+    return results
+
+
+def bench_routes(app, tracker, repeat):
+    """各页面和接口的延迟；第一次请求单独记录为 cold_ms"""
+    client = app.test_client()
+    dates = tracker.get_available_dates()
+    snapshot = tracker.get_latest_snapshot()
+    items = snapshot.items
+    rng = np.random.default_rng(1)
+    picks = [items[i] for i in rng.integers(0, len(items), repeat)]
+    order_form = {f'quantity_{name}': '2' for name in items[:30]}
+    routes = {
+        'index': lambda i: client.get('/'),
+        'history': lambda i: client.get(f'/history/{picks[i]}'),
+        'trend': lambda i: client.get(f'/trend/{picks[i]}'),
+        'compare': lambda i: client.get(f'/compare?start_date={dates[-1]}&end_date={dates[0]}'),
+        'order_page': lambda i: client.get('/order'),
+        'order_submit': lambda i: client.post('/order', data=order_form),
+        'order_submit_cheapest': lambda i: client.post('/order', data={**order_form, 'supplier': '最低价'}),
+        'api_latest': lambda i: client.get('/api/v1/prices/latest?per_page=1000'),
+        'api_cheapest': lambda i: client.get('/api/v1/prices/cheapest'),
+        'api_item_history': lambda i: client.get(f'/api/v1/items/{picks[i]}/history'),
+        'api_item_trend': lambda i: client.get(f'/api/v1/items/{picks[i]}/trend'),
+    }
+    results = {}
+    for name, request in routes.items():
+        start = time.perf_counter()
+        response = request(0)
+        cold = (time.perf_counter() - start) * 1000
+        samples = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            response = request(i)
+            response.get_data()
+            samples.append(time.perf_counter() - start)
+        results[name] = {'status': response.status_code, 'cold_ms': cold, **_stats(samples)}
+
+    # 全部历史的流式导出，只请求一次
+    start = time.perf_counter()
+    response = client.get('/api/v1/history/export?format=csv')
+    size = sum(len(chunk) for chunk in response.response)
+    results['api_export_csv'] = {'status': response.status_code, 'cold_ms': (time.perf_counter() - start) * 1000,
+                                 'bytes': size}
+    return results
+
+
+# 在新进程中运行，输出各阶段耗时（秒）的 JSON
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app as web
+imported = time.perf_counter()
+if sys.argv[1] == 'warm':
+    web.warm_up()
+warmed = time.perf_counter()
+web.app.test_client().get('/api/v1/prices/latest').get_data()
+done = time.perf_counter()
+print(json.dumps({'import': imported - start, 'warm_up': warmed - imported, 'first_request': done - warmed}))
+"""
+
+
+def bench_startup(storage, repeat):
+    """在当前目录的数据上，用新的 Python 进程测量启动各阶段的耗时
+
+    import_app：导入应用（pandas 等按需导入，不计在内）；warm_up：预热缓存和模板；
+    first_request：预热后的第一个请求；first_request_cold：不预热时的第一个请求。
+    """
+    env = dict(os.environ, PRICE_STORAGE=storage,
+               PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                         os.environ.get('PYTHONPATH')])))
+    samples = {'import_app': [], 'warm_up': [], 'first_request': [], 'first_request_cold': [], 'process': []}
+    for _ in range(repeat):
+        for mode in ('warm', 'cold'):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', _STARTUP_SCRIPT, mode], env=env, check=True,
+                                    capture_output=True, text=True).stdout
+            elapsed = time.perf_counter() - start
+            timings = json.loads(output.strip().splitlines()[-1])
+            if mode == 'warm':
+                samples['import_app'].append(timings['import'])
+                samples['warm_up'].append(timings['warm_up'])
+                samples['first_request'].append(timings['first_request'])
+                samples['process'].append(elapsed)
+            else:
+                samples['first_request_cold'].append(timings['first_request'])
+    return {name: _stats(values) for name, values in samples.items()}
+
+
+def run(rows, items=None, suppliers=('菜篮子', '康瑞达'), dates=None, storage='csv', repeat=20, memory=True,
+        startup_repeat=5):
+    """在临时目录中生成数据并运行一轮基准测试，返回结果字典"""
+    from storage import create_storage
+
+    workdir = tempfile.mkdtemp(prefix='food_price_bench_')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        start = time.perf_counter()
+        history = generate_history(rows, items, suppliers, dates)
+        generated = time.perf_counter() - start
+        backend = create_storage(storage)
+        start = time.perf_counter()
+        with backend.lock:
+            backend.append(history)
+        seeded = time.perf_counter() - start
+        # 启动耗时在新进程中测量，放在本进程导入应用之前，不受本进程状态影响
+        startup = bench_startup(storage, startup_repeat) if startup_repeat else {}
+
+        # 应用模块只导入一次，之后每轮换成指向当前临时目录的站点配置，组件在第一个请求时创建
+        import app as web
+        from sites import SiteRegistry
+
+        web.sites = SiteRegistry(data_dir=workdir, storage_kind=storage)
+        web.page_cache.cache.clear()
+        tracker = web.sites.get(web.sites.default).tracker
+
+        result = {
+            'meta': {
+                'rows': len(history),
+                'items': int(history['品种'].nunique()),
+                'dates': int(history['日期'].nunique()),
+                'suppliers': list(suppliers),
+                'storage': storage,
+                'generate_ms': generated * 1000,
+                'seed_storage_ms': seeded * 1000,
+            },
+            'tracker': bench_tracker(tracker, history, repeat, memory),
+            'routes': bench_routes(web.app, tracker, repeat),
+            'startup': startup,
+            'max_rss_mb': _max_rss_mb(),
+        }
+        return result
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _flatten(results):
+    """{规模: 结果} 展开为 {"<规模>.<分组>.<名称>.<指标>": 数值}"""
+    flat = {}
+    for size, result in results.items():
+        for group in ('tracker', 'routes', 'startup'):
+            # 旧的结果文件中可能没有启动耗时
+            for name, metrics in result.get(group, {}).items():
+                for metric, value in metrics.items():
+                    if metric.endswith(('_ms', '_mb')):
+                        flat[f'{size}.{group}.{name}.{metric}'] = value
+    return flat
+
+
+def check(results, thresholds=None, baseline=None, tolerance=0.3):
+    """与阈值和上一次的结果比较，返回超出的指标列表"""
+    flat = _flatten(results)
+    failures = []
+    for key, limit in (thresholds or {}).items():
+        if key in flat and flat[key] > limit:
+            failures.append({'metric': key, 'value': flat[key], 'limit': limit})
+    if baseline:
+        for key, old in _flatten(baseline['results']).items():
+            # 只比较中位数、首次调用和内存峰值；很小的数值受计时误差影响大，不参与比较
+            if not key.endswith(BASELINE_METRICS) or old < 1:
+                continue
+            if key in flat and flat[key] > old * (1 + tolerance):
+                failures.append({'metric': key, 'value': flat[key], 'baseline': old})
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='价格系统性能基准测试')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                        help='模拟历史数据的行数，可指定多个，例如 10000 100000 1000000')
+    parser.add_argument('--items', type=int, help='品种数，默认每期 2000 个品种')
+    parser.add_argument('--dates', type=int, help='报价日期数，默认按行数和品种数推算')
+    parser.add_argument('--suppliers', default='菜篮子,康瑞达', help='供应商名称，逗号分隔')
+    parser.add_argument('--storage', default='csv', help='存储后端：csv / sqlite / parquet')
+    parser.add_argument('--repeat', type=int, default=20, help='每项重复的次数')
+    parser.add_argument('--startup-repeat', type=int, default=5,
+                        help='测量启动耗时时启动新进程的次数，0 表示不测量')
+    parser.add_argument('--no-memory', action='store_true', help='不统计内存峰值（tracemalloc 会拖慢运行）')
+    parser.add_argument('--output', help='结果写入的 JSON 文件，默认输出到标准输出')
+    parser.add_argument('--thresholds', help='阈值 JSON 文件')
+    parser.add_argument('--baseline', help='上一次的结果 JSON 文件')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='相对上一次结果允许变慢的比例')
+    args = parser.parse_args(argv)
+
+    suppliers = [name.strip() for name in args.suppliers.split(',') if name.strip()]
+    # 供应商配置在导入项目模块时读取
+    os.environ['PRICE_SUPPLIERS'] = ','.join(suppliers)
+    os.environ.setdefault('ORDER_SUPPLIER', suppliers[0])
+
+    results = {}
+    for rows in args.rows:
+        print(f'正在测试 {rows} 行……', file=sys.stderr)
+        results[str(rows)] = run(rows, args.items, suppliers, args.dates, args.storage,
+                                 args.repeat, memory=not args.no_memory, startup_repeat=args.startup_repeat)
+
+    thresholds = None
+    if args.thresholds:
+        with open(args.thresholds, encoding='utf-8') as f:
+            thresholds = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    failures = check(results, thresholds, baseline, args.tolerance)
+
+    report = {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'results': results,
+        'regressions': failures,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    for failure in failures:
+        print(f"性能退化：{failure['metric']} = {failure['value']:.2f}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,3 +1,49 @@
+import os
+
+
 class Config:
     SECRET_KEY = 'your-secure-secret-key'
-    UPLOAD_FOLDER = 'C:/food_price_system/uploads' 
\ No newline at end of file
+    # 数据文件所在的目录（价格数据、订单、提醒等），默认为当前目录
+    DATA_DIR = os.environ.get('PRICE_DATA_DIR', '.')
+    # 上传的报价表在导入完成之前保存的目录
+    UPLOAD_FOLDER = os.environ.get('PRICE_UPLOAD_FOLDER', os.path.join(DATA_DIR, 'uploads'))
+    # 站点（食堂）名称，逗号分隔，第一个为默认站点；不设置时只有一个站点，见 sites.py
+    SITES = [name.strip() for name in os.environ.get('PRICE_SITES', '').split(',') if name.strip()]
+    # 站点引用的价格来源，格式为 站点:价格来源，逗号分隔；没有列出的站点共用 shared 价格来源
+    SITE_PRICE_SOURCES = {name.strip(): source.strip()
+                          for name, _, source in (entry.partition(':') for entry in
+                                                  os.environ.get('SITE_PRICE_SOURCES', '').split(','))
+                          if name.strip() and source.strip()}
+    # 价格数据存储后端：csv（默认）/ sqlite / parquet
+    PRICE_STORAGE = os.environ.get('PRICE_STORAGE', 'csv')
+    # 供应商名称，逗号分隔；报价表中的价格列名为 <供应商名称>价
+    SUPPLIERS = [name.strip() for name in os.environ.get('PRICE_SUPPLIERS', '菜篮子,康瑞达').split(',')
+                 if name.strip()]
+    # 下单计算默认使用的供应商
+    ORDER_SUPPLIER = os.environ.get('ORDER_SUPPLIER', '康瑞达')
+    # 按最低价拆单时各供应商的最低起订金额，格式为 供应商:金额，逗号分隔，例如 菜篮子:200,康瑞达:100
+    SUPPLIER_MIN_ORDER = {name.strip(): float(amount)
+                          for name, _, amount in (entry.partition(':') for entry in
+                                                  os.environ.get('SUPPLIER_MIN_ORDER', '').split(','))
+                          if name.strip() and amount.strip()}
+    # 下单会话（上次订单）在服务端保存的时间，单位为秒，超过后未使用即清除
+    ORDER_SESSION_TTL = int(os.environ.get('ORDER_SESSION_TTL', 7 * 24 * 3600))
+    # shared 价格来源的存储路径，不设置时为 DATA_DIR 下各后端的默认文件名
+    PRICE_STORAGE_PATH = os.environ.get('PRICE_STORAGE_PATH')
+    # 页面缓存的最大条目数和总字节数
+    PAGE_CACHE_ENTRIES = int(os.environ.get('PAGE_CACHE_ENTRIES', 256))
+    PAGE_CACHE_BYTES = int(os.environ.get('PAGE_CACHE_BYTES', 64 * 1024 * 1024))
+    # 价格时间序列的周期（D 按日 / W 按周 / M 按月）、滚动统计的周期数和预测的周期数
+    TIMESERIES_FREQ = os.environ.get('TIMESERIES_FREQ', 'W')
+    TIMESERIES_WINDOW = int(os.environ.get('TIMESERIES_WINDOW', 4))
+    FORECAST_HORIZON = int(os.environ.get('FORECAST_HORIZON', 4))
+    # 导入校验：与该品种、该供应商最近 OUTLIER_HISTORY 次报价相比，稳健 z 分数超过
+    # OUTLIER_THRESHOLD 的报价放进隔离表等待审核（见 validation.py）
+    OUTLIER_THRESHOLD = float(os.environ.get('OUTLIER_THRESHOLD', 3.5))
+    OUTLIER_HISTORY = int(os.environ.get('OUTLIER_HISTORY', 8))
+    # 日志级别和格式（text / json，json 为每行一个 JSON 对象）
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+    # 设置为 1 后，带 X-Profile: 1 请求头的请求用 cProfile 分析，结果保存到 PROFILE_DIR
+    PROFILING = os.environ.get('PRICE_PROFILING', '0') == '1'
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
@@ -0,0 +1,144 @@
+"""数据导出（Excel / CSV / Parquet）
+
+导出的数据以 DataFrame 块的迭代器给出，逐块写出，内存占用只取决于块大小：
+- xlsx：xlsxwriter 的 constant_memory 模式，逐行写入临时文件，生成后分块发送
+- csv：边读边输出，带 BOM，Excel 打开时能正确识别中文
+- parquet：每块写成一个行组，写入临时文件后分块发送（需要安装 pyarrow）
+
+临时文件在响应发送完毕后删除。
+"""
+import os
+import tempfile
+
+from flask import Response, stream_with_context
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+# 发送临时文件时每次读取的字节数
+_SEND_BLOCK = 64 * 1024
+
+
+def _rows(chunk, columns, number_columns=()):
+    """按 columns 的顺序取出整块数据，缺失值转换为 None（Excel 中为空白单元格）
+
+    number_columns 以外的列转换为文本。
+    """
+    chunk = chunk.reindex(columns=columns)
+    text = [name for name in columns if name not in number_columns]
+    chunk = chunk.astype({name: 'string' for name in text}).astype(object)
+    return chunk.where(chunk.notna(), None).to_numpy().tolist()
+
+
+def write_xlsx(path, columns, chunks, sheet_name='Sheet1', widths=None, number_columns=(), footer=None):
+    """把数据块逐行写入 Excel 文件
+
+    widths 为 {列名: 列宽}；number_columns 中的列使用两位小数的数字格式；
+    footer 为可选的最后一行（列表），例如合计行。
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name)
+        header_format = workbook.add_format({
+            'bold': True,
+            'align': 'center',
+            'valign': 'vcenter',
+            'bg_color': '#D9EAD3'
+        })
+        number_format = workbook.add_format({'num_format': '#,##0.00'})
+        # constant_memory 模式下按行顺序写入，列格式需要在写数据之前设置
+        for col, name in enumerate(columns):
+            width = (widths or {}).get(name, 12)
+            worksheet.set_column(col, col, width, number_format if name in number_columns else None)
+        worksheet.write_row(0, 0, columns, header_format)
+        # 按列的类型直接调用对应的写入方法，省去 write_row 对每个值的类型判断和
+        # 字符串解析（例如把以 = 开头的文本当作公式）
+        writers = list(enumerate(worksheet.write_number if name in number_columns else worksheet.write_string
+                                 for name in columns))
+        row = 1
+        for chunk in chunks:
+            for values in _rows(chunk, columns, number_columns):
+                for col, write in writers:
+                    value = values[col]
+                    if value is not None:
+                        write(row, col, value)
+                row += 1
+        if footer is not None:
+            worksheet.write_row(row, 0, footer, workbook.add_format({'bold': True}))
+    finally:
+        workbook.close()
+
+
+def iter_csv(columns, chunks):
+    """逐块生成 CSV 文本"""
+    yield '\ufeff' + ','.join(columns) + '\n'
+    for chunk in chunks:
+        yield chunk.reindex(columns=columns).to_csv(index=False, header=False, lineterminator='\n')
+
+
+def write_parquet(path, columns, chunks, number_columns=()):
+    """每个数据块写成一个行组；number_columns 按浮点数保存，其余列按字符串保存"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.float64() if name in number_columns else pa.string()) for name in columns])
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            chunk = chunk.reindex(columns=columns)
+            chunk = chunk.astype({name: 'float64' if name in number_columns else 'string' for name in columns})
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def _send_file(path):
+    """分块读出临时文件，发送完毕（或客户端断开）后删除"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(_SEND_BLOCK)
+                if not block:
+                    break
+                yield block
+    finally:
+        os.remove(path)
+
+
+def export_response(filename, fmt, columns, chunks, number_columns=(), **xlsx_options):
+    """按格式导出数据块，返回下载响应
+
+    filename 不带扩展名；number_columns 为数值列（Excel 中使用数字格式，Parquet 中按浮点数保存）；
+    xlsx_options 传给 write_xlsx（widths、footer、sheet_name）。
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式：{fmt}，可选：{', '.join(EXPORT_FORMATS)}")
+    if fmt == 'csv':
+        body = stream_with_context(iter_csv(columns, chunks))
+        size = None
+    else:
+        fd, path = tempfile.mkstemp(suffix=f'.{fmt}')
+        os.close(fd)
+        try:
+            if fmt == 'xlsx':
+                write_xlsx(path, columns, chunks, number_columns=number_columns, **xlsx_options)
+            else:
+                write_parquet(path, columns, chunks, number_columns)
+        except BaseException:
+            os.remove(path)
+            raise
+        size = os.path.getsize(path)
+        body = _send_file(path)
+
+    response = Response(body, mimetype=EXPORT_FORMATS[fmt])
+    if size is not None:
+        response.content_length = size
+    response.headers.set('Content-Disposition', 'attachment', filename=f'{filename}.{fmt}')
+    return response
+
+
+def frame_chunks(df, chunksize=10000):
+    """把已在内存中的 DataFrame 切成数据块"""
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
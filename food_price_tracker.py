@@ -1,121 +1,314 @@
-import pandas as pd
 from datetime import datetime
+import logging
 import os
+import time
+
+import ingest
+from alerts import AlertRules, AlertStore, compute_alerts
+from config import Config
+from instrumentation import ROWS_SCANNED, timed
+from lazy_imports import lazy_module
+from order_optimizer import optimize_orders
+from orders import OrderStore
+from price_store import PriceStore, clean_price_columns, price_columns_of, supplier_name
+from snapshot import LatestSnapshot
+from segments import SegmentStore, diff_segments
+from storage import CsvStorage, DataVersion
+from validation import APPROVED, REJECTED, QuarantineStore, history_issues, price_format_issues
+
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+
+logger = logging.getLogger(__name__)
 
 class FoodPriceTracker:
-    def __init__(self):
-        self.filename = 'food_prices.csv'
-        self.price_threshold = 0.1  # 价格波动阈值，默认10%
+    def __init__(self, storage=None, data_dir='.', price_dir=None):
+        """data_dir 为订单数据所在的目录，price_dir 为价格数据、提醒所在的目录（默认与 data_dir 相同）
+
+        多个站点共用价格数据时，各自的 data_dir 不同而 price_dir 相同，见 sites.py。
+        """
+        price_dir = price_dir or data_dir
+        self.filename = os.path.join(price_dir, 'food_prices.csv')
+        # 存储后端，默认使用 CSV 文件，可换成 storage.SqliteStorage / ParquetStorage
+        self.storage = storage or CsvStorage(self.filename)
+        # 数据版本号，每次导入或清空后加一，用于页面缓存和 ETag
+        self.version = DataVersion(f'{self.storage.path}.version')
+        # 每次导入保存的不可变分段，用于时间点查询、比较和回滚
+        self.segments = SegmentStore(f'{self.storage.path}.segments')
+        # 价格波动提醒：阈值规则（默认阈值 10%）和已产生的提醒
+        self.alert_rules = AlertRules.load(os.path.join(price_dir, 'alert_rules.json'))
+        self.alerts = AlertStore(os.path.join(price_dir, 'price_alerts.db'))
+        # 导入时未通过校验、等待审核的报价
+        self.quarantine = QuarantineStore(os.path.join(price_dir, 'quarantine.db'))
+        # 订单历史；第一次使用时导入旧版的 order_history.csv
+        self.orders = OrderStore(os.path.join(data_dir, 'orders.db'))
+        legacy_orders = os.path.join(data_dir, 'order_history.csv')
+        if os.path.exists(legacy_orders) and self.orders.is_empty():
+            self.orders.import_csv(legacy_orders, only_if_empty=True)
+
+    @property
+    def store(self):
+        """当前存储后端对应的共享内存缓存"""
+        return PriceStore.for_storage(self.storage)
+
+    def warm_up(self):
+        """加载价格数据并建立常用的缓存，返回各步骤的耗时（毫秒）
+
+        gunicorn 使用 preload_app 时在主进程中调用，fork 出的 worker 直接共享建好的缓存。
+        """
+        steps = {
+            'frame': self.store.get_frame,
+            'item_index': self.store.get_item_index,
+            'latest_snapshot': self.store.get_latest_snapshot,
+            'long_frame': self.store.get_long_frame,
+            'rollup': self.store.get_rollup,
+            'search_index': self.store.get_search_index,
+            'timeseries': self.store.get_timeseries,
+            'price_profile': self.store.get_price_profile,
+            # 只在第一次启动时把已有数据拆成导入批次的分段
+            'segments': self._ensure_segments,
+        }
+        timings = {}
+        for name, build in steps.items():
+            start = time.perf_counter()
+            build()
+            timings[name] = (time.perf_counter() - start) * 1000
+        logger.info("缓存预热完成，用时 %.0f 毫秒", sum(timings.values()),
+                    extra={'rows': len(self.store.get_frame()), 'timings_ms': timings})
+        return timings
         
     def import_from_excel(self, excel_path, date=None):
-        """从Excel文件导入价格数据"""
+        """从Excel文件导入价格数据（读取所有带价格表头的工作表）"""
+        return self.import_files([excel_path], date=date, workers=0)
+
+    @timed
+    def import_files(self, paths, date=None, workers=None, progress=None):
+        """批量导入多个Excel文件
+
+        文件在进程池中并行解析，全部解析成功后合并为一批，只写入存储一次。
+        任意一个文件无法导入时整批都不写入。
+        progress 为可选的进度回调：progress(进度 0~1, 说明, rows=行数, quarantined=隔离的行数)，
+        写入前 rows 为解析出的行数，写入后为实际写入的行数。
+        """
+        report = progress or (lambda *args, **kwargs: None)
         try:
-            # 读取Excel文件
-            df = pd.read_excel(excel_path)
-            print("读取到的数据：", df.head())
-            
-            # 确保必要的列存在
-            required_columns = ['品种', '单位', '菜篮子价', '康瑞达价', '日期']
-            if not all(col in df.columns for col in required_columns):
-                return False, f"Excel文件必须包含这些列：{', '.join(required_columns)}"
-            
-            # 确保日期格式正确
-            try:
-                df['日期'] = pd.to_datetime(df['日期']).dt.strftime('%Y-%m-%d')
-            except Exception as e:
-                return False, f"日期格式转换错误：{str(e)}"
-            
-            # 添加版本时间戳
-            df['上传时间'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            # 如果存在历史数据，则合并
-            try:
-                history_df = pd.read_csv(self.filename, encoding='utf-8')
-                final_df = pd.concat([history_df, df], ignore_index=True)
-                # 按日期和上传时间排序，而不是删除重复记录
-                final_df = final_df.sort_values(['日期', '上传时间'], ascending=[False, False])
-            except (FileNotFoundError, pd.errors.EmptyDataError):
-                final_df = df
-            
-            # 保存数据
-            final_df.to_csv(self.filename, index=False, encoding='utf-8')
-            print("保存的数据行数：", len(final_df))
-            
-            return True, "数据导入成功"
+            report(0.1, '正在解析文件')
+            results = ingest.parse_files(paths, date=date, workers=workers)
+            errors = [f"{os.path.basename(r['file'])}：{r['error']}" for r in results if r['error']]
+            if errors:
+                if len(results) == 1:
+                    return False, results[0]['error']
+                return False, '；'.join(errors)
+
+            frames = [df for r in results for df in r['frames']]
+            rejected = [df for r in results for df in r['quarantine']]
+            report(0.6, '正在写入数据', rows=sum(len(df) for df in frames))
+            rows, quarantined = self.import_frames(frames, quarantine=rejected)
+            report(0.9, '写入完成', rows=rows, quarantined=quarantined)
+            sheets = sum(r['sheets'] for r in results)
+            logger.info("保存的数据行数：%s", rows, extra={'rows': rows, 'quarantined': quarantined,
+                                                      'files': len(results)})
+            if len(results) == 1 and sheets == 1:
+                message = "数据导入成功"
+            else:
+                message = f"数据导入成功：{len(results)} 个文件，{sheets} 个工作表，共 {rows} 条记录"
+            if quarantined:
+                message += f"，{quarantined} 条记录未通过校验，等待审核"
+            return True, message
             
         except Exception as e:
+            logger.exception("导入数据失败：%s", e, extra={'files': len(paths)})
             return False, f"导入数据时发生错误: {str(e)}"
 
-    def _check_price_changes(self, new_data):
-        """检查价格波动并返回波动信息"""
-        price_alerts = []
-        try:
-            history_df = pd.read_csv(self.filename)
-            if len(history_df) <= 1:  # 如果只有一条记录，无法比较
-                return price_alerts
-            
-            # 获取上一次的价格记录
-            last_date = history_df[history_df['日期'] != new_data['日期'].iloc[0]]['日期'].max()
-            last_prices = history_df[history_df['日期'] == last_date]
-            
-            # 检查每个品种的价格变化
-            for _, new_row in new_data.iterrows():
-                old_price_row = last_prices[last_prices['品种'] == new_row['品种']]
-                
-                if not old_price_row.empty:
-                    # 检查菜篮子价格变化
-                    old_price = old_price_row['菜篮子价'].iloc[0]
-                    new_price = new_row['菜篮子价']
-                    change_pct = (new_price - old_price) / old_price
-                    
-                    if abs(change_pct) >= self.price_threshold:
-                        price_alerts.append({
-                            '品种': new_row['品种'],
-                            '供应商': '菜篮子',
-                            '原价': old_price,
-                            '新价': new_price,
-                            '变化比例': f"{change_pct:.1%}",
-                            '变化日期': f"从 {last_date} 到 {new_row['日期']}"
-                        })
-                    
-                    # 检查康瑞达价格变化
-                    old_price = old_price_row['康瑞达价'].iloc[0]
-                    new_price = new_row['康瑞达价']
-                    change_pct = (new_price - old_price) / old_price
-                    
-                    if abs(change_pct) >= self.price_threshold:
-                        price_alerts.append({
-                            '品种': new_row['品种'],
-                            '供应商': '康瑞达',
-                            '原价': old_price,
-                            '新价': new_price,
-                            '变化比例': f"{change_pct:.1%}",
-                            '变化日期': f"从 {last_date} 到 {new_row['日期']}"
-                        })
-            
-        except FileNotFoundError:
-            pass  # 如果是第一次导入数据，就不需要检查价格变化
+    @timed
+    def import_frames(self, frames, quarantine=(), validate=True):
+        """把整理好的多批数据合并后一次性写入存储，返回 (写入的行数, 隔离的行数)
+
+        quarantine 为解析时已经隔离的行；validate 为 True 时再和历史报价比较，
+        单位不一致或价格异常的行不写入，一起放进隔离表（见 validation.py）。
+        """
+        df = pd.concat(frames, ignore_index=True)
+        
+        # 添加版本时间戳
+        uploaded_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        df['上传时间'] = uploaded_at
+        rejected = [rows.assign(上传时间=uploaded_at) for rows in quarantine]
         
-        return price_alerts
+        # 校验、波动检查和分段文件都在锁外基于当前缓存准备好；排他锁只用于追加写入和
+        # 更新清单、版本号，不长时间阻塞读取。拿到锁后数据版本已经变化（其他进程写入了）时，
+        # 丢弃准备好的结果重新准备
+        self._ensure_segments()
+        while True:
+            history, signature_before = self.store.versioned_frame()
+            new_rows, failed_rows = df, []
+            if validate:
+                reasons = history_issues(df, self.store.get_price_profile(), price_columns_of(df.columns),
+                                         threshold=Config.OUTLIER_THRESHOLD)
+                failed = reasons != ''
+                failed_rows = [df[failed].assign(原因=reasons[failed])]
+                new_rows = df[~failed].reset_index(drop=True)
+            if new_rows.empty:
+                break
+            try:
+                alerts = self._price_change_frame(new_rows, history)
+            except Exception as e:
+                logger.exception("价格波动检查失败：%s", e)
+                alerts = None
+            segment = self.segments.prepare(new_rows, uploaded_at)
+            with self.storage.lock:
+                if self.storage.signature() == signature_before:
+                    self.storage.append(new_rows)
+                    self.segments.add(segment)
+                    signature_after = self.storage.signature()
+                    # 提醒在版本号更新之前保存，页面缓存不会漏掉新的提醒
+                    if alerts is not None:
+                        self.alerts.add(alerts)
+                    self.version.bump()
+                    break
+            self.segments.discard([segment])
+
+        rejected += failed_rows
+        quarantined = self.quarantine.add(pd.concat(rejected, ignore_index=True),
+                                          price_columns_of(df.columns)) if rejected else 0
+        if new_rows.empty:
+            return 0, quarantined
+        # 缓存和统计汇总只合并新数据
+        self.store.apply_import(new_rows, signature_before, signature_after)
+        return len(new_rows), quarantined
 
+    def get_quarantine(self, status='pending', limit=None):
+        """导入时未通过校验的报价，最近隔离的在前"""
+        return self.quarantine.recent(limit, status)
+
+    def review_quarantine(self, ids, approve, corrections=None):
+        """审核隔离的报价，返回 (处理的条数, 写入的行数)
+
+        approve 为 True 时把这些行导入价格数据（不再和历史比较），corrections 为可选的
+        {编号: {价格列: 修改后的价格}}，导入前替换原来的价格；否则标记为已拒绝。
+        价格文本仍然无法识别（没有修改的多个数字的价格）时抛出 ValueError，整批都不导入。
+        已经审核过的编号忽略；取出、导入和标记在存储的排他锁内完成，同一批不会导入两次。
+        """
+        with self.storage.lock:
+            records = self.quarantine.get(ids)
+            if not records:
+                return 0, 0
+            if not approve:
+                return self.quarantine.mark([r['id'] for r in records], REJECTED), 0
+            corrections = {int(key): value for key, value in (corrections or {}).items()}
+            df = pd.DataFrame([{'品种': r['品种'], '单位': r['单位'], **r['价格'], **corrections.get(r['id'], {}),
+                                '日期': r['日期']} for r in records])
+            price_columns = price_columns_of(df.columns)
+            reasons = price_format_issues(df, price_columns)
+            if (reasons != '').any():
+                unresolved = [f"{record['id']}（{reason}）" for record, reason in zip(records, reasons) if reason]
+                raise ValueError(f"以下编号的价格仍无法识别，请在 corrections 中修改：{'、'.join(unresolved)}")
+            rows, _ = self.import_frames([clean_price_columns(df)], validate=False)
+            self.quarantine.mark([r['id'] for r in records], APPROVED)
+        return len(records), rows
+
+    def _price_change_frame(self, new_data, history):
+        self.alert_rules.refresh()
+        return compute_alerts(clean_price_columns(new_data), history, price_columns_of(new_data.columns),
+                              self.alert_rules)
+
+    def _check_price_changes(self, new_data, history=None):
+        """检查新数据相对于历史价格的波动，返回超过阈值的提醒列表
+
+        history 为导入前的数据，默认取当前缓存。
+        """
+        if history is None:
+            history = self.store.get_frame()
+        return self._price_change_frame(new_data, history).to_dict('records')
+
+    @property
+    def price_threshold(self):
+        """默认的价格波动阈值"""
+        self.alert_rules.refresh()
+        return self.alert_rules.default
+
+    @price_threshold.setter
+    def price_threshold(self, threshold):
+        self.set_price_threshold(threshold)
+
+    def set_price_threshold(self, threshold, food_item=None, category=None, match=None):
+        """设置价格波动提醒阈值（例如 0.15 表示 15%）
+
+        指定 food_item 时只对该品种生效；指定 category 时对名称匹配 match（正则表达式，
+        默认为类别名称本身）的品种生效；都不指定时修改默认阈值。
+        """
+        if threshold < 0:
+            raise ValueError('阈值不能为负数')
+        self.alert_rules.refresh()
+        if food_item is not None:
+            self.alert_rules.items[food_item] = threshold
+        elif category is not None:
+            self.alert_rules.categories[category] = {'match': match or category, 'threshold': threshold}
+        else:
+            self.alert_rules.default = threshold
+        self.alert_rules.save()
+
+    def get_price_alerts(self, limit=50, food_item=None):
+        """最近产生的价格波动提醒"""
+        return self.alerts.recent(limit, food_item)
+
+    @timed
+    def search_items(self, query, limit=10, latest_only=False):
+        """按名称、别名、拼音首字母搜索品种，返回按匹配程度排序的 [{'品种', '匹配'}]
+
+        latest_only 为 True 时只返回最新一期有报价的品种（下单页面使用）。
+        """
+        where = None
+        if latest_only:
+            snapshot = self.get_latest_snapshot()
+            if snapshot is None:
+                return []
+            where = snapshot.index.__contains__
+        return self.store.get_search_index().search(query, limit, where=where)
+
+    def resolve_item(self, food_item):
+        """把写法不同（全角/半角括号、空格、大小写）的名称对应到数据中的品种名称，找不到时原样返回"""
+        if food_item in self.store.get_item_index():
+            return food_item
+        return self.store.get_search_index().resolve(food_item) or food_item
+
+    @timed
     def get_price_history(self, food_item):
         """获取特定食材的价格历史"""
         try:
-            df = pd.read_csv(self.filename, encoding='utf-8')
-            if food_item not in df['品种'].values:
+            df = self.store.get_frame()
+            positions = self.store.get_item_index().get(self.resolve_item(food_item))
+            if positions is None:
                 return None
             
-            # 获取所有记录并按日期和上传时间排序
-            result = df[df['品种'] == food_item].sort_values(['日期', '上传时间'], ascending=[False, False])
-            return result
+            # 缓存数据已按日期和上传时间倒序排列，按行号直接取出
+            return df.take(positions)
             
         except FileNotFoundError:
             return None
 
+    def iter_price_history(self, food_item=None, start_date=None, end_date=None, chunksize=10000):
+        """按写入顺序分块读取价格记录，可按品种和日期范围（均包含在内）过滤
+
+        直接从存储分块读取，不经过内存缓存，适合导出全部历史数据。
+        """
+        for chunk in self.storage.iter_chunks(chunksize):
+            ROWS_SCANNED.inc(len(chunk), operation='iter_price_history')
+            mask = pd.Series(True, index=chunk.index)
+            if food_item is not None:
+                mask &= chunk['品种'] == food_item
+            if start_date:
+                mask &= chunk['日期'] >= start_date
+            if end_date:
+                mask &= chunk['日期'] <= end_date
+            chunk = chunk[mask]
+            if not chunk.empty:
+                yield clean_price_columns(chunk)
+
+    @timed
     def get_latest_prices(self):
         """获取最新一期的所有价格"""
         try:
-            df = pd.read_csv(self.filename, encoding='utf-8')
+            df = self.store.get_frame()
             if df.empty:
                 return None
             
@@ -129,197 +322,340 @@ class FoodPriceTracker:
         except (FileNotFoundError, pd.errors.EmptyDataError):
             return None
 
+    @timed
+    def get_latest_snapshot(self):
+        """获取最新一期的价格快照（每个品种一条），没有数据时返回 None"""
+        return self.store.get_latest_snapshot()
+
+    @timed
+    def get_price_comparison_frame(self, start_date, end_date=None):
+        """获取两个日期之间的价格比较，返回 DataFrame
+
+        起始日期的每条记录按品种与结束日期最新上传的记录做一次关联，
+        各供应商的变化率整列计算，列 <供应商>_变化率 为数值，<供应商>_变化 为百分比文本。
+        """
+        df = self.store.get_frame()
+        if end_date is None:
+            end_date = df['日期'].max()
+
+        ROWS_SCANNED.inc(len(df), operation='price_comparison')
+        price_columns = price_columns_of(df.columns)
+        start_prices = df.loc[df['日期'] == start_date, ['品种', '单位'] + price_columns]
+        # 缓存中同一日期的数据按上传时间倒序，保留每个品种最新上传的一条
+        end_prices = (df.loc[df['日期'] == end_date, ['品种'] + price_columns]
+                      .dropna(subset=['品种'])
+                      .drop_duplicates('品种'))
+        merged = start_prices.merge(end_prices, on='品种', how='inner', suffixes=('_起', '_终'))
+
+        columns = ['品种', '单位']
+        # 时间序列中的当前波动率和下一周期的预测价格
+        series = self.store.get_timeseries()
+        latest = series.latest(merged['品种']) if series is not None else {}
+        for col in price_columns:
+            start = merged[f'{col}_起'].to_numpy()
+            end = merged[f'{col}_终'].to_numpy()
+            nonzero = start != 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                change = np.where(nonzero, (end - start) / start, 0.0)
+            merged[f'{col}_变化率'] = change
+            merged[f'{col}_变化'] = np.where(nonzero, np.char.mod('%.1f%%', change * 100), '0%')
+            missing = np.full(len(merged), np.nan)
+            merged[f'{col}_预测'] = latest.get(col, {}).get('预测', missing)
+            merged[f'{col}_波动率'] = latest.get(col, {}).get('波动率', missing)
+            columns += [f'{col}_起', f'{col}_终', f'{col}_变化', f'{col}_变化率', f'{col}_预测', f'{col}_波动率']
+        return merged[columns]
+
     def get_price_comparison(self, start_date, end_date=None):
         """获取两个日期之间的价格比较"""
         try:
-            df = pd.read_csv(self.filename, encoding='utf-8')
-            
-            # 转换价格为数值类型
-            def clean_price(price):
-                try:
-                    if isinstance(price, str):
-                        price = ''.join(c for c in price if c.isdigit() or c == '.')
-                        parts = price.split('.')
-                        if len(parts) > 2:
-                            price = parts[0] + '.' + ''.join(parts[1:])
-                    return float(price)
-                except (ValueError, TypeError):
-                    return 0.0
-
-            df['菜篮子价'] = df['菜篮子价'].apply(clean_price)
-            df['康瑞达价'] = df['康瑞达价'].apply(clean_price)
-            
-            if end_date is None:
-                end_date = df['日期'].max()
-            
-            start_prices = df[df['日期'] == start_date]
-            end_prices = df[df['日期'] == end_date]
-            
-            comparison = []
-            for _, start_row in start_prices.iterrows():
-                end_row = end_prices[end_prices['品种'] == start_row['品种']]
-                if not end_row.empty:
-                    end_row = end_row.iloc[0]
-                    comparison.append({
-                        '品种': start_row['品种'],
-                        '单位': start_row['单位'],
-                        '菜篮子价_起': start_row['菜篮子价'],
-                        '菜篮子价_终': end_row['菜篮子价'],
-                        '菜篮子价_变化': f"{((end_row['菜篮子价'] - start_row['菜篮子价']) / start_row['菜篮子价']):.1%}" if start_row['菜篮子价'] != 0 else "0%",
-                        '康瑞达价_起': start_row['康瑞达价'],
-                        '康瑞达价_终': end_row['康瑞达价'],
-                        '康瑞达价_变化': f"{((end_row['康瑞达价'] - start_row['康瑞达价']) / start_row['康瑞达价']):.1%}" if start_row['康瑞达价'] != 0 else "0%"
-                    })
-            
-            return comparison
-            
+            return self.get_price_comparison_frame(start_date, end_date).to_dict('records')
         except Exception as e:
-            print(f"Error in price comparison: {str(e)}")
+            logger.exception("价格比较失败：%s", e, extra={'start_date': start_date, 'end_date': end_date})
             return None
 
+    @timed
     def get_available_dates(self):
         """获取所有可用的日期列表"""
         try:
-            df = pd.read_csv(self.filename, encoding='utf-8')
+            df = self.store.get_frame()
             if df.empty:  # 检查是否为空
                 return []
             return sorted(df['日期'].unique(), reverse=True)
         except (FileNotFoundError, pd.errors.EmptyDataError):  # 处理文件不存在或为空的情况
             return []
 
-    def get_item_price_trend(self, food_item):
-        """获取特定食材的价格趋势数据"""
+    def get_price_columns(self):
+        """当前数据中的供应商价格列，例如 ['菜篮子价', '康瑞达价']"""
+        return self.store.get_price_columns()
+
+    def get_suppliers(self):
+        """当前数据中的供应商名称"""
+        return [supplier_name(col) for col in self.get_price_columns()]
+
+    @timed
+    def get_cheapest_suppliers(self, date=None):
+        """指定日期（默认为最新日期）每个品种报价最低的供应商
+
+        返回 DataFrame，列为 品种、单位、供应商、价格，按品种排序；价格为 0 的报价不参与比较。
+        """
+        long = self.store.get_long_frame()
+        if long.empty:
+            return pd.DataFrame(columns=['品种', '单位', '供应商', '价格'])
+        if date is None:
+            date = self.store.get_frame()['日期'].max()
+        ROWS_SCANNED.inc(len(long), operation='cheapest_suppliers')
+        # 长表与缓存一样按上传时间倒序，每个 (品种, 供应商) 保留最新上传的报价
+        quotes = long[(long['日期'] == date) & (long['价格'] > 0)].drop_duplicates(['品种', '供应商'])
+        cheapest = quotes.loc[quotes.groupby('品种', observed=True)['价格'].idxmin(),
+                              ['品种', '单位', '供应商', '价格']]
+        return cheapest.astype({'品种': str, '单位': str, '供应商': str}).sort_values(
+            '品种', kind='mergesort', ignore_index=True)
+
+    @timed
+    def optimize_orders(self, baskets, min_order=None, preferred=None, tolerance=0.0):
+        """按最新价格为多份订单（例如每个厨房一份）选择最便宜的供应商
+
+        baskets 为 {订单名称: {品种: 数量}}，结果格式见 order_optimizer.optimize_orders。
+        """
+        snapshot = self.get_latest_snapshot()
+        if snapshot is None:
+            raise ValueError('没有可用的价格数据')
+        return optimize_orders(snapshot, baskets, min_order=min_order, preferred=preferred, tolerance=tolerance)
+
+    @timed
+    def get_item_price_trend(self, food_item, periods=12):
+        """获取特定食材的价格趋势数据
+
+        时间序列 为最近 periods 个周期的重采样价格、滚动均价、波动率和之后几个周期的预测价格。
+        """
         try:
-            print(f"Reading CSV file: {self.filename}")
-            df = pd.read_csv(self.filename, encoding='utf-8')
-            print(f"CSV columns: {df.columns.tolist()}")
-            
-            if '品种' not in df.columns:
-                print("Error: '品种' column not found")
+            item_df = self.get_price_history(food_item)
+            if item_df is None:
+                logger.warning("没有找到品种：%s", food_item, extra={'item': food_item})
                 return None
+            food_item = item_df['品种'].iloc[0]
+            price_columns = price_columns_of(item_df.columns)
             
-            if food_item not in df['品种'].values:
-                print(f"Error: '{food_item}' not found in data")
-                return None
-            
-            # 获取该食材的所有记录并按日期排序
-            item_df = df[df['品种'] == food_item].sort_values('日期', ascending=False)
-            
-            # 转换价格为数值类型
-            def clean_price(price):
-                try:
-                    if isinstance(price, str):
-                        # 移除所有非数字和小数点的字符
-                        price = ''.join(c for c in price if c.isdigit() or c == '.')
-                        # 如果有多个小数点，只保留第一个
-                        parts = price.split('.')
-                        if len(parts) > 2:
-                            price = parts[0] + '.' + ''.join(parts[1:])
-                    return float(price)
-                except (ValueError, TypeError):
-                    print(f"Warning: Invalid price value: {price}")
-                    return 0.0
-
-            item_df['菜篮子价'] = item_df['菜篮子价'].apply(clean_price)
-            item_df['康瑞达价'] = item_df['康瑞达价'].apply(clean_price)
-            
-            # 计算价格变化
             result = {
                 '品种': food_item,
                 '单位': item_df['单位'].iloc[0],
-                '历史记录': []
+                # 每个日期的价格记录（按日期倒序）
+                '历史记录': item_df[['日期'] + price_columns + ['上传时间']].to_dict('records')
             }
             
-            # 添加每个日期的价格记录
-            for _, row in item_df.iterrows():
-                record = {
-                    '日期': row['日���'],
-                    '菜篮子价': row['菜篮子价'],
-                    '康瑞达价': row['康瑞达价']
-                }
-                result['历史记录'].append(record)
-            
-            # 计算价格统计信息
-            result.update({
-                '最高菜篮子价': item_df['菜篮子价'].max(),
-                '最低菜篮子价': item_df['菜篮子价'].min(),
-                '平均菜篮子价': round(item_df['菜篮子价'].mean(), 2),
-                '最高康瑞达价': item_df['康瑞达价'].max(),
-                '最低康瑞达价': item_df['康瑞达价'].min(),
-                '平均康瑞达价': round(item_df['康瑞达价'].mean(), 2)
-            })
+            series = self.store.get_timeseries()
+            result['时间序列'] = series.item_series(food_item, last=periods) if series is not None else None
+
+            # 价格统计信息直接取自预先汇总的统计表
+            stats = self.store.get_rollup().item_stats(food_item)
+            for col in price_columns:
+                col_stats = stats.get(col)
+                result.update({
+                    f'最高{col}': col_stats['max'] if col_stats else np.nan,
+                    f'最低{col}': col_stats['min'] if col_stats else np.nan,
+                    f'平均{col}': round(col_stats['sum'] / col_stats['count'], 2) if col_stats else np.nan,
+                })
             
             return result
             
         except Exception as e:
-            print(f"Error in get_item_price_trend: {str(e)}")
+            logger.exception("获取价格趋势失败：%s", e, extra={'item': food_item})
             return None
 
+    @timed
+    def get_price_forecast(self, food_item=None):
+        """各品种之后几个周期的预测价格（DataFrame，列为 品种、周期、各供应商价格列、最低价）"""
+        series = self.store.get_timeseries()
+        if series is None:
+            return pd.DataFrame(columns=['品种', '周期'] + self.get_price_columns() + ['最低价'])
+        return series.forecast_frame(None if food_item is None else [self.resolve_item(food_item)])
+
+    @timed
+    def get_budget_forecast(self, weeks=8, alpha=0.5):
+        """下一周的采购预算估计：预测消耗量 × 下一周期最低的预测价格
+
+        返回 DataFrame，列为 品种、预测数量、预测单价、预测金额，按预测金额倒序；
+        没有价格预测的品种预测单价和金额为 NaN。
+        """
+        budget = self.get_consumption_forecast(weeks, alpha)[['品种', '预测数量']]
+        series = self.store.get_timeseries()
+        price = np.full(len(budget), np.nan)
+        if series is not None and not budget.empty:
+            positions = series.positions(budget['品种'])
+            found = positions >= 0
+            price[found] = series.best_forecast[positions[found], 0]
+        budget = budget.assign(预测单价=price, 预测金额=budget['预测数量'].to_numpy() * price)
+        return budget.sort_values('预测金额', ascending=False, na_position='last', ignore_index=True)
+
+    @timed
+    def get_price_rollup(self, food_item, start=None, end=None, freq='M'):
+        """按周（W）或按月（M）查询某个品种各供应商的价格统计
+
+        例如 get_price_rollup('本地菜心', '2024-01', '2024-12') 返回 2024 年每月及全年的均价。
+        """
+        return self.store.get_rollup().range_stats(self.resolve_item(food_item), start, end, freq)
+
+    @timed
     def clear_price_data(self):
-        """清空价格数据"""
+        """清空价格数据：所有导入批次标记为已回滚，之后仍可通过 restore_upload 恢复
+
+        已产生的价格提醒是导入时的记录，清空后保留，恢复数据后不需要重新生成。
+        """
         try:
-            # 创建一个空的 DataFrame，只包含列名
-            columns = ['品种', '单位', '菜篮子价', '康瑞达价', '日期']
-            df = pd.DataFrame(columns=columns)
-            # 保存为 CSV，确保使用 UTF-8 编码
-            df.to_csv(self.filename, index=False, encoding='utf-8')
-            return True, "数据已清空"
+            with self.storage.lock:
+                self._ensure_segments()
+                self.segments.set_active([s['id'] for s in self.segments.segments()], False)
+                self.storage.clear()
+                self.version.bump()
+                self.store.invalidate()
+            return True, "数据已清空，可在导入批次中恢复"
         except Exception as e:
             return False, f"清空数据时出错：{str(e)}"
 
-    def save_order(self, order_items, total_price):
-        """保存订单到历史记录"""
+    def _ensure_segments(self):
+        """还没有分段清单时，把已有的数据按上传时间拆成分段
+
+        分段文件在锁外写入，只在创建清单时持有排他锁；期间数据有变化时重新拆分。
+        """
+        while not self.segments.exists():
+            frame, signature = self.store.versioned_frame()
+            segments = self.segments.split(frame)
+            with self.storage.lock:
+                if not self.segments.exists() and self.storage.signature() == signature:
+                    self.segments.create(segments)
+                    return
+            self.segments.discard(segments)
+
+    def _remove_segments(self, segments):
+        """从存储中删除已回滚的分段的记录（调用方需持有存储的排他锁）
+
+        存储中按上传时间区分批次；同一秒导入的其他有效批次的记录会被一起删除，删除后重新追加。
+        """
+        if not segments:
+            return
+        upload_times = {segment['上传时间'] for segment in segments}
+        self.storage.remove_uploads(upload_times)
+        same_time = self.segments.frame([s for s in self.segments.segments()
+                                         if s['active'] and s['上传时间'] in upload_times])
+        if same_time is not None:
+            self.storage.append(same_time)
+        self.version.bump()
+        self.store.invalidate()
+
+    def _append_segments(self, segments):
+        """把恢复的分段的记录追加到存储，缓存只合并这些记录（调用方需持有存储的排他锁）"""
+        frame = self.segments.frame(segments)
+        if frame is None:
+            return
+        signature_before = self.storage.signature()
+        self.storage.append(frame)
+        signature_after = self.storage.signature()
+        self.version.bump()
+        self.store.apply_import(frame, signature_before, signature_after)
+
+    def list_uploads(self):
+        """所有导入批次，最近的在前；active 为 False 的批次已回滚"""
+        self._ensure_segments()
+        return list(reversed(self.segments.segments()))
+
+    def get_upload(self, upload_id):
+        """导入批次的信息，不存在时返回 None"""
+        self._ensure_segments()
         try:
-            order_file = 'order_history.csv'
-            order_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            # 准备订单数据
-            order_data = []
-            for item in order_items:
-                order_data.append({
-                    '订单日期': order_date,
-                    '品种': item['品种'],
-                    '单位': item['单位'],
-                    '数量': item['数量'],
-                    '单价': item['单价'],
-                    '小计': item['小计']
-                })
-            
-            # 创建或追加到CSV文件
-            df = pd.DataFrame(order_data)
-            if os.path.exists(order_file):
-                df.to_csv(order_file, mode='a', header=False, index=False, encoding='utf-8')
-            else:
-                df.to_csv(order_file, index=False, encoding='utf-8')
-            
-            return True, "订单已保存"
+            return self.segments.get(upload_id)
+        except KeyError:
+            return None
+
+    @timed
+    def get_snapshot_at(self, upload_id):
+        """某次导入完成时的最新价格快照，没有数据时返回 None；批次不存在时抛出 KeyError"""
+        self._ensure_segments()
+        rows = self.segments.latest_rows(upload_id)
+        if rows is None:
+            return None
+        return LatestSnapshot.build(rows, price_columns_of(rows.columns))
+
+    @timed
+    def get_price_history_at(self, food_item, upload_id):
+        """某次导入完成时某个品种的价格历史，没有记录时返回 None；批次不存在时抛出 KeyError"""
+        self._ensure_segments()
+        return self.segments.item_rows(self.resolve_item(food_item), upload_id)
+
+    @timed
+    def diff_uploads(self, old_id, new_id):
+        """比较两次导入的报价，每个品种一行；批次不存在时抛出 KeyError"""
+        self._ensure_segments()
+        old, new = self.segments.read(old_id), self.segments.read(new_id)
+        return diff_segments(old, new, price_columns_of(list(old.columns) + list(new.columns)))
+
+    def rollback_upload(self, upload_id):
+        """回滚到某次导入完成时的状态：之后导入的批次标记为已回滚，从存储中删除这些批次的记录"""
+        try:
+            with self.storage.lock:
+                self._ensure_segments()
+                ids = [segment['id'] for segment in self.segments.segments()]
+                if upload_id not in ids:
+                    return False, f"未找到导入批次：{upload_id}"
+                changed = self.segments.set_active(ids[ids.index(upload_id) + 1:], False)
+                self._remove_segments(changed)
+                self._append_segments(self.segments.set_active([upload_id], True))
+            logger.info("已回滚到导入批次 %s", upload_id, extra={'rolled_back': len(changed)})
+            return True, f"已回滚 {len(changed)} 个导入批次"
         except Exception as e:
-            return False, f"保存订单失败：{str(e)}"
+            logger.exception("回滚数据失败：%s", e)
+            return False, f"回滚数据时出错：{str(e)}"
 
+    def restore_upload(self, upload_id):
+        """恢复已回滚的导入批次"""
+        try:
+            with self.storage.lock:
+                self._ensure_segments()
+                self.segments.get(upload_id)
+                restored = self.segments.set_active([upload_id], True)
+                if not restored:
+                    return True, "该批次没有被回滚"
+                self._append_segments(restored)
+            return True, "已恢复导入批次"
+        except KeyError as e:
+            return False, str(e.args[0])
+        except Exception as e:
+            logger.exception("恢复数据失败：%s", e)
+            return False, f"恢复数据时出错：{str(e)}"
+
+    @timed
+    def save_order(self, order_items, total_price, supplier=None):
+        """保存订单到历史记录，返回订单编号，失败时返回 None"""
+        try:
+            return self.orders.add(order_items, total_price, supplier=supplier)
+        except Exception as e:
+            logger.exception("保存订单失败：%s", e)
+            return None
+
+    @timed
     def get_last_order(self):
         """获取最近一次订单"""
         try:
-            order_file = 'order_history.csv'
-            if not os.path.exists(order_file):
+            order = self.orders.last()
+            if order is None:
                 return None
-            
-            df = pd.read_csv(order_file, encoding='utf-8')
-            if df.empty:
-                return None
-            
-            # 获取最新订单日期
-            latest_date = df['订单日期'].max()
-            latest_order = df[df['订单日期'] == latest_date]
-            
-            # 转换为字典格式
-            order_items = []
-            for _, row in latest_order.iterrows():
-                order_items.append({
-                    '品种': row['品种'],
-                    '数量': row['数量']
-                })
-            
-            return order_items
+            return [{'品种': item['品种'], '数量': item['数量']} for item in order['items']]
         except Exception as e:
-            print(f"获取最近订单失败：{str(e)}")
-            return None 
\ No newline at end of file
+            logger.exception("获取最近订单失败：%s", e)
+            return None
+
+    @timed
+    def get_order(self, order_id):
+        """按编号获取订单（包含明细）"""
+        return self.orders.get(order_id)
+
+    def get_top_spend_items(self, limit=10, start_week=None, end_week=None):
+        """花费最多的品种"""
+        return self.orders.top_items(limit, start_week, end_week)
+
+    def get_spend_attribution(self, base_start, base_end, start, end):
+        """两个时期之间各品种花费变化中价格和数量各自的影响"""
+        return self.orders.spend_attribution(base_start, base_end, start, end)
+
+    def get_consumption_forecast(self, weeks=8, alpha=0.5, food_item=None):
+        """按最近几周的订购量预测下一周的消耗量"""
+        return self.orders.forecast(weeks, alpha, food_item)
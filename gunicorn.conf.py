@@ -1,3 +1,26 @@
+import gc
+import os
+
 workers = 4  # 根据服务器 CPU 核心数调整
 bind = "127.0.0.1:8000"
-timeout = 120 
\ No newline at end of file
+timeout = 120
+# 在主进程中加载应用并预热缓存，worker 通过 fork 以写时复制的方式共享已加载的价格数据，
+# 不必各自重新读取；设置 GUNICORN_PRELOAD=0 时每个 worker 各自加载和预热
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    # 主进程已加载应用，创建 worker 之前预热
+    if preload_app:
+        import app
+        app.warm_up()
+        # 预热后的对象不再参与垃圾回收的扫描，避免 worker 中的垃圾回收改写这些内存页、
+        # 使共享的页面被复制
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    # 没有预加载时，每个 worker 在开始接收请求之前各自预热
+    if not preload_app:
+        import app
+        app.warm_up()
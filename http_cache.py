@@ -0,0 +1,133 @@
+"""页面缓存和条件请求
+
+数据只在导入或清空时变化，页面内容完全由数据版本号、路由和查询参数决定：
+- 响应带 ETag 和 Last-Modified，浏览器再次请求时版本未变直接返回 304
+- 渲染好的页面放在按条目数和字节数限制大小的 LRU 缓存中，版本号变化后旧条目自然失效
+
+有待显示的 flash 消息时不使用缓存，视图本身调用了 flash 的响应也不缓存。
+"""
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import g, make_response, message_flashed, request, session
+
+
+class LRUCache:
+    """按条目数和总字节数限制大小的 LRU 缓存，线程安全"""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size):
+        # 单个条目超过总大小限制时不缓存
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _record_flash(sender, message, category, **extra):
+    g._page_cache_flashed = True
+
+
+class PageCache:
+    """按数据版本缓存页面
+
+    version 为返回 (版本号, 修改时间戳) 的函数，通常是 tracker.version.current。
+    scope 为可选的函数，返回当前请求所属的范围（例如站点），不同范围的页面分别缓存。
+    """
+
+    def __init__(self, version, scope=None, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.version = version
+        self.scope = scope
+        self.cache = LRUCache(max_entries, max_bytes)
+
+    def init_app(self, app):
+        message_flashed.connect(_record_flash, app)
+
+    def cached(self, vary=None):
+        """视图装饰器
+
+        vary 为可选的函数，返回值会加入缓存键，用于页面中不由价格数据决定的部分
+        （例如导入任务列表）。
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or session.get('_flashes'):
+                    return view(*args, **kwargs)
+
+                version, modified = self.version()
+                key = (self.scope() if self.scope else None, request.endpoint, request.path,
+                       tuple(sorted(request.args.items(multi=True))), version, vary() if vary else None)
+                etag = f'{version}-{hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()}'
+
+                # 页面还包含不由数据版本决定的内容时，修改时间不可靠，只用 ETag
+                if vary:
+                    modified = None
+                # 有 If-None-Match 时忽略 If-Modified-Since
+                if request.if_none_match:
+                    not_modified = request.if_none_match.contains(etag)
+                else:
+                    since = request.if_modified_since
+                    not_modified = bool(modified and since and since.timestamp() >= int(modified))
+
+                if not_modified:
+                    response = make_response('', 304)
+                else:
+                    cached = self.cache.get(key)
+                    if cached is not None:
+                        body, mimetype = cached
+                        response = make_response(body, 200)
+                        response.mimetype = mimetype
+                    else:
+                        response = make_response(view(*args, **kwargs))
+                        # 只缓存正常渲染且没有产生 flash 消息的页面
+                        if response.status_code != 200 or g.get('_page_cache_flashed'):
+                            return response
+                        body = response.get_data()
+                        self.cache.set(key, (body, response.mimetype), len(body))
+
+                response.set_etag(etag)
+                if modified:
+                    response.last_modified = modified
+                # 允许浏览器保存，但每次使用前都要向服务器确认
+                response.cache_control.no_cache = True
+                return response
+            return wrapper
+        return decorator
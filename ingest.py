@@ -0,0 +1,197 @@
+"""批量导入供应商报价表
+
+支持一次导入多个工作簿或整个目录，读取每个工作簿中的所有工作表：
+- 在前几行中自动查找表头（报价表通常在表头上方有标题和客户信息）
+- 多个文件在进程池中并行解析，校验、日期和价格整理都按列向量化完成
+- 价格文本无法确定价格的行不导入，放进隔离表等待审核（见 validation.py）
+- 所有文件解析完成后合并为一批，只向存储写入一次
+
+命令行用法：
+    python ingest.py 报价表目录/ 劳动2024.12.26-2025.1.5报价.xlsx --workers 4
+"""
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from lazy_imports import lazy_module
+from price_store import SUPPLIER_PRICE_COLUMNS, clean_price_columns
+from validation import price_format_issues
+
+pd = lazy_module('pandas')
+
+# 表头中必须出现的列，另外至少要有一个供应商价格列；日期可以来自数据列、调用参数或文件名
+REQUIRED_COLUMNS = ['品种', '单位']
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+# 在每个工作表前多少行内查找表头
+HEADER_SCAN_ROWS = 10
+
+_DATE_IN_NAME = re.compile(r'(\d{4})[.\-_/年](\d{1,2})[.\-_/月](\d{1,2})')
+
+
+def date_from_filename(path):
+    """从文件名中取出第一个日期，例如 劳动2024.12.26-2025.1.5报价.xlsx -> 2024-12-26"""
+    match = _DATE_IN_NAME.search(os.path.basename(path))
+    if not match:
+        return None
+    year, month, day = (int(part) for part in match.groups())
+    return f'{year:04d}-{month:02d}-{day:02d}'
+
+
+def _missing_columns_message():
+    return (f"Excel文件必须包含这些列：{', '.join(REQUIRED_COLUMNS + ['日期'])}，"
+            f"以及至少一个供应商价格列（{', '.join(SUPPLIER_PRICE_COLUMNS)}）")
+
+
+def _is_header(values):
+    values = set(values)
+    return set(REQUIRED_COLUMNS).issubset(values) and not values.isdisjoint(SUPPLIER_PRICE_COLUMNS)
+
+
+def _locate_header(raw):
+    """返回表头所在行号，-1 表示第一行就是列名，找不到时返回 None"""
+    if _is_header(str(col).strip() for col in raw.columns):
+        return -1
+    head = raw.head(HEADER_SCAN_ROWS).astype(str)
+    for col in head.columns:
+        head[col] = head[col].str.strip()
+    for row, values in enumerate(head.itertuples(index=False, name=None)):
+        if _is_header(values):
+            return row
+    return None
+
+
+def read_workbook(path):
+    """读取工作簿中所有带价格表头的工作表
+
+    返回 (数据列表, 跳过的工作表名称列表)，数据只保留价格相关的列。
+    """
+    frames, skipped = [], []
+    for sheet, raw in pd.read_excel(path, sheet_name=None).items():
+        header = _locate_header(raw)
+        if header is None:
+            skipped.append(sheet)
+            continue
+        if header >= 0:
+            columns = raw.iloc[header].astype(str).str.strip()
+            raw = raw.iloc[header + 1:]
+            raw.columns = columns
+        else:
+            raw.columns = [str(col).strip() for col in raw.columns]
+        # 同名列只保留第一列
+        raw = raw.loc[:, ~raw.columns.duplicated()]
+        keep = [col for col in REQUIRED_COLUMNS + SUPPLIER_PRICE_COLUMNS + ['日期'] if col in raw.columns]
+        frames.append(raw[keep].reset_index(drop=True))
+    return frames, skipped
+
+
+def prepare_frame(df, date=None):
+    """校验列并整理日期和价格，返回 (成功, 数据或错误信息, 隔离的行)
+
+    缺少日期列或日期为空时使用 date 补齐；表中没有的供应商价格列补为空列。
+    价格文本无法识别的行不在数据中，作为隔离的行返回（保留原始文本，原因 列为说明）。
+    """
+    required = REQUIRED_COLUMNS + ([] if date else ['日期'])
+    if not all(col in df.columns for col in required) or df.columns.intersection(SUPPLIER_PRICE_COLUMNS).empty:
+        return False, _missing_columns_message(), None
+
+    df = df.copy()
+    if '日期' not in df.columns:
+        df['日期'] = date
+    elif date:
+        df['日期'] = df['日期'].fillna(date)
+
+    try:
+        df['日期'] = pd.to_datetime(df['日期']).dt.strftime('%Y-%m-%d')
+    except Exception as e:
+        return False, f"日期格式转换错误：{str(e)}", None
+
+    # 去掉没有品种名称的空行，价格统一清洗为数值
+    df = df[df['品种'].notna()].reindex(columns=REQUIRED_COLUMNS + SUPPLIER_PRICE_COLUMNS + ['日期'])
+    reasons = price_format_issues(df, SUPPLIER_PRICE_COLUMNS)
+    rejected = reasons != ''
+    return True, clean_price_columns(df[~rejected]), df[rejected].assign(原因=reasons[rejected])
+
+
+def parse_file(path, date=None):
+    """解析单个工作簿，返回包含数据和说明的结果字典"""
+    result = {'file': path, 'frames': [], 'quarantine': [], 'sheets': 0, 'skipped': [], 'error': None}
+    try:
+        frames, result['skipped'] = read_workbook(path)
+        date = date or date_from_filename(path)
+        for df in frames:
+            success, prepared, rejected = prepare_frame(df, date)
+            if not success:
+                result['error'] = prepared
+                return result
+            result['frames'].append(prepared)
+            if not rejected.empty:
+                result['quarantine'].append(rejected)
+        result['sheets'] = len(result['frames'])
+        if not frames:
+            result['error'] = _missing_columns_message()
+    except Exception as e:
+        result['error'] = f"读取文件时发生错误: {str(e)}"
+    return result
+
+
+def parse_files(paths, date=None, workers=None):
+    """并行解析多个工作簿，结果顺序与 paths 一致
+
+    workers 为 0 或只有一个文件时在当前进程中解析，None 表示使用 CPU 核心数。
+    """
+    paths = list(paths)
+    if workers == 0 or len(paths) <= 1:
+        return [parse_file(path, date) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(parse_file, paths, [date] * len(paths)))
+
+
+def collect_paths(inputs):
+    """展开命令行参数中的目录，返回排好序的 Excel 文件列表"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(os.path.join(item, name) for name in os.listdir(item)
+                                if name.lower().endswith(EXCEL_EXTENSIONS) and not name.startswith('~$')))
+        else:
+            paths.append(item)
+    return paths
+
+
+def main(argv=None):
+    from config import Config
+    from sites import SiteRegistry
+
+    parser = argparse.ArgumentParser(description='批量导入供应商报价表')
+    parser.add_argument('inputs', nargs='+', help='Excel 文件或包含 Excel 文件的目录')
+    parser.add_argument('--date', help='报价日期（文件中没有日期列时使用，默认取文件名中的日期）')
+    parser.add_argument('--workers', type=int, help='并行解析的进程数，默认为 CPU 核心数')
+    parser.add_argument('--site', help='导入到该站点引用的价格来源，默认为默认站点（见 sites.py）')
+    parser.add_argument('--data-dir', default=Config.DATA_DIR, help='数据目录，默认为 PRICE_DATA_DIR')
+    parser.add_argument('--storage', default=Config.PRICE_STORAGE, help='存储后端：csv / sqlite / parquet')
+    parser.add_argument('--storage-path', default=Config.PRICE_STORAGE_PATH,
+                        help='shared 价格来源的存储路径')
+    args = parser.parse_args(argv)
+
+    # 与网页使用同样的站点配置，命令行导入的数据写入站点实际使用的价格来源
+    sites = SiteRegistry(Config.SITES, args.data_dir, Config.SITE_PRICE_SOURCES, args.storage,
+                         args.storage_path, Config.ORDER_SESSION_TTL)
+    site = args.site or sites.default
+    if site not in sites:
+        print(f"未知的站点：{site}，可选：{', '.join(sites.names)}")
+        return 1
+
+    paths = collect_paths(args.inputs)
+    if not paths:
+        print('没有找到 Excel 文件')
+        return 1
+
+    tracker = sites.get(site).tracker
+    success, message = tracker.import_files(paths, date=args.date, workers=args.workers)
+    print(message)
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,284 @@
+"""运行指标、请求分析和日志
+
+- 指标：进程内的计数器和直方图，/metrics 按 Prometheus 文本格式输出。每个 worker 进程
+  各自统计，由 Prometheus 按实例分别抓取后汇总
+- timed：记录函数耗时的装饰器，用于 FoodPriceTracker 的方法
+- storage_read：记录存储读取次数和读取行数的装饰器，用于各存储后端
+- 请求分析：配置 PROFILING 后，带 X-Profile: 1 请求头的请求用 cProfile 分析，
+  结果保存到 PROFILE_DIR，可用 snakeviz 或 pstats 查看
+- configure_logging：分级日志，可输出为每行一个 JSON 对象
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 耗时直方图的分桶上限（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.label_names), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f'{self.name}{_labels(self.label_names, key)} {_number(value)}' for key, value in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # 标签 -> [各分桶计数, 总和, 次数]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count)
+                           in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, key, [("le", _number(bound))])} '
+                             f'{cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.label_names, key, [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, key)} {count}')
+        return lines
+
+
+class Collected:
+    """输出时才读取数值的指标，用于已有对象上的统计（例如页面缓存的命中次数）
+
+    collect 返回 [(标签字典, 数值)]。
+    """
+
+    def __init__(self, name, help, kind, collect):
+        self.name, self.help, self.kind, self.collect = name, help, kind, collect
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for labels, value in self.collect():
+            lines.append(f'{self.name}{_labels(list(labels), list(labels.values()))} {_number(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._metrics.get(name) or self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._metrics.get(name) or self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.histogram('http_request_duration_seconds', '请求处理耗时',
+                                     ('endpoint', 'method', 'status'))
+METHOD_SECONDS = REGISTRY.histogram('tracker_method_duration_seconds', 'FoodPriceTracker 方法耗时', ('method',))
+METHOD_ERRORS = REGISTRY.counter('tracker_method_errors_total', 'FoodPriceTracker 方法抛出异常的次数', ('method',))
+STORAGE_READS = REGISTRY.counter('storage_reads_total', '存储读取次数', ('backend', 'operation'))
+STORAGE_ROWS = REGISTRY.counter('storage_rows_read_total', '从存储读取的行数', ('backend', 'operation'))
+ROWS_SCANNED = REGISTRY.counter('rows_scanned_total', '查询扫描的行数', ('operation',))
+CACHE_REQUESTS = REGISTRY.counter('price_cache_requests_total', '内存缓存的读取次数，result 为 hit 或 miss',
+                                  ('cache', 'result'))
+
+
+def timed(func):
+    """记录方法的耗时和异常次数，标签为方法名"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            METHOD_ERRORS.inc(method=name)
+            raise
+        finally:
+            METHOD_SECONDS.observe(time.perf_counter() - start, method=name)
+    return wrapper
+
+
+def storage_read(operation):
+    """记录存储后端的读取次数和行数；被装饰的方法返回 DataFrame 或 DataFrame 块的迭代器"""
+    def decorator(func):
+        if operation == 'iter_chunks':
+            @functools.wraps(func)
+            def generator(self, *args, **kwargs):
+                STORAGE_READS.inc(backend=self.kind, operation=operation)
+                for chunk in func(self, *args, **kwargs):
+                    STORAGE_ROWS.inc(len(chunk), backend=self.kind, operation=operation)
+                    yield chunk
+            return generator
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            result = func(self, *args, **kwargs)
+            STORAGE_READS.inc(backend=self.kind, operation=operation)
+            STORAGE_ROWS.inc(len(result), backend=self.kind, operation=operation)
+            return result
+        return wrapper
+    return decorator
+
+
+def register_page_cache(cache, name='page'):
+    """把 LRUCache 自带的统计加入 /metrics"""
+    REGISTRY.register(Collected('page_cache_requests_total', '页面缓存的读取次数，result 为 hit 或 miss', 'counter',
+                                lambda: [({'cache': name, 'result': 'hit'}, cache.hits),
+                                         ({'cache': name, 'result': 'miss'}, cache.misses)]))
+    REGISTRY.register(Collected('page_cache_evictions_total', '页面缓存淘汰的条目数', 'counter',
+                                lambda: [({'cache': name}, cache.evictions)]))
+    REGISTRY.register(Collected('page_cache_entries', '页面缓存当前的条目数', 'gauge',
+                                lambda: [({'cache': name}, len(cache))]))
+    REGISTRY.register(Collected('page_cache_bytes', '页面缓存当前占用的字节数', 'gauge',
+                                lambda: [({'cache': name}, cache.size)]))
+
+
+def _profile_path(directory, endpoint):
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    return os.path.join(directory, f"{stamp}_{re.sub(r'[^A-Za-z0-9_.-]', '_', endpoint or 'unknown')}.prof")
+
+
+def init_app(app, profiling=False, profile_dir='profiles'):
+    """注册请求计时、按需分析和 /metrics"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g._request_start = time.perf_counter()
+        if profiling and request.headers.get('X-Profile') == '1':
+            g._profiler = cProfile.Profile()
+            g._profiler.enable()
+
+    @app.after_request
+    def _record_request(response):
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            path = _profile_path(profile_dir, request.endpoint)
+            profiler.dump_stats(path)
+            response.headers['X-Profile-File'] = os.path.basename(path)
+            logger.info('请求分析结果已保存', extra={'endpoint': request.endpoint, 'profile': path})
+        start = g.pop('_request_start', None)
+        if start is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=request.endpoint or 'unknown',
+                                    method=request.method, status=response.status_code)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，extra 中的字段一并输出"""
+
+    _RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self._RESERVED})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """文本格式，extra 中的字段以 key=value 附在消息后面"""
+
+    _RESERVED = JsonFormatter._RESERVED
+
+    def format(self, record):
+        text = super().format(record)
+        fields = ' '.join(f'{key}={value}' for key, value in vars(record).items() if key not in self._RESERVED)
+        return f'{text} {fields}' if fields else text
+
+
+def configure_logging(level='INFO', fmt='text'):
+    """配置根日志；fmt 为 text 或 json"""
+    handler = logging.StreamHandler()
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(KeyValueFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
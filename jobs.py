@@ -0,0 +1,155 @@
+"""后台导入任务队列
+
+上传的文件交给后台线程导入，请求立即返回任务编号。任务状态保存在 SQLite 表中，
+所有 worker 进程都能查询到同一份状态。每个进程只有一个导入线程，同一进程内的
+导入按提交顺序依次执行。
+
+执行任务的 worker 进程崩溃或被 gunicorn 超时杀掉后，任务会停在排队或运行状态。启动时和
+每次查询任务时检查任务所属的进程，进程已经退出的任务标记为失败。
+
+rows 在解析完成后为解析出的行数，导入完成后为实际写入的行数；quarantined 为未通过
+校验、放进隔离表的行数。
+"""
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _pid_alive(pid):
+    """判断进程是否还在运行（Windows 下无法安全探测，一律视为存活）"""
+    if os.name == 'nt' or not pid:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ImportJobQueue:
+    """导入任务队列"""
+
+    def __init__(self, tracker, db_path='import_jobs.db'):
+        self.tracker = tracker
+        self.db_path = os.path.abspath(db_path)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS import_jobs ('
+                'id TEXT PRIMARY KEY, status TEXT, filename TEXT, created_at TEXT, started_at TEXT, '
+                'finished_at TEXT, progress REAL, rows INTEGER, message TEXT, error TEXT, pid INTEGER, '
+                'quarantined INTEGER)')
+            # 旧版本创建的表没有 quarantined 列
+            if 'quarantined' not in [row[1] for row in conn.execute('PRAGMA table_info(import_jobs)')]:
+                conn.execute('ALTER TABLE import_jobs ADD COLUMN quarantined INTEGER')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_import_jobs_created ON import_jobs (created_at)')
+        self._fail_orphaned_jobs()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _get_executor(self):
+        # 线程池在第一次提交任务时才创建，避免在 fork 之前启动线程
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='import-job')
+            return self._executor
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE import_jobs SET {assignments} WHERE id = ?', [*fields.values(), job_id])
+
+    def _fail_orphaned_jobs(self, jobs=None):
+        """所属进程已经退出但仍处于排队或运行状态的任务标记为失败
+
+        jobs 为已经查询出的任务（dict 列表，会就地更新），默认检查全部未结束的任务。
+        """
+        if jobs is None:
+            with self._connect() as conn:
+                jobs = [dict(row) for row in conn.execute(
+                    'SELECT id, status, pid FROM import_jobs WHERE status IN (?, ?)', (QUEUED, RUNNING))]
+        for job in jobs:
+            if job['status'] in (QUEUED, RUNNING) and not _pid_alive(job['pid']):
+                fields = {'status': FAILED, 'finished_at': _now(), 'error': '执行任务的进程已退出，任务已中断'}
+                self._update(job['id'], **fields)
+                job.update(fields)
+        return jobs
+
+    def submit(self, path, filename=None, date=None, remove_file=True):
+        """提交导入任务，返回任务编号
+
+        remove_file 为 True 时，任务结束后删除上传的临时文件。
+        """
+        job_id = uuid.uuid4().hex[:12]
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO import_jobs (id, status, filename, created_at, progress, pid) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, QUEUED, filename or os.path.basename(path), _now(), 0.0, os.getpid()))
+        self._get_executor().submit(self._run, job_id, path, date, remove_file)
+        return job_id
+
+    def _run(self, job_id, path, date, remove_file):
+        self._update(job_id, status=RUNNING, started_at=_now(), message='正在导入')
+
+        def report(progress, message, rows=None, quarantined=None):
+            fields = {'progress': progress, 'message': message}
+            if rows is not None:
+                fields['rows'] = rows
+            if quarantined is not None:
+                fields['quarantined'] = quarantined
+            self._update(job_id, **fields)
+
+        try:
+            success, message = self.tracker.import_files([path], date=date, workers=0, progress=report)
+            if success:
+                self._update(job_id, status=SUCCEEDED, progress=1.0, message=message, finished_at=_now())
+            else:
+                self._update(job_id, status=FAILED, error=message, message='导入失败', finished_at=_now())
+        except Exception as e:
+            logger.exception('导入任务失败：%s', e, extra={'job_id': job_id})
+            self._update(job_id, status=FAILED, error=str(e), message='导入失败', finished_at=_now())
+        finally:
+            if remove_file and os.path.exists(path):
+                os.remove(path)
+
+    def get(self, job_id):
+        """查询任务状态，任务不存在时返回 None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._fail_orphaned_jobs([dict(row)])[0] if row else None
+
+    def recent(self, limit=5):
+        """最近提交的任务"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT * FROM import_jobs ORDER BY created_at DESC, rowid DESC LIMIT ?',
+                                (limit,)).fetchall()
+        return self._fail_orphaned_jobs([dict(row) for row in rows])
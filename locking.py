@@ -0,0 +1,156 @@
+"""跨进程写入协调
+
+- FileLock：基于锁文件的跨进程锁，支持共享锁（读）和排他锁（写），同一线程可重入
+- atomic_write：先写临时文件再原子替换，读取方不会看到写了一半的文件
+"""
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+class LockTimeout(Exception):
+    """等待锁超时"""
+
+
+class FileLock:
+    """跨进程文件锁
+
+    POSIX 下使用 fcntl.flock，支持共享锁；Windows 下使用 msvcrt.locking，
+    共享锁按排他锁处理。每个线程使用独立的文件句柄，因此同一进程内的
+    不同线程之间同样互斥。
+
+    同一线程重入时，持有排他锁可以再获取共享锁；持有共享锁时不能再获取排他锁
+    （flock 的升级不是原子的，其他进程可能在中间写入），此时抛出 RuntimeError。
+    """
+
+    def __init__(self, path, timeout=60):
+        self.path = os.path.abspath(path)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _try_lock(self, fd, shared):
+        try:
+            if os.name == 'nt':
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, shared=False, blocking=True):
+        """获取锁，非阻塞模式下拿不到锁时返回 False"""
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            if self._local.shared and not shared:
+                raise RuntimeError(f'持有共享锁时不能获取排他锁：{self.path}')
+            self._local.depth = depth + 1
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        delay = 0.001
+        while not self._try_lock(fd, shared):
+            if not blocking:
+                os.close(fd)
+                return False
+            if deadline is not None and time.monotonic() > deadline:
+                os.close(fd)
+                raise LockTimeout(f'等待锁超时：{self.path}')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        self._local.fd = fd
+        self._local.depth = 1
+        self._local.shared = shared
+        return True
+
+    def release(self):
+        depth = self._local.depth - 1
+        self._local.depth = depth
+        if depth:
+            return
+        fd = self._local.fd
+        try:
+            if os.name == 'nt':
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+            self._local.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    @contextmanager
+    def shared(self):
+        """共享锁，用于需要和写入方保持一致的读取"""
+        self.acquire(shared=True)
+        try:
+            yield self
+        finally:
+            self.release()
+
+
+def make_temp_file(path):
+    """在目标文件所在目录创建临时文件，返回 (fd, 路径)
+
+    临时文件的权限与目标文件一致（目标不存在时为 0644），替换后权限不变。
+    """
+    fd, tmp = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp',
+                               dir=os.path.dirname(path))
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+    os.chmod(tmp, mode)
+    return fd, tmp
+
+
+def replace_file(src, dst, retries=20):
+    # Windows 下目标文件正被其他进程打开时无法替换，稍等后重试
+    for attempt in range(retries):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if os.name != 'nt' or attempt == retries - 1:
+                raise
+            time.sleep(0.05)
+
+
+@contextmanager
+def atomic_write(path, mode='w', encoding='utf-8', newline=None):
+    """原子写入文件
+
+    内容先写到同目录下的临时文件并刷新到磁盘，成功后用 os.replace 替换目标文件；
+    写入过程中出错时目标文件保持不变。
+    """
+    path = os.path.abspath(path)
+    fd, tmp = make_temp_file(path)
+    try:
+        if 'b' in mode:
+            f = os.fdopen(fd, mode)
+        else:
+            f = os.fdopen(fd, mode, encoding=encoding, newline=newline)
+        with f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        replace_file(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
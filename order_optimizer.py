@@ -0,0 +1,144 @@
+"""按最低价拆分订单
+
+在最新价格快照上为每个品种选择报价最低的供应商，多个订单（例如每个厨房一份）
+一次计算：订单数量组成 (订单 × 品种) 矩阵，与快照的 (品种 × 供应商) 价格矩阵
+做数组运算得到每份订单的供应商选择、各供应商小计和单一供应商的总价。
+
+可选约束：
+- preferred / tolerance：首选供应商的价格不高于最低价的 (1 + tolerance) 倍时选首选供应商
+- min_order：{供应商: 最低起订金额}，某份订单分给某供应商的金额不足起订金额时，
+  把这些品种改由次低价的供应商供应；没有其他供应商报价的品种保留原供应商，
+  并在结果的 below_minimum 中列出
+"""
+from lazy_imports import lazy_module
+
+np = lazy_module('numpy')
+
+
+def _available_prices(snapshot):
+    # 缺失或为 0（缺货等无法解析的报价）的价格不可选
+    prices = snapshot.prices.copy()
+    prices[~(prices > 0)] = np.nan
+    return prices
+
+
+def _choose(cost):
+    """每个 (订单, 品种) 选价格最低的供应商，全部不可选时返回 -1"""
+    filled = np.where(np.isnan(cost), np.inf, cost)
+    choice = filled.argmin(axis=-1)
+    return np.where(np.isposinf(filled.min(axis=-1)), -1, choice)
+
+
+def optimize_orders(snapshot, baskets, min_order=None, preferred=None, tolerance=0.0):
+    """为多份订单选择供应商
+
+    baskets 为 {订单名称: {品种: 数量}}，返回 {订单名称: 结果}，结果包含：
+    - items：订单明细（品种、数量、单位、供应商、单价、小计）
+    - total：总价
+    - by_supplier：{供应商: 小计}
+    - single_supplier：{供应商: 全部从该供应商购买的总价}，该供应商缺少报价时为 None
+    - savings：相对于单一供应商的节省金额 {供应商: 金额}，无法由单一供应商供应时为 None
+    - missing：快照中没有价格的品种
+    - below_minimum：无法满足起订金额的供应商
+    """
+    suppliers = [col.removesuffix('价') for col in snapshot.price_columns]
+    if preferred is not None and preferred not in suppliers:
+        raise ValueError(f"未知的供应商：{preferred}，可选：{', '.join(suppliers)}")
+    unknown = set(min_order or {}) - set(suppliers)
+    if unknown:
+        raise ValueError(f"未知的供应商：{', '.join(sorted(unknown))}，可选：{', '.join(suppliers)}")
+
+    names = list(baskets)
+    # 所有订单中出现过的品种，按首次出现的顺序
+    items = list(dict.fromkeys(item for basket in baskets.values() for item in basket))
+    positions = np.array([snapshot.index.get(item, -1) for item in items], dtype=np.int64)
+    columns = {item: i for i, item in enumerate(items)}
+    quantities = np.zeros((len(names), len(items)))
+    for b, name in enumerate(names):
+        basket = baskets[name]
+        quantities[b, [columns[item] for item in basket]] = [float(qty) for qty in basket.values()]
+
+    prices = np.full((len(items), len(suppliers)), np.nan)
+    found = positions >= 0
+    prices[found] = _available_prices(snapshot)[positions[found]]
+
+    # (订单 × 品种 × 供应商) 的单价，不可选的供应商为 NaN
+    cost = np.broadcast_to(prices, (len(names),) + prices.shape).copy()
+    if preferred is not None:
+        # 首选供应商在容差范围内时视为最低价
+        p = suppliers.index(preferred)
+        best = np.nanmin(np.where(np.isnan(prices), np.inf, prices), axis=1)
+        prefer = prices[:, p] <= best * (1 + tolerance)
+        cost[:, prefer, p] = -np.inf
+
+    ordered = quantities > 0
+    choice = _choose(cost)
+    below_minimum = np.zeros((len(names), len(suppliers)), dtype=bool)
+    if min_order:
+        minimum = np.array([float(min_order.get(s, 0)) for s in suppliers])
+        # 每轮每份订单去掉一个金额最小且不足起订额的供应商，直到没有可调整的供应商
+        for _ in range(len(suppliers)):
+            subtotal = _subtotals(quantities, prices, choice, ordered, len(suppliers))
+            short = (subtotal > 0) & (subtotal < minimum) & ~below_minimum
+            if not short.any():
+                break
+            for b in np.flatnonzero(short.any(axis=1)):
+                s = np.where(short[b], subtotal[b], np.inf).argmin()
+                moved = ordered[b] & (choice[b] == s)
+                # 只能改由尚未去掉的供应商供应
+                alternatives = ~np.isnan(cost[b, moved])
+                alternatives[:, s] = False
+                if not alternatives.any(axis=1).all():
+                    # 有品种只能由该供应商供应，保留并记录
+                    below_minimum[b, s] = True
+                    continue
+                cost[b, :, s] = np.nan
+            choice = _choose(cost)
+        subtotal = _subtotals(quantities, prices, choice, ordered, len(suppliers))
+        below_minimum |= (subtotal > 0) & (subtotal < minimum)
+
+    chosen = choice >= 0
+    unit_price = np.where(chosen, prices[np.arange(len(items)), np.maximum(choice, 0)], np.nan)
+    line_total = quantities * unit_price
+    # 全部从单一供应商购买的总价（不含所有供应商都没有报价的品种），缺少报价时为 NaN
+    single = np.einsum('bi,is->bs', np.where(chosen, quantities, 0.0), np.nan_to_num(prices))
+    single_missing = ((ordered & chosen)[..., None] & np.isnan(prices)[None]).any(axis=1)
+    single[single_missing] = np.nan
+
+    results = {}
+    units = [snapshot.units[i] if i >= 0 else None for i in positions.tolist()]
+    # 价格都大于 0，分到金额的供应商就是订单用到的供应商
+    by_supplier = _subtotals(quantities, prices, choice, ordered, len(suppliers))
+    totals = by_supplier.sum(axis=1)
+    for b, name in enumerate(names):
+        rows = np.flatnonzero(ordered[b] & chosen[b])
+        # 先整体转换为 Python 列表，避免逐个读取数组元素
+        order_items = [
+            {'品种': items[i], '数量': q, '单位': units[i], '供应商': suppliers[s], '单价': p, '小计': t}
+            for i, q, s, p, t in zip(rows.tolist(), quantities[b, rows].tolist(), choice[b, rows].tolist(),
+                                     unit_price[b, rows].tolist(), line_total[b, rows].tolist())
+        ]
+        total = float(totals[b])
+        single_supplier = {s: (None if np.isnan(single[b, j]) else float(single[b, j]))
+                           for j, s in enumerate(suppliers)}
+        results[name] = {
+            'items': order_items,
+            'total': total,
+            'by_supplier': {s: float(by_supplier[b, j]) for j, s in enumerate(suppliers) if by_supplier[b, j] > 0},
+            'single_supplier': single_supplier,
+            'savings': {s: (None if value is None else value - total) for s, value in single_supplier.items()},
+            'missing': [items[i] for i in np.flatnonzero(ordered[b] & ~chosen[b]).tolist()],
+            'below_minimum': [suppliers[j] for j in np.flatnonzero(below_minimum[b]).tolist()],
+        }
+    return results
+
+
+def _subtotals(quantities, prices, choice, ordered, supplier_count):
+    """每份订单分给各供应商的金额，(订单 × 供应商)"""
+    valid = ordered & (choice >= 0)
+    picked = np.where(valid, choice, 0)
+    amount = np.where(valid, quantities * prices[np.arange(prices.shape[0]), picked], 0.0)
+    subtotal = np.zeros((quantities.shape[0], supplier_count))
+    rows = np.repeat(np.arange(quantities.shape[0]), quantities.shape[1])
+    np.add.at(subtotal, (rows, picked.ravel()), amount.ravel())
+    return subtotal
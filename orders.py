@@ -0,0 +1,350 @@
+"""订单历史
+
+订单保存在 SQLite 中，所有 worker 进程共享：
+- orders：每张订单一行，带自增编号；order_items：订单明细，按 (品种, 订单编号) 建索引
+- weekly_item_stats：每个品种每周的数量、金额和订单数，保存订单时在同一事务中累加
+- item_totals：每个品种累计的数量和金额，按金额建索引
+
+统计查询只读取汇总表，按周查询时读取的行数只取决于品种数和周数，和订单总数无关；
+取最近一张订单、按编号或品种查订单都走索引。
+
+OrderSessions 保存每个浏览器最近一次的订单（订单编号和各品种数量），cookie 中只保存
+一个随机令牌，请求头大小不随订单大小变化；过期的记录在写入时顺带清理。
+"""
+import json
+import os
+import secrets
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from lazy_imports import lazy_module
+
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    week TEXT NOT NULL,
+    supplier TEXT,
+    total REAL NOT NULL,
+    item_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at);
+CREATE TABLE IF NOT EXISTS order_items (
+    order_id INTEGER NOT NULL REFERENCES orders (id) ON DELETE CASCADE,
+    "品种" TEXT NOT NULL,
+    "单位" TEXT,
+    "供应商" TEXT,
+    "数量" REAL NOT NULL,
+    "单价" REAL,
+    "小计" REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id);
+CREATE INDEX IF NOT EXISTS idx_order_items_item ON order_items ("品种", order_id);
+CREATE TABLE IF NOT EXISTS weekly_item_stats (
+    "品种" TEXT NOT NULL,
+    week TEXT NOT NULL,
+    "数量" REAL NOT NULL,
+    "金额" REAL NOT NULL,
+    "订单数" INTEGER NOT NULL,
+    PRIMARY KEY ("品种", week)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_weekly_item_stats_week ON weekly_item_stats (week);
+CREATE TABLE IF NOT EXISTS item_totals (
+    "品种" TEXT PRIMARY KEY,
+    "数量" REAL NOT NULL,
+    "金额" REAL NOT NULL,
+    "订单数" INTEGER NOT NULL,
+    first_week TEXT NOT NULL,
+    last_week TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_item_totals_spend ON item_totals ("金额");
+'''
+
+_ITEM_FIELDS = ['品种', '单位', '供应商', '数量', '单价', '小计']
+
+
+def week_of(timestamp):
+    """时间（YYYY-MM-DD[ HH:MM:SS]）所在周的周一，格式为 YYYY-MM-DD"""
+    day = datetime.strptime(timestamp[:10], '%Y-%m-%d')
+    return (day - timedelta(days=day.weekday())).strftime('%Y-%m-%d')
+
+
+class OrderStore:
+    """订单历史和按周汇总的消耗统计"""
+
+    def __init__(self, db_path='orders.db'):
+        self.db_path = os.path.abspath(db_path)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON')
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, order_items, total=None, supplier=None, created_at=None):
+        """保存一张订单，同时累加汇总表，返回订单编号
+
+        order_items 中每项包含 品种、数量、单位、单价、小计，按最低价拆单时还有 供应商。
+        """
+        with self._connect() as conn:
+            return self._insert(conn, order_items, total, supplier, created_at)
+
+    @staticmethod
+    def _insert(conn, order_items, total=None, supplier=None, created_at=None):
+        """在调用方的事务中写入一张订单和汇总表，返回订单编号"""
+        created_at = created_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        week = week_of(created_at)
+        rows = [{field: item.get(field) for field in _ITEM_FIELDS} for item in order_items]
+        for row in rows:
+            row['供应商'] = row['供应商'] or supplier
+        if total is None:
+            total = sum(row['小计'] for row in rows)
+        # 同一张订单中重复的品种在汇总表中只计一次订单数
+        per_item = {}
+        for row in rows:
+            qty, spend, _ = per_item.get(row['品种'], (0.0, 0.0, 1))
+            per_item[row['品种']] = (qty + row['数量'], spend + row['小计'], 1)
+        stats = [(item, week, qty, spend, count) for item, (qty, spend, count) in per_item.items()]
+
+        order_id = conn.execute(
+            'INSERT INTO orders (created_at, week, supplier, total, item_count) VALUES (?, ?, ?, ?, ?)',
+            (created_at, week, supplier, float(total), len(rows))).lastrowid
+        conn.executemany(
+            'INSERT INTO order_items (order_id, "品种", "单位", "供应商", "数量", "单价", "小计") '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((order_id, *(row[field] for field in _ITEM_FIELDS)) for row in rows))
+        conn.executemany(
+            'INSERT INTO weekly_item_stats ("品种", week, "数量", "金额", "订单数") VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT ("品种", week) DO UPDATE SET "数量" = "数量" + excluded."数量", '
+            '"金额" = "金额" + excluded."金额", "订单数" = "订单数" + excluded."订单数"', stats)
+        conn.executemany(
+            'INSERT INTO item_totals ("品种", "数量", "金额", "订单数", first_week, last_week) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT ("品种") DO UPDATE SET "数量" = "数量" + excluded."数量", '
+            '"金额" = "金额" + excluded."金额", "订单数" = "订单数" + excluded."订单数", '
+            'first_week = min(first_week, excluded.first_week), '
+            'last_week = max(last_week, excluded.last_week)',
+            ((item, qty, spend, count, week, week) for item, week, qty, spend, count in stats))
+        return order_id
+
+    def _order(self, conn, row):
+        if row is None:
+            return None
+        items = conn.execute('SELECT "品种", "单位", "供应商", "数量", "单价", "小计" FROM order_items '
+                             'WHERE order_id = ? ORDER BY rowid', (row['id'],)).fetchall()
+        return {**dict(row), 'items': [dict(item) for item in items]}
+
+    def get(self, order_id):
+        """按编号取订单，包含明细；不存在时返回 None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM orders WHERE id = ?', (order_id,)).fetchone()
+            return self._order(conn, row)
+
+    def last(self):
+        """最近一张订单，没有订单时返回 None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM orders ORDER BY id DESC LIMIT 1').fetchone()
+            return self._order(conn, row)
+
+    def recent(self, limit=20, start=None, end=None):
+        """最近的订单（不含明细），start / end 为日期（YYYY-MM-DD，均包含在内）"""
+        where, params = [], []
+        if start:
+            where.append('created_at >= ?')
+            params.append(start)
+        if end:
+            where.append('created_at < ?')
+            params.append((datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d'))
+        clause = f"WHERE {' AND '.join(where)}" if where else ''
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT * FROM orders {clause} ORDER BY created_at DESC, id DESC LIMIT ?',
+                                (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def item_orders(self, food_item, limit=50):
+        """某个品种最近的订购记录"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT o.id AS order_id, o.created_at, i."单位", i."供应商", i."数量", i."单价", i."小计" '
+                'FROM order_items i JOIN orders o ON o.id = i.order_id '
+                'WHERE i."品种" = ? ORDER BY i.order_id DESC LIMIT ?', (food_item, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def weekly(self, food_item=None, start_week=None, end_week=None):
+        """按周汇总的数量和金额（DataFrame，列为 品种、周、数量、金额、订单数）"""
+        where, params = [], []
+        if food_item is not None:
+            where.append('"品种" = ?')
+            params.append(food_item)
+        if start_week:
+            where.append('week >= ?')
+            params.append(week_of(start_week))
+        if end_week:
+            where.append('week <= ?')
+            params.append(week_of(end_week))
+        clause = f"WHERE {' AND '.join(where)}" if where else ''
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT "品种", week AS "周", "数量", "金额", "订单数" FROM weekly_item_stats '
+                                f'{clause} ORDER BY "品种", week', params).fetchall()
+        return pd.DataFrame([dict(row) for row in rows], columns=['品种', '周', '数量', '金额', '订单数'])
+
+    def top_items(self, limit=10, start_week=None, end_week=None):
+        """金额最高的品种；不限定周时直接按累计金额索引读取"""
+        if start_week is None and end_week is None:
+            with self._connect() as conn:
+                rows = conn.execute('SELECT "品种", "数量", "金额", "订单数" FROM item_totals '
+                                    'ORDER BY "金额" DESC LIMIT ?', (limit,)).fetchall()
+            return [dict(row) for row in rows]
+        weekly = self.weekly(start_week=start_week, end_week=end_week)
+        totals = weekly.groupby('品种', as_index=False)[['数量', '金额', '订单数']].sum()
+        return totals.nlargest(limit, '金额').to_dict('records')
+
+    def spend_attribution(self, base_start, base_end, start, end):
+        """两个时期之间各品种花费变化的归因
+
+        平均单价 = 金额 / 数量；花费变化 = 价格影响 + 数量影响，其中
+        价格影响 = (本期单价 - 基期单价) × 本期数量，数量影响 = (本期数量 - 基期数量) × 基期单价。
+        只在一个时期出现的品种，变化全部计入数量影响。
+        """
+        def period(first, last):
+            weekly = self.weekly(start_week=first, end_week=last)
+            return weekly.groupby('品种')[['数量', '金额']].sum()
+
+        merged = period(base_start, base_end).join(period(start, end), how='outer',
+                                                    lsuffix='_基期', rsuffix='_本期').fillna(0.0)
+        q0, s0 = merged['数量_基期'].to_numpy(), merged['金额_基期'].to_numpy()
+        q1, s1 = merged['数量_本期'].to_numpy(), merged['金额_本期'].to_numpy()
+        p0 = np.divide(s0, q0, out=np.full(len(merged), np.nan), where=q0 > 0)
+        p1 = np.divide(s1, q1, out=np.full(len(merged), np.nan), where=q1 > 0)
+        both = (q0 > 0) & (q1 > 0)
+        price_effect = np.where(both, (np.nan_to_num(p1) - np.nan_to_num(p0)) * q1, 0.0)
+        result = pd.DataFrame({
+            '品种': merged.index,
+            '基期金额': s0,
+            '本期金额': s1,
+            '花费变化': s1 - s0,
+            '价格影响': price_effect,
+            '数量影响': (s1 - s0) - price_effect,
+            '基期单价': p0,
+            '本期单价': p1,
+        })
+        return result.sort_values('花费变化', key=np.abs, ascending=False, ignore_index=True)
+
+    def forecast(self, weeks=8, alpha=0.5, food_item=None, as_of=None):
+        """用最近 weeks 周的数量做指数平滑，预测下一周各品种的消耗量
+
+        没有订购的周按 0 计算。返回 DataFrame，列为 品种、预测数量、平均数量、最近一周数量。
+        """
+        last_week = week_of(as_of or datetime.now().strftime('%Y-%m-%d'))
+        first_week = (datetime.strptime(last_week, '%Y-%m-%d') - timedelta(weeks=weeks - 1)).strftime('%Y-%m-%d')
+        weekly = self.weekly(food_item, first_week, last_week)
+        columns = ['品种', '预测数量', '平均数量', '最近一周数量']
+        if weekly.empty:
+            return pd.DataFrame(columns=columns)
+        all_weeks = pd.date_range(first_week, periods=weeks, freq='7D').strftime('%Y-%m-%d')
+        matrix = weekly.pivot(index='品种', columns='周', values='数量').reindex(columns=all_weeks, fill_value=0.0)
+        matrix = matrix.fillna(0.0)
+        smoothed = matrix.T.ewm(alpha=alpha, adjust=False).mean().iloc[-1]
+        return pd.DataFrame({
+            '品种': matrix.index,
+            '预测数量': smoothed.to_numpy(),
+            '平均数量': matrix.mean(axis=1).to_numpy(),
+            '最近一周数量': matrix[all_weeks[-1]].to_numpy(),
+        }).sort_values('预测数量', ascending=False, ignore_index=True)
+
+    def is_empty(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT 1 FROM orders LIMIT 1').fetchone() is None
+
+    def import_csv(self, path, only_if_empty=False):
+        """导入旧版 order_history.csv，按 订单日期 分组为订单，返回导入的订单数
+
+        全部订单在一个事务中写入。only_if_empty 为 True 时只在还没有订单时导入，检查和写入
+        在同一个 BEGIN IMMEDIATE 事务中，多个 worker 进程同时启动时只有一个会导入。
+        """
+        df = pd.read_csv(path, encoding='utf-8')
+        count = 0
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if only_if_empty and conn.execute('SELECT 1 FROM orders LIMIT 1').fetchone() is not None:
+                return 0
+            for created_at, group in df.groupby('订单日期', sort=True):
+                items = group.drop(columns='订单日期').to_dict('records')
+                self._insert(conn, items, created_at=str(created_at))
+                count += 1
+        return count
+
+
+class OrderSessions:
+    """服务端保存的下单会话：令牌 -> (订单编号, {品种: 数量})，超过 ttl 秒未使用即过期"""
+
+    def __init__(self, db_path='orders.db', ttl=7 * 24 * 3600):
+        self.db_path = os.path.abspath(db_path)
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS order_sessions ('
+                         'token TEXT PRIMARY KEY, order_id INTEGER, payload BLOB NOT NULL, '
+                         'expires_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_order_sessions_expires ON order_sessions (expires_at)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def new_token():
+        return secrets.token_urlsafe(16)
+
+    @staticmethod
+    def _pack(quantities):
+        # 品种和数量分成两个数组，压缩后保存
+        data = json.dumps([list(quantities), list(quantities.values())], ensure_ascii=False,
+                          separators=(',', ':'))
+        return zlib.compress(data.encode('utf-8'))
+
+    @staticmethod
+    def _unpack(payload):
+        items, amounts = json.loads(zlib.decompress(payload).decode('utf-8'))
+        return dict(zip(items, amounts))
+
+    def put(self, token, order_id, quantities):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM order_sessions WHERE expires_at < ?', (now,))
+            conn.execute('INSERT OR REPLACE INTO order_sessions (token, order_id, payload, expires_at) '
+                         'VALUES (?, ?, ?, ?)', (token, order_id, self._pack(quantities), now + self.ttl))
+
+    def get(self, token):
+        """返回 (订单编号, {品种: 数量})，不存在或已过期时返回 None；读取时顺延过期时间"""
+        if not token:
+            return None
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute('SELECT order_id, payload FROM order_sessions '
+                               'WHERE token = ? AND expires_at >= ?', (token, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE order_sessions SET expires_at = ? WHERE token = ?', (now + self.ttl, token))
+        return row[0], self._unpack(row[1])
+
+    def delete(self, token):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM order_sessions WHERE token = ?', (token,))
@@ -0,0 +1,242 @@
+import threading
+from collections import defaultdict
+
+from config import Config
+from instrumentation import CACHE_REQUESTS
+from lazy_imports import lazy_module
+from rollups import PriceRollup
+from search import ItemSearchIndex
+from snapshot import LatestSnapshot
+from timeseries import PriceSeries
+from validation import PriceProfile
+
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+
+# 价格数据的基本列；其余列均为供应商价格列，列名为 <供应商名称>价
+BASE_COLUMNS = ['品种', '单位', '日期', '上传时间']
+
+# 导入时识别的供应商价格列（在配置中增减供应商）
+SUPPLIER_PRICE_COLUMNS = [f'{supplier}价' for supplier in Config.SUPPLIERS]
+
+# 价格数据文件的标准列
+PRICE_COLUMNS = ['品种', '单位'] + SUPPLIER_PRICE_COLUMNS + ['日期', '上传时间']
+
+# 读取 CSV 时固定各列类型，避免每次重新推断，也保证各进程读到的类型一致；
+# 文本列为 str，价格列（包括以后新增的供应商）一律先按 object 读入再清洗
+CSV_DTYPES = defaultdict(lambda: object, {col: str for col in BASE_COLUMNS})
+
+
+def supplier_name(price_column):
+    """价格列名对应的供应商名称，例如 康瑞达价 -> 康瑞达"""
+    return price_column.removesuffix('价')
+
+
+def price_columns_of(columns):
+    """列名中的供应商价格列：配置中的供应商在前，其余按出现顺序排在后面"""
+    extra = [col for col in columns if col not in BASE_COLUMNS and col not in SUPPLIER_PRICE_COLUMNS]
+    return [col for col in SUPPLIER_PRICE_COLUMNS if col in columns] + extra
+
+
+def frame_columns(price_columns):
+    """按标准顺序排列的全部列"""
+    return ['品种', '单位'] + list(price_columns) + ['日期', '上传时间']
+
+
+def normalize_frame(df):
+    """统一各后端读出的列顺序和列类型，缺失值统一为 NaN
+
+    配置中的供应商价格列总是存在（没有数据时为空列），存储中其他供应商的价格列原样保留。
+    """
+    columns = frame_columns(price_columns_of(SUPPLIER_PRICE_COLUMNS + list(df.columns)))
+    df = df.reindex(columns=columns).astype(object)
+    return df.where(df.notna(), np.nan).astype({col: CSV_DTYPES[col] for col in columns})
+
+
+def sort_latest_first(df):
+    """按日期和上传时间倒序排列（稳定排序，同一批次内保持原有顺序）"""
+    return df.sort_values(['日期', '上传时间'], ascending=[False, False],
+                          kind='mergesort', ignore_index=True)
+
+
+def clean_price_series(series):
+    """向量化清洗价格列
+
+    去掉数字和小数点以外的字符，出现多个小数点时只保留第一个；清洗后无法解析
+    的文本记为 0.0，缺失值保持为 NaN。
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+    result = pd.Series(np.nan, index=series.index, dtype='float64')
+    present = series.notna()
+    if not present.any():
+        return result
+    # 先做 NFKC 归一化，把全角数字和小数点转换为半角
+    text = series[present].astype(str).str.normalize('NFKC').str.replace(r'[^0-9.]', '', regex=True)
+    parts = text.str.partition('.')
+    text = parts[0] + parts[1] + parts[2].str.replace('.', '', regex=False)
+    result[present] = pd.to_numeric(text, errors='coerce').fillna(0.0).to_numpy()
+    return result
+
+
+def clean_price_columns(df):
+    """返回价格列已转换为 float64 的新表"""
+    return df.assign(**{col: clean_price_series(df[col]) for col in price_columns_of(df.columns)})
+
+
+def to_long_frame(df):
+    """把宽表转换为长表
+
+    品种、单位、供应商、日期、上传时间均为分类编码，价格为 float64，缺失的价格不占行。
+    行的先后顺序与宽表一致（已按日期、上传时间倒序时仍然倒序），
+    列 行号 为该行在宽表中的位置。
+    """
+    price_columns = price_columns_of(df.columns)
+    prices = df[price_columns].to_numpy(dtype='float64')
+    rows, cols = np.nonzero(~np.isnan(prices))
+    # 按 (行, 供应商) 顺序展开，保持宽表的行顺序
+    long = pd.DataFrame({
+        col: pd.Categorical(df[col].to_numpy()[rows])
+        for col in ['品种', '单位', '日期', '上传时间']
+    })
+    long.insert(2, '供应商', pd.Categorical.from_codes(
+        cols.astype(np.int16 if len(price_columns) < 2 ** 15 else np.int32),
+        categories=[supplier_name(col) for col in price_columns]))
+    long['价格'] = prices[rows, cols]
+    long['行号'] = rows.astype(np.int32)
+    return long
+
+
+class PriceStore:
+    """价格数据的进程内缓存
+
+    同一个存储后端在进程内只保留一份数据，所有读取方法共享。每次读取前检查
+    存储的版本标识（CSV 为文件修改时间、大小和 inode），只有数据发生变化
+    （包括其他 gunicorn worker 写入）或调用 invalidate() 后才重新加载。
+    加载时统一清洗价格列，缓存中的价格均为 float64。
+
+    返回的 DataFrame 为共享对象，调用方不应原地修改。
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._lock = threading.RLock()
+        self._frame = None
+        self._signature = None
+        # 基于当前数据计算的派生结构（索引、统计等），数据变化时清空
+        self._derived = {}
+
+    @classmethod
+    def for_storage(cls, storage):
+        """获取存储后端对应的共享缓存实例"""
+        with cls._instances_lock:
+            store = cls._instances.get(storage.key)
+            if store is None:
+                store = cls._instances[storage.key] = cls(storage)
+            return store
+
+    def _set_frame(self, frame, signature):
+        self._frame = frame
+        self._signature = signature
+        self._derived = {}
+
+    def get_frame(self):
+        """返回当前价格数据，没有数据时返回只有列名的空表"""
+        return self.versioned_frame()[0]
+
+    def versioned_frame(self):
+        """返回 (当前价格数据, 读取前的存储版本标识)
+
+        写入方在锁外基于这份数据做校验等准备工作，拿到锁后比较版本标识，确认期间没有其他写入。
+        """
+        signature = self.storage.signature()
+        with self._lock:
+            if self._frame is None or signature != self._signature:
+                CACHE_REQUESTS.inc(cache='frame', result='miss')
+                self._set_frame(clean_price_columns(self.storage.load()), signature)
+            else:
+                CACHE_REQUESTS.inc(cache='frame', result='hit')
+            return self._frame, self._signature
+
+    def derived(self, name, builder):
+        """返回基于当前数据计算的派生结构，同一版本的数据只计算一次"""
+        frame = self.get_frame()
+        with self._lock:
+            if self._frame is frame and name in self._derived:
+                CACHE_REQUESTS.inc(cache=name, result='hit')
+                return self._derived[name]
+            CACHE_REQUESTS.inc(cache=name, result='miss')
+            value = builder(frame)
+            if self._frame is frame:
+                self._derived[name] = value
+            return value
+
+    def get_item_index(self):
+        """品种 -> 该品种在缓存数据中的行号（已按日期、上传时间倒序）"""
+        return self.derived('item_index', lambda frame: frame.groupby('品种', sort=False).indices)
+
+    def get_price_columns(self):
+        """当前数据中的供应商价格列"""
+        return price_columns_of(self.get_frame().columns)
+
+    def get_long_frame(self):
+        """(品种, 单位, 供应商, 日期, 上传时间, 价格) 长表，每个有价格的 (记录, 供应商) 一行"""
+        return self.derived('long_frame', to_long_frame)
+
+    def get_rollup(self):
+        """当前数据对应的价格统计汇总"""
+        return self.derived('rollup', lambda frame: PriceRollup.build(frame, price_columns_of(frame.columns)))
+
+    def get_search_index(self):
+        """品种名称的搜索索引"""
+        return self.derived('search_index', lambda frame: ItemSearchIndex(frame['品种'].dropna().unique()))
+
+    def get_timeseries(self):
+        """按配置的周期重采样的价格时间序列和预测，没有数据时为 None"""
+        return self.derived('timeseries', lambda frame: PriceSeries.build(
+            frame, price_columns_of(frame.columns), Config.TIMESERIES_FREQ,
+            window=Config.TIMESERIES_WINDOW, horizon=Config.FORECAST_HORIZON))
+
+    def get_price_profile(self):
+        """各品种最近的单位和报价统计，用于导入校验"""
+        return self.derived('price_profile', lambda frame: PriceProfile.build(
+            frame, price_columns_of(frame.columns), depth=Config.OUTLIER_HISTORY))
+
+    def get_latest_snapshot(self):
+        """最新一期价格快照，没有数据时为 None"""
+        return self.derived('latest_snapshot',
+                            lambda frame: LatestSnapshot.build(frame, price_columns_of(frame.columns)))
+
+    def apply_import(self, df, signature_before, signature_after):
+        """把刚写入存储的新数据合并进缓存，避免重新读取全部数据
+
+        只有缓存正好对应写入前的版本时才能增量合并，否则直接丢弃缓存。
+        统计汇总、搜索索引和报价统计只合并新数据，其他派生结构在下次使用时重新计算。
+        其他线程可能仍在读取原来的派生结构，合并时都生成新对象再替换，不修改原对象。
+        """
+        with self._lock:
+            new_rows = clean_price_columns(normalize_frame(df))
+            # 新增了供应商时列结构发生变化，统计汇总也要按新的列重新生成
+            if (self._frame is None or self._signature != signature_before
+                    or not set(new_rows.columns).issubset(self._frame.columns)):
+                self.invalidate()
+                return
+            rollup = self._derived.get('rollup')
+            search_index = self._derived.get('search_index')
+            profile = self._derived.get('price_profile')
+            frame = sort_latest_first(pd.concat([self._frame, new_rows], ignore_index=True))
+            self._set_frame(frame, signature_after)
+            if rollup is not None:
+                self._derived['rollup'] = rollup.updated(new_rows)
+            if search_index is not None:
+                self._derived['search_index'] = search_index.added(new_rows['品种'].dropna().unique())
+            if profile is not None:
+                self._derived['price_profile'] = profile.update(new_rows, price_columns_of(new_rows.columns))
+
+    def invalidate(self):
+        """丢弃缓存，下次读取时重新加载"""
+        with self._lock:
+            self._set_frame(None, None)
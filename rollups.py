@@ -0,0 +1,157 @@
+"""按品种和供应商预先汇总的价格统计
+
+汇总分两层：
+- 总体统计：每个 (品种, 供应商) 的记录数、价格合计、最低价、最高价、最新价格和日期
+- 周期统计：每个 (品种, 供应商) 按周（周一日期，YYYY-MM-DD）和按月（YYYY-MM）
+  的记录数、合计、最低价、最高价
+
+全量数据只在缓存重新加载时汇总一次，之后每次导入只合并新数据。
+查询某个品种的统计是字典查找；区间查询只遍历该品种自己的周期，不扫描历史数据。
+"""
+import math
+
+from lazy_imports import lazy_module
+
+pd = lazy_module('pandas')
+
+FREQUENCIES = ('W', 'M')
+
+
+def _long_prices(df, price_columns):
+    """把各供应商价格列展开为 (品种, 供应商, 日期, 上传时间, 价格) 长表，去掉缺失价格"""
+    long = df.melt(id_vars=['品种', '日期', '上传时间'], value_vars=price_columns,
+                   var_name='供应商', value_name='价格')
+    dates = pd.to_datetime(long['日期'], errors='coerce')
+    valid = long['品种'].notna() & long['价格'].notna() & dates.notna()
+    long, dates = long[valid], dates[valid]
+    return long.assign(
+        W=(dates - pd.to_timedelta(dates.dt.weekday, unit='D')).dt.strftime('%Y-%m-%d'),
+        M=dates.dt.strftime('%Y-%m'),
+    )
+
+
+def _merge_stats(old, new):
+    """合并两组统计，返回新的字典（不修改原字典，读取方无需加锁）"""
+    if old is None:
+        return new
+    merged = {
+        'count': old['count'] + new['count'],
+        'sum': old['sum'] + new['sum'],
+        'min': min(old['min'], new['min']),
+        'max': max(old['max'], new['max']),
+    }
+    if 'last_price' in old:
+        latest = new if (new['last_date'], new['last_upload']) >= (old['last_date'], old['last_upload']) else old
+        merged.update(last_price=latest['last_price'], last_date=latest['last_date'],
+                      last_upload=latest['last_upload'])
+    return merged
+
+
+class PriceRollup:
+    """价格统计汇总表"""
+
+    def __init__(self, price_columns):
+        self.price_columns = list(price_columns)
+        # (品种, 供应商) -> 统计
+        self.totals = {}
+        # 周期 -> {(品种, 供应商) -> {周期值 -> 统计}}
+        self.periods = {freq: {} for freq in FREQUENCIES}
+        # 品种 -> 出现过的供应商
+        self.suppliers = {}
+
+    @classmethod
+    def build(cls, df, price_columns):
+        """从全部数据汇总"""
+        rollup = cls(price_columns)
+        rollup.update(df)
+        return rollup
+
+    def copy(self):
+        """浅复制汇总表
+
+        update 只整体替换各条统计，不修改统计本身，复制后更新不会影响原来的汇总表。
+        """
+        rollup = type(self)(self.price_columns)
+        rollup.totals = dict(self.totals)
+        rollup.periods = {freq: dict(table) for freq, table in self.periods.items()}
+        rollup.suppliers = dict(self.suppliers)
+        return rollup
+
+    def updated(self, df):
+        """合并一批新数据，返回新的汇总表（不修改原对象，读取方无需加锁）"""
+        rollup = self.copy()
+        rollup.update(df)
+        return rollup
+
+    def update(self, df):
+        """把一批新数据合并进汇总（原地修改），成本只和新数据量有关"""
+        long = _long_prices(df, self.price_columns)
+        if long.empty:
+            return
+
+        grouped = long.groupby(['品种', '供应商'], sort=False)['价格']
+        stats = grouped.agg(['count', 'sum', 'min', 'max'])
+        latest = (long.sort_values(['日期', '上传时间'], ascending=False, kind='mergesort')
+                  .drop_duplicates(['品种', '供应商'])
+                  .set_index(['品种', '供应商']))
+        stats = stats.join(latest[['价格', '日期', '上传时间']])
+        for (item, supplier), count, total, low, high, price, date, upload in stats.itertuples(name=None):
+            key = (item, supplier)
+            self.totals[key] = _merge_stats(self.totals.get(key), {
+                'count': int(count), 'sum': float(total), 'min': float(low), 'max': float(high),
+                'last_price': float(price), 'last_date': date, 'last_upload': upload,
+            })
+            if supplier not in self.suppliers.get(item, ()):
+                self.suppliers[item] = self.suppliers.get(item, ()) + (supplier,)
+
+        for freq in FREQUENCIES:
+            table = self.periods[freq]
+            period_stats = long.groupby(['品种', '供应商', freq], sort=False)['价格'].agg(
+                ['count', 'sum', 'min', 'max'])
+            updates = {}
+            for (item, supplier, period), count, total, low, high in period_stats.itertuples(name=None):
+                updates.setdefault((item, supplier), []).append((period, {
+                    'count': int(count), 'sum': float(total), 'min': float(low), 'max': float(high),
+                }))
+            for key, items in updates.items():
+                # 复制后整体替换，正在读取的请求不会看到更新了一半的数据
+                series = dict(table.get(key, {}))
+                for period, stats in items:
+                    series[period] = _merge_stats(series.get(period), stats)
+                table[key] = series
+
+    def item_stats(self, food_item):
+        """返回某个品种各供应商的总体统计：{供应商: 统计}"""
+        return {supplier: self.totals[(food_item, supplier)]
+                for supplier in self.suppliers.get(food_item, ())}
+
+    def range_stats(self, food_item, start=None, end=None, freq='M'):
+        """按周期查询某个品种的统计
+
+        start / end 为日期字符串（按月统计时只比较年月部分），均包含在内。
+        返回 {供应商: {'periods': [每个周期的统计], 'count', 'mean', 'min', 'max'}}。
+        """
+        if freq not in FREQUENCIES:
+            raise ValueError(f"不支持的统计周期：{freq}，可选：{', '.join(FREQUENCIES)}")
+        width = 7 if freq == 'M' else 10
+        start = start[:width] if start else None
+        end = end[:width] if end else None
+
+        result = {}
+        for supplier in self.suppliers.get(food_item, ()):
+            series = self.periods[freq].get((food_item, supplier), {})
+            periods = []
+            for period in sorted(series):
+                if (start and period < start) or (end and period > end):
+                    continue
+                stats = series[period]
+                periods.append({'周期': period, **stats, 'mean': round(stats['sum'] / stats['count'], 2)})
+            count = sum(p['count'] for p in periods)
+            result[supplier] = {
+                'periods': periods,
+                'count': count,
+                'mean': round(sum(p['sum'] for p in periods) / count, 2) if count else math.nan,
+                'min': min((p['min'] for p in periods), default=math.nan),
+                'max': max((p['max'] for p in periods), default=math.nan),
+            }
+        return result
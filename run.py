@@ -1,5 +1,7 @@
 from waitress import serve
-from app import app
+from app import app, warm_up
 
 if __name__ == '__main__':
-    serve(app, host='0.0.0.0', port=8000) 
\ No newline at end of file
+    # 先加载数据、建立缓存，第一个请求不必等待
+    warm_up()
+    serve(app, host='0.0.0.0', port=8000) 
@@ -0,0 +1,251 @@
+"""品种名称搜索
+
+品种名称中全角、半角括号混用，括号里常是别名，例如 小塘白菜（上海青）、绍菜(大白菜)。
+搜索前统一规范化名称：全角转半角、转小写、去掉空白，括号外的部分为主名称，
+括号内按顿号、逗号拆成别名。每个名称（主名称、别名）再生成拼音首字母，
+例如 上海青 -> shq。
+
+索引为 n-gram 倒排表（单字和相邻两字 -> 品种编号），查询时取各 n-gram 倒排表的
+交集作为候选，再按匹配方式排序：完全匹配、前缀、包含、拼音首字母，都不满足时
+按两字组的重合程度做模糊匹配（容许错别字）。导入新数据时只把新出现的品种加入索引。
+
+拼音首字母优先使用 pypinyin（能处理多音字），没有安装时按 GB2312 一级汉字的
+拼音排序区间推算，二级汉字不生成首字母。
+"""
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+# 匹配方式，按排序的先后
+EXACT, PREFIX, CONTAINS, PINYIN, FUZZY = '完全匹配', '前缀', '包含', '拼音', '模糊'
+_MATCHES = [EXACT, PREFIX, CONTAINS, PINYIN, FUZZY]
+_TIERS = {match: tier for tier, match in enumerate(_MATCHES)}
+
+# 模糊匹配时两字组重合程度（Dice 系数）的下限
+FUZZY_THRESHOLD = 0.5
+
+# GB2312 一级汉字按拼音排序，各声母首个汉字的区位码
+_GB2312_INITIALS = [
+    (0xB0A1, 'a'), (0xB0C5, 'b'), (0xB2C1, 'c'), (0xB4EE, 'd'), (0xB6EA, 'e'), (0xB7A2, 'f'),
+    (0xB8C1, 'g'), (0xB9FE, 'h'), (0xBBF7, 'j'), (0xBFA6, 'k'), (0xC0AC, 'l'), (0xC2E8, 'm'),
+    (0xC4C3, 'n'), (0xC5B6, 'o'), (0xC5BE, 'p'), (0xC6DA, 'q'), (0xC8BB, 'r'), (0xC8F6, 's'),
+    (0xCBFA, 't'), (0xCDDA, 'w'), (0xCEF4, 'x'), (0xD1B9, 'y'), (0xD4D1, 'z'), (0xD7FA, None),
+]
+_BRACKETS = str.maketrans({'【': '(', '】': ')', '〔': '(', '〕': ')', '[': '(', ']': ')'})
+_ALIAS_SEPARATORS = re.compile(r'[、,;]')
+
+
+def normalize(text):
+    """全角转半角、转小写、去掉空白，各种括号统一为圆括号"""
+    text = unicodedata.normalize('NFKC', str(text)).translate(_BRACKETS).lower()
+    return re.sub(r'\s+', '', text)
+
+
+def split_aliases(text):
+    """把规范化后的名称拆成 (主名称, [别名])"""
+    aliases = [alias for group in re.findall(r'\(([^()]*)\)', text)
+               for alias in _ALIAS_SEPARATORS.split(group) if alias]
+    main = re.sub(r'\([^()]*\)', '', text).strip('()')
+    return main, aliases
+
+
+def _gb2312_initial(char):
+    try:
+        code = char.encode('gb2312')
+    except UnicodeEncodeError:
+        return None
+    if len(code) != 2:
+        return None
+    code = code[0] << 8 | code[1]
+    for (start, letter), (end, _) in zip(_GB2312_INITIALS, _GB2312_INITIALS[1:]):
+        if start <= code < end:
+            return letter
+    return None
+
+
+def _initials_backend():
+    try:
+        from pypinyin import Style, lazy_pinyin
+    except ImportError:
+        return lambda text: [_gb2312_initial(char) for char in text]
+    return lambda text: [syllable[:1] if '一' <= char <= '鿿' else None
+                         for char, syllable in zip(text, lazy_pinyin(text, style=Style.FIRST_LETTER,
+                                                                     errors=lambda s: list(s)))]
+
+
+_initials = _initials_backend()
+
+
+def pinyin_initials(text):
+    """名称的拼音首字母，例如 上海青 -> shq；字母和数字原样保留，其余字符忽略"""
+    letters = []
+    for char, initial in zip(text, _initials(text)):
+        if char.isascii() and char.isalnum():
+            letters.append(char)
+        elif initial:
+            letters.append(initial)
+    return ''.join(letters)
+
+
+def _grams(text):
+    """单字和相邻两字"""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+class ItemSearchIndex:
+    """品种名称的搜索索引"""
+
+    def __init__(self, names=()):
+        self.names = []
+        self._ids = {}
+        # 品种编号 -> [(规范化文本, 拼音首字母, 是否别名)]
+        self._keys = []
+        # 规范化后的完整名称 -> 品种编号，用于把写法不同的名称对应到原名称
+        self._normalized = defaultdict(list)
+        # n-gram -> 品种编号集合（包含名称和拼音首字母的 n-gram）
+        self._postings = defaultdict(set)
+        # 只属于本索引、可以原地修改的倒排表；其余的倒排表可能和复制出的索引共用
+        self._owned = set()
+        self.add(names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def copy(self):
+        """复制索引
+
+        倒排表的集合不复制，两个索引共用，之后任何一方 add 修改某个倒排表时才复制该集合；
+        因此复制的成本只和品种、n-gram 的数量有关，和倒排表的总长度无关。
+        """
+        index = type(self)()
+        index.names = list(self.names)
+        index._ids = dict(self._ids)
+        index._keys = list(self._keys)
+        index._normalized = defaultdict(list, {key: list(ids) for key, ids in self._normalized.items()})
+        index._postings = defaultdict(set, self._postings)
+        self._owned = set()
+        return index
+
+    def added(self, names):
+        """加入新的品种，返回新的索引（不修改原对象，读取方无需加锁）；没有新品种时返回原对象"""
+        names = [name for name in names if isinstance(name, str) and name and name not in self._ids]
+        if not names:
+            return self
+        index = self.copy()
+        index.add(names)
+        return index
+
+    def add(self, names):
+        """加入新的品种（原地修改），已有的品种忽略；返回新加入的数量
+
+        其他线程可能正在查询时，用 added 生成新的索引再替换。
+        """
+        added = 0
+        for name in names:
+            if not isinstance(name, str) or not name or name in self._ids:
+                continue
+            item_id = len(self.names)
+            text = normalize(name)
+            main, aliases = split_aliases(text)
+            keys = [(text, '', False)]
+            keys += [(key, pinyin_initials(key), is_alias)
+                     for key, is_alias in [(main, False), *((alias, True) for alias in aliases)] if key]
+            for key, initials, _ in keys:
+                for gram in _grams(key) | (_grams(initials) if initials else set()):
+                    if gram not in self._owned:
+                        self._postings[gram] = set(self._postings.get(gram, ()))
+                        self._owned.add(gram)
+                    self._postings[gram].add(item_id)
+            self._keys.append(keys)
+            self._normalized[text].append(item_id)
+            self._ids[name] = item_id
+            self.names.append(name)
+            added += 1
+        return added
+
+    def resolve(self, name):
+        """按规范化后的名称查找原名称，例如 小塘白菜(上海青) -> 小塘白菜（上海青）
+
+        找不到或对应多个品种时返回 None。
+        """
+        if name in self._ids:
+            return name
+        ids = self._normalized.get(normalize(name), [])
+        return self.names[ids[0]] if len(ids) == 1 else None
+
+    def search(self, query, limit=10, where=None):
+        """搜索品种，返回按匹配程度排序的 [{'品种': 名称, '匹配': 匹配方式}]
+
+        where 为可选的过滤条件 where(名称) -> bool，例如只返回最新一期有报价的品种。
+        """
+        query = normalize(query)
+        if not query or limit <= 0:
+            return []
+        grams = _grams(query) if len(query) <= 2 else _bigrams(query)
+        postings = [self._postings.get(gram, set()) for gram in grams]
+        candidates = set.intersection(*postings)
+
+        # 过滤条件在排序前应用，被过滤掉的品种不计入候选数量，模糊匹配的补充才不会被跳过
+        def allowed(item_id):
+            return where is None or where(self.names[item_id])
+
+        ranked = []
+        for item_id in candidates:
+            match = self._match(item_id, query)
+            if match is not None and allowed(item_id):
+                ranked.append((match, item_id))
+        if len(ranked) < limit and len(query) > 2:
+            # 候选不足时按两字组的重合程度补充模糊匹配的结果
+            overlap = Counter()
+            for posting in postings:
+                overlap.update(posting - candidates)
+            # Dice 系数达到下限时，重合的两字组至少有这么多
+            needed = FUZZY_THRESHOLD * len(grams) / (2 - FUZZY_THRESHOLD)
+            for item_id, count in overlap.items():
+                if count >= needed and allowed(item_id):
+                    score = self._similarity(item_id, query)
+                    if score >= FUZZY_THRESHOLD:
+                        ranked.append(((_TIERS[FUZZY], 1 - score), item_id))
+
+        results = []
+        for (tier, _), item_id in sorted(ranked, key=lambda entry: (entry[0], len(self.names[entry[1]]),
+                                                                    self.names[entry[1]])):
+            results.append({'品种': self.names[item_id], '匹配': _MATCHES[tier]})
+            if len(results) >= limit:
+                break
+        return results
+
+    def _match(self, item_id, query):
+        """候选品种的匹配方式，返回 (排序等级, 别名匹配为 1) 或 None"""
+        best = None
+        for key, initials, is_alias in self._keys[item_id]:
+            if key == query:
+                tier = EXACT
+            elif key.startswith(query):
+                tier = PREFIX
+            elif query in key:
+                tier = CONTAINS
+            elif initials and query in initials:
+                tier = PINYIN
+            else:
+                continue
+            rank = (_TIERS[tier], int(is_alias) if tier != PINYIN else int(not initials.startswith(query)))
+            if best is None or rank < best:
+                best = rank
+        return best
+
+    def _similarity(self, item_id, query):
+        """查询与品种各名称两字组的最大 Dice 系数"""
+        query_grams = _bigrams(query)
+        best = 0.0
+        for key, _, _ in self._keys[item_id]:
+            key_grams = _bigrams(key)
+            best = max(best, 2 * len(query_grams & key_grams) / (len(query_grams) + len(key_grams)))
+        return best
@@ -0,0 +1,292 @@
+"""导入批次的版本快照
+
+每次导入写入存储的同时保存为一个不可变的分段（<存储路径>.segments/ 目录下）：
+- <编号>.csv：该批次的全部记录，按品种、日期倒序排列
+- <编号>.index.json：{"items": 品种 -> 该品种在分段中的行范围 [起, 止),
+  "dates": 日期 -> 该日期的记录所在的行范围列表 [[起, 止), ...]}
+- manifest.json：所有分段按导入顺序排列的清单，记录上传时间、行数、日期范围、是否有效，
+  以及有效标记的修改记录 history（[{seq, active, 时间}]，seq 在整个清单中递增，
+  分段的第一条记录为导入时的序号）
+
+分段一经写入不再修改，按文件缓存在进程内。查询某次导入时的数据（时间点查询）只读取
+需要的分段：最新价格快照只读包含当时最新日期的分段，品种历史只读索引中有该品种的分段，
+不必重新读取、排序全部历史数据。
+
+每次导入的记录同时保存在存储后端和分段中，分段目录占用的磁盘空间与价格数据本身相当
+（约为原来的两倍）；分段文件不会自动删除，需要回收空间时可以删除整个目录，下次使用时
+按存储中现有的数据重新拆分（之前回滚的批次和修改记录随之丢失）。
+
+回滚和恢复只修改清单中的有效标记，然后只处理有变化的批次：回滚从存储中删除这些批次
+的记录（按上传时间），恢复把分段中的记录重新追加到存储，都不需要重新生成全部数据；
+清空数据也是把所有分段标记为无效，之后仍可恢复。时间点查询包含该批次本身和它之前在该批次导入
+时有效的批次：按修改记录判断，之后的回滚、恢复不影响过去某次导入时的数据。
+"""
+import functools
+import json
+import os
+import uuid
+from datetime import datetime
+
+from lazy_imports import lazy_module
+from locking import atomic_write
+from price_store import CSV_DTYPES, clean_price_columns, frame_columns, normalize_frame, price_columns_of
+
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+
+# 进程内缓存的分段数
+SEGMENT_CACHE_SIZE = 64
+# 没有上传时间的旧数据所在分段的编号前缀
+LEGACY = 'legacy'
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _active_at(segment, seq):
+    """序号 seq 时分段是否有效（该序号及之前最后一次修改的结果）"""
+    active = False
+    for change in segment['history']:
+        if change['seq'] > seq:
+            break
+        active = change['active']
+    return active
+
+
+@functools.lru_cache(maxsize=SEGMENT_CACHE_SIZE)
+def _load_segment(path):
+    # 分段文件不会被修改，按路径缓存即可；返回的 DataFrame 为共享对象，调用方不应原地修改
+    return clean_price_columns(normalize_frame(pd.read_csv(path, encoding='utf-8', dtype=CSV_DTYPES)))
+
+
+@functools.lru_cache(maxsize=SEGMENT_CACHE_SIZE * 4)
+def _load_index(path):
+    with open(path, encoding='utf-8') as f:
+        index = json.load(f)
+    # 早期的索引文件只有品种的行范围
+    if not isinstance(index.get('items'), dict):
+        index = {'items': index, 'dates': None}
+    return index
+
+
+def _ranges(values):
+    """按值连续的行范围：值 -> [[起, 止), ...]，缺失值不记录"""
+    if not len(values):
+        return {}
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    ends = np.r_[starts[1:], len(values)]
+    ranges = {}
+    for value, start, end in zip(values[starts].tolist(), starts.tolist(), ends.tolist()):
+        if isinstance(value, str):
+            ranges.setdefault(value, []).append([start, end])
+    return ranges
+
+
+class SegmentStore:
+    """导入批次的分段和清单
+
+    prepare、split 只写入新的分段文件，不修改清单，可以在锁外调用；修改清单的方法
+    （add、create、set_active）由调用方在存储的排他锁内调用。
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.manifest_path = os.path.join(self.path, 'manifest.json')
+        self._cached = None
+        self._cached_stat = None
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def segments(self):
+        """按导入顺序排列的分段清单，按文件状态缓存"""
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return []
+        stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stat != self._cached_stat:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                segments = json.load(f)['segments']
+            for position, segment in enumerate(segments):
+                # 早期的清单没有修改记录：按导入顺序编号，已回滚的记为在最后回滚
+                if 'history' not in segment:
+                    segment['history'] = [{'seq': position, 'active': True, '时间': segment['上传时间']}]
+                    if not segment['active']:
+                        segment['history'].append({'seq': len(segments), 'active': False, '时间': None})
+            self._cached, self._cached_stat = segments, stat
+        return self._cached
+
+    def get(self, segment_id):
+        """编号对应的分段，不存在时抛出 KeyError"""
+        for segment in self.segments():
+            if segment['id'] == segment_id:
+                return segment
+        raise KeyError(f'未找到导入批次：{segment_id}')
+
+    @staticmethod
+    def _next_seq(segments):
+        return max((change['seq'] for segment in segments for change in segment['history']), default=-1) + 1
+
+    def _save(self, segments):
+        os.makedirs(self.path, exist_ok=True)
+        with atomic_write(self.manifest_path) as f:
+            json.dump({'segments': segments}, f, ensure_ascii=False, indent=1)
+
+    def _write(self, df, uploaded_at):
+        """把一批记录写成分段文件，返回清单条目；uploaded_at 为 None 表示没有上传时间的旧数据"""
+        os.makedirs(self.path, exist_ok=True)
+        prefix = LEGACY if uploaded_at is None else uploaded_at.replace('-', '').replace(' ', 'T').replace(':', '')
+        segment_id = f"{prefix}-{uuid.uuid4().hex[:6]}"
+        df = df.reindex(columns=frame_columns(price_columns_of(df.columns)))
+        df = df.sort_values(['品种', '日期'], ascending=[True, False], kind='mergesort', ignore_index=True)
+        with atomic_write(os.path.join(self.path, f'{segment_id}.csv'), newline='') as f:
+            df.to_csv(f, index=False, lineterminator='\n')
+        # 记录已按品种排序，每个品种的行是连续的一段；同一品种内按日期排序，
+        # 每个日期的记录是按品种分开的若干段
+        ranges = {item: runs[0] for item, runs in _ranges(df['品种'].to_numpy(dtype=object)).items()}
+        dates = _ranges(df['日期'].to_numpy(dtype=object))
+        with atomic_write(os.path.join(self.path, f'{segment_id}.index.json')) as f:
+            # 整体编码比 json.dump 逐段写入快得多
+            f.write(json.dumps({'items': ranges, 'dates': dates}, ensure_ascii=False))
+        return {'id': segment_id, '上传时间': uploaded_at, 'rows': len(df), 'items': len(ranges),
+                '起始日期': df['日期'].min() if len(df) else None,
+                '结束日期': df['日期'].max() if len(df) else None, 'active': True}
+
+    def prepare(self, df, uploaded_at):
+        """把一次导入写成分段文件，返回还没有加入清单的清单条目"""
+        return self._write(df, uploaded_at)
+
+    def add(self, segment):
+        """把 prepare 写好的分段加入清单"""
+        segments = self.segments()
+        segment = dict(segment, history=[{'seq': self._next_seq(segments), 'active': True, '时间': _now()}])
+        self._save(segments + [segment])
+        return segment
+
+    def discard(self, segments):
+        """删除没有加入清单的分段文件"""
+        for segment in segments:
+            for suffix in ('.csv', '.index.json'):
+                try:
+                    os.remove(os.path.join(self.path, f"{segment['id']}{suffix}"))
+                except FileNotFoundError:
+                    pass
+
+    def split(self, frame):
+        """把已有数据按上传时间写成分段文件，返回还没有加入清单的清单条目
+
+        旧版本的数据中有的行没有上传时间，这些行放进排在最前面的一个分段，不会丢失。
+        """
+        missing = frame['上传时间'].isna()
+        segments = [self._write(frame[missing], None)] if missing.any() else []
+        segments += [self._write(part, uploaded_at)
+                     for uploaded_at, part in frame[~missing].groupby('上传时间', sort=True)]
+        if sum(segment['rows'] for segment in segments) != len(frame):
+            self.discard(segments)
+            raise RuntimeError('拆分导入批次时行数不一致，已停止')
+        return segments
+
+    def create(self, segments):
+        """没有清单时，用 split 写好的分段创建清单（只在第一次使用时调用一次）"""
+        segments = [dict(segment, history=[{'seq': seq, 'active': True, '时间': segment['上传时间']}])
+                    for seq, segment in enumerate(segments)]
+        self._save(segments)
+        return segments
+
+    def set_active(self, segment_ids, active):
+        """修改分段的有效标记并记录修改，返回修改了的分段（清单条目）"""
+        segment_ids = set(segment_ids)
+        segments = [dict(segment) for segment in self.segments()]
+        change = {'seq': self._next_seq(segments), 'active': active, '时间': _now()}
+        changed = []
+        for segment in segments:
+            if segment['id'] in segment_ids and segment['active'] != active:
+                segment['active'] = active
+                segment['history'] = segment['history'] + [change]
+                changed.append(segment)
+        if changed:
+            self._save(segments)
+        return changed
+
+    def read(self, segment_id):
+        """分段中的全部记录（按品种、日期倒序）"""
+        self.get(segment_id)
+        return _load_segment(os.path.join(self.path, f'{segment_id}.csv'))
+
+    def view(self, segment_id):
+        """某次导入时的数据包含的分段：该批次本身和它之前在导入时有效的批次，按导入顺序排列"""
+        segments = self.segments()
+        for position, segment in enumerate(segments):
+            if segment['id'] == segment_id:
+                seq = segment['history'][0]['seq']
+                return [s for s in segments[:position] if _active_at(s, seq)] + [segment]
+        raise KeyError(f'未找到导入批次：{segment_id}')
+
+    def latest_rows(self, segment_id):
+        """某次导入时最新日期的记录（按上传先后倒序），用于生成当时的最新价格快照"""
+        segments = [s for s in self.view(segment_id) if s['rows']]
+        if not segments:
+            return None
+        date = max(s['结束日期'] for s in segments)
+        frames = []
+        for segment in reversed(segments):
+            if not segment['起始日期'] <= date <= segment['结束日期']:
+                continue
+            dates = self._index(segment['id'])['dates']
+            if dates is None:
+                df = self.read(segment['id'])
+                frames.append(df[df['日期'] == date])
+            elif date in dates:
+                positions = np.concatenate([np.arange(start, end) for start, end in dates[date]])
+                frames.append(self.read(segment['id']).iloc[positions])
+        return pd.concat(frames, ignore_index=True)
+
+    def item_rows(self, food_item, segment_id):
+        """某次导入时某个品种的全部记录，按日期、导入先后倒序"""
+        frames = []
+        for segment in reversed(self.view(segment_id)):
+            rows = self._index(segment['id'])['items'].get(food_item)
+            if rows is not None:
+                frames.append(self.read(segment['id']).iloc[rows[0]:rows[1]])
+        if not frames:
+            return None
+        df = pd.concat(frames, ignore_index=True)
+        return df.sort_values('日期', ascending=False, kind='mergesort', ignore_index=True)
+
+    def _index(self, segment_id):
+        return _load_index(os.path.join(self.path, f'{segment_id}.index.json'))
+
+    def frame(self, segments):
+        """多个分段的全部记录，按给出的顺序合并；没有记录时返回 None"""
+        frames = [self.read(segment['id']) for segment in segments if segment['rows']]
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+
+def diff_segments(old, new, price_columns):
+    """比较两次导入，每个品种一行（各取该批次中日期最新的一条）
+
+    列为 品种、单位、各价格列的 _前 / _后 / _变化，以及 状态（新增 / 删除 / 变化 / 相同）。
+    """
+    old = old.drop_duplicates('品种').set_index('品种')
+    new = new.drop_duplicates('品种').set_index('品种')
+    items = old.index.union(new.index)
+    in_old, in_new = items.isin(old.index), items.isin(new.index)
+    old, new = old.reindex(items), new.reindex(items)
+    result = pd.DataFrame({'品种': items, '单位': new['单位'].fillna(old['单位']).to_numpy()})
+    changed = pd.Series(False, index=items)
+    for col in price_columns:
+        before = old[col] if col in old else pd.Series(float('nan'), index=items)
+        after = new[col] if col in new else pd.Series(float('nan'), index=items)
+        result[f'{col}_前'] = before.to_numpy()
+        result[f'{col}_后'] = after.to_numpy()
+        result[f'{col}_变化'] = (after - before).round(2).to_numpy()
+        changed |= ~((before == after) | (before.isna() & after.isna()))
+    result['状态'] = '相同'
+    result.loc[changed.to_numpy(), '状态'] = '变化'
+    result.loc[~in_old, '状态'] = '新增'
+    result.loc[~in_new, '状态'] = '删除'
+    return result
@@ -0,0 +1,141 @@
+"""多站点（食堂）
+
+一个部署可以服务多个食堂，每个食堂是一个站点：
+- 订单和下单会话属于站点，保存在 DATA_DIR/sites/<站点>/ 下
+- 供应商报价由多个食堂共用，按价格来源只保存一份，站点通过配置引用价格来源（默认都引用 shared）。
+  价格来源包括价格数据、数据版本、提醒规则、价格提醒和导入任务；shared 的文件在 DATA_DIR 下，
+  其他价格来源在 DATA_DIR/prices/<价格来源>/ 下
+
+默认站点（SITES 中的第一个，没有配置时为 default）直接使用 DATA_DIR 下的订单数据，
+单站点部署不需要迁移任何文件。
+
+站点按 URL 前缀区分：/sites/<站点>/... 为该站点的页面和接口，其他地址属于默认站点。
+各站点的组件在第一次收到该站点的请求时才创建；引用同一价格来源的站点在进程内共享
+同一份价格缓存（PriceStore 按存储路径共享）和同一个导入队列。
+"""
+import os
+import threading
+
+from food_price_tracker import FoodPriceTracker
+from jobs import ImportJobQueue
+from orders import OrderSessions
+from storage import DEFAULT_PATHS, create_storage
+
+DEFAULT_SITE = 'default'
+SHARED = 'shared'
+# URL 前缀和 WSGI environ 中记录站点名称的键
+PREFIX = '/sites/'
+ENVIRON_KEY = 'food_price.site'
+
+
+class Site:
+    """一个站点的组件"""
+
+    def __init__(self, name, price_source, tracker, job_queue, order_sessions):
+        self.name = name
+        self.price_source = price_source
+        self.tracker = tracker
+        self.job_queue = job_queue
+        self.order_sessions = order_sessions
+
+
+class SiteRegistry:
+    """站点的配置和已创建的组件"""
+
+    def __init__(self, names=(), data_dir='.', price_sources=None, storage_kind='csv', storage_path=None,
+                 session_ttl=7 * 24 * 3600):
+        self.names = list(names) or [DEFAULT_SITE]
+        self.default = self.names[0]
+        self.data_dir = os.path.abspath(data_dir)
+        # 站点 -> 价格来源，没有列出的站点使用 shared
+        self.price_sources = dict(price_sources or {})
+        self.storage_kind = storage_kind
+        # 只用于 shared 价格来源，不设置时使用存储后端的默认文件名
+        self.storage_path = storage_path
+        self.session_ttl = session_ttl
+        self._sites = {}
+        self._job_queues = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.SITES, config.DATA_DIR, config.SITE_PRICE_SOURCES, config.PRICE_STORAGE,
+                   config.PRICE_STORAGE_PATH, config.ORDER_SESSION_TTL)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def price_source(self, name):
+        return self.price_sources.get(name, SHARED)
+
+    def site_dir(self, name):
+        """站点的订单数据目录"""
+        return self.data_dir if name == self.default else os.path.join(self.data_dir, 'sites', name)
+
+    def price_dir(self, source):
+        """价格来源的数据目录"""
+        return self.data_dir if source == SHARED else os.path.join(self.data_dir, 'prices', source)
+
+    def get(self, name):
+        """站点的组件，第一次使用时创建；没有配置该站点时抛出 KeyError"""
+        site = self._sites.get(name)
+        if site is not None:
+            return site
+        if name not in self:
+            raise KeyError(name)
+        with self._lock:
+            site = self._sites.get(name)
+            if site is None:
+                site = self._sites[name] = self._create(name)
+            return site
+
+    def _create(self, name):
+        source = self.price_source(name)
+        site_dir, price_dir = self.site_dir(name), self.price_dir(source)
+        os.makedirs(site_dir, exist_ok=True)
+        os.makedirs(price_dir, exist_ok=True)
+        if source == SHARED and self.storage_path:
+            storage_path = self.storage_path
+        else:
+            storage_path = os.path.join(price_dir, DEFAULT_PATHS[self.storage_kind])
+        tracker = FoodPriceTracker(storage=create_storage(self.storage_kind, storage_path),
+                                   data_dir=site_dir, price_dir=price_dir)
+        # 导入写入的是价格来源的数据，引用同一价格来源的站点共用一个导入队列
+        job_queue = self._job_queues.get(source)
+        if job_queue is None:
+            job_queue = self._job_queues[source] = ImportJobQueue(tracker, os.path.join(price_dir, 'import_jobs.db'))
+        return Site(name, source, tracker, job_queue, OrderSessions(tracker.orders.db_path, ttl=self.session_ttl))
+
+    def warm_up(self):
+        """预热各价格来源的缓存，每个价格来源只预热一次，返回各步骤的耗时之和（毫秒）"""
+        timings = {}
+        sources = set()
+        for name in self.names:
+            source = self.price_source(name)
+            if source in sources:
+                continue
+            sources.add(source)
+            for step, elapsed in self.get(name).tracker.warm_up().items():
+                timings[step] = timings.get(step, 0.0) + elapsed
+        return timings
+
+
+class SiteDispatcher:
+    """WSGI 中间件：把 /sites/<站点> 前缀移到 SCRIPT_NAME，站点名称记在 environ 中
+
+    视图中 url_for 生成的地址会自动带上前缀，页面上的链接都留在同一个站点内。
+    没有前缀的请求不记录站点名称，由应用按默认站点处理。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(PREFIX):
+            raw, _, rest = path[len(PREFIX):].partition('/')
+            # WSGI 中的路径为按 latin-1 解码的原始字节
+            environ[ENVIRON_KEY] = raw.encode('latin-1').decode('utf-8', 'replace')
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + PREFIX + raw
+            environ['PATH_INFO'] = '/' + rest
+        return self.app(environ, start_response)
@@ -0,0 +1,78 @@
+"""最新一期价格快照
+
+快照在每个数据版本只生成一次：取最新日期的数据，每个品种保留最新上传的一条，
+按品种排序。品种到行号的字典加上 (品种 × 供应商) 的价格矩阵，使按名称查价是
+一次字典查找，整张订单的计价是一次数组运算。
+"""
+from lazy_imports import lazy_module
+
+np = lazy_module('numpy')
+
+
+class LatestSnapshot:
+    """最新一期价格快照"""
+
+    def __init__(self, date, items, units, prices, price_columns):
+        self.date = date
+        self.items = items
+        self.units = units
+        # 价格矩阵，行对应 items，列对应 price_columns
+        self.prices = prices
+        self.price_columns = list(price_columns)
+        self.index = {item: i for i, item in enumerate(items)}
+        self._column_index = {col: j for j, col in enumerate(self.price_columns)}
+        # 页面渲染使用的行数据
+        self.rows = [
+            {'品种': item, '单位': unit, '日期': date,
+             **{col: price for col, price in zip(self.price_columns, row)}}
+            for item, unit, row in zip(items, units, prices.tolist())
+        ]
+
+    @classmethod
+    def build(cls, df, price_columns):
+        """从缓存数据（已按日期、上传时间倒序）生成快照，没有数据时返回 None"""
+        df = df.dropna(subset=['品种'])
+        if df.empty:
+            return None
+        date = df['日期'].max()
+        latest = (df[df['日期'] == date]
+                  .drop_duplicates('品种')
+                  .sort_values('品种', kind='mergesort'))
+        return cls(date, latest['品种'].tolist(), latest['单位'].tolist(),
+                   latest[price_columns].to_numpy(dtype='float64'), price_columns)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, food_item):
+        return food_item in self.index
+
+    def lookup(self, food_item):
+        """按品种查找，返回该品种的行数据，找不到时返回 None"""
+        i = self.index.get(food_item)
+        return None if i is None else self.rows[i]
+
+    def price_order(self, quantities, price_column):
+        """按指定供应商价格计算订单
+
+        quantities 为 {品种: 数量}，返回 (订单明细, 总价, 找不到价格的品种)；
+        该供应商没有报价的品种也算作找不到价格。
+        """
+        names = list(quantities)
+        column = self._column_index[price_column]
+        positions = np.array([self.index.get(name, -1) for name in names], dtype=np.int64)
+        found = positions >= 0
+        found[found] = ~np.isnan(self.prices[positions[found], column])
+        names = [name for name, ok in zip(names, found) if ok]
+        missing = [name for name, ok in zip(quantities, found) if not ok]
+
+        qty = np.array([quantities[name] for name in names], dtype='float64')
+        price = self.prices[positions[found], column]
+        subtotal = qty * price
+
+        order_items = [
+            {'品种': name, '数量': q, '单位': self.units[i], '单价': p, '小计': s}
+            for name, i, q, p, s in zip(names, positions[found].tolist(), qty.tolist(),
+                                        price.tolist(), subtotal.tolist())
+        ]
+        return order_items, float(subtotal.sum()), missing
@@ -0,0 +1,667 @@
+"""价格数据存储后端
+
+所有后端都只做追加写入，提供相同的接口：
+
+- load()：读取全部数据，按日期、上传时间倒序排列
+- append(df)：追加一批新数据，写入成本只和新数据量有关
+- clear()：清空数据
+- remove_uploads(upload_times)：删除指定上传时间的记录（None 表示没有上传时间的记录），
+  返回删除的行数（CSV 只记录删除标记，不统计行数，返回 None）
+- signature()：数据版本标识，数据变化后一定不同，用于判断缓存是否失效
+- query_item(food_item) / query_date(date)：按品种或日期查询
+- iter_chunks(chunksize)：按写入顺序分块读取全部数据，内存占用只和块大小有关
+
+除基本列外，每个供应商一列价格（<供应商名称>价）。写入的数据中出现新的供应商时，
+各后端自动增加对应的列，已有的记录在新列中为空。
+"""
+import argparse
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from instrumentation import storage_read
+from lazy_imports import lazy_module
+from locking import FileLock, atomic_write, make_temp_file
+from price_store import (BASE_COLUMNS, CSV_DTYPES, PRICE_COLUMNS, frame_columns, normalize_frame,
+                         price_columns_of, sort_latest_first)
+
+pd = lazy_module('pandas')
+
+DEFAULT_PATHS = {
+    'csv': 'food_prices.csv',
+    'sqlite': 'food_prices.db',
+    'parquet': 'food_prices_parquet',
+}
+
+
+def empty_price_frame():
+    return normalize_frame(pd.DataFrame(columns=PRICE_COLUMNS))
+
+
+def upload_mask(upload_time, upload_times):
+    """上传时间属于 upload_times 的行，None 表示没有上传时间的行"""
+    upload_times = set(upload_times)
+    mask = upload_time.isin(upload_times - {None})
+    if None in upload_times:
+        mask |= upload_time.isna()
+    return mask
+
+
+def _drop_uploads(df, upload_times):
+    return df[~upload_mask(df['上传时间'], upload_times)] if upload_times else df
+
+
+def _wal_pieces(wal, removed):
+    """按删除标记记录的日志位置把日志切开，返回 [(日志片段, 该片段中要删除的上传时间)]
+
+    删除标记 (上传时间, 位置) 只删除日志中该位置之前的记录，之后追加的同一上传时间的记录保留。
+    """
+    cuts = sorted({min(offset, len(wal)) for _, offset in removed} | {0, len(wal)})
+    return [(wal[start:end], {upload_time for upload_time, offset in removed if offset >= end})
+            for start, end in zip(cuts, cuts[1:])]
+
+
+class CsvStorage:
+    """CSV 文件存储（默认）
+
+    数据由基础文件和追加日志（<文件名>.wal，不含表头）两部分组成：
+    - 新数据只追加到日志，写入成本只和新数据量有关
+    - 日志超过 COMPACT_THRESHOLD 后由后台线程合并进基础文件，
+      新的基础文件先写临时文件再原子替换
+    - 读取时在共享锁内打开基础文件并读出日志，拿到一致的快照后在锁外解析；
+      写入方只在追加或替换文件的瞬间持有排他锁，不会长时间阻塞读取
+    - 日志中各列的顺序与基础文件表头一致；新增供应商时先把全部数据按新的表头
+      重写为基础文件，再追加日志
+    - 删除某些上传时间的记录（回滚）时不重写文件，只在 <文件名>.removed 中记录删除标记
+      （上传时间和当时的日志长度），读取时跳过这些记录；下次合并时再从文件中真正删除
+    """
+
+    kind = 'csv'
+    # 追加日志超过该大小（字节）时触发后台合并
+    COMPACT_THRESHOLD = 1024 * 1024
+
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path or DEFAULT_PATHS['csv'])
+        self.wal_path = f'{self.path}.wal'
+        self.removed_path = f'{self.path}.removed'
+        self.lock = FileLock(f'{self.path}.lock')
+        self._compacting = threading.Lock()
+
+    @property
+    def key(self):
+        return (self.kind, self.path)
+
+    def signature(self):
+        signature = []
+        for path in (self.path, self.wal_path, self.removed_path):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                signature.append(None)
+                continue
+            signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        return tuple(signature) if any(signature) else None
+
+    def _removed(self):
+        """删除标记 [(上传时间, 日志位置)]"""
+        try:
+            with open(self.removed_path, encoding='utf-8') as f:
+                return [tuple(entry) for entry in json.load(f)]
+        except FileNotFoundError:
+            return []
+
+    def _snapshot(self):
+        """返回 (基础文件句柄或 None, 日志内容, 删除标记)，三者对应同一时刻的数据"""
+        with self.lock.shared():
+            try:
+                base = open(self.path, 'rb')
+            except FileNotFoundError:
+                base = None
+            try:
+                with open(self.wal_path, 'rb') as f:
+                    wal = f.read()
+            except FileNotFoundError:
+                wal = b''
+            removed = self._removed()
+        # 忽略写入异常中断时留下的不完整的最后一行
+        return base, wal[:wal.rfind(b'\n') + 1], removed
+
+    @staticmethod
+    def _layout(header_line):
+        """日志中各列的顺序：基础文件表头包含全部基本列时与表头相同，否则为默认列
+
+        旧版本清空数据后写出的基础文件只有五列，此时日志按默认列写入。
+        """
+        header = header_line.decode('utf-8').strip().split(',') if header_line else []
+        return header if set(BASE_COLUMNS).issubset(header) else PRICE_COLUMNS
+
+    def _parse(self, base, wal, removed=()):
+        frames = []
+        if base:
+            try:
+                frames.append(_drop_uploads(pd.read_csv(io.BytesIO(base), encoding='utf-8', dtype=CSV_DTYPES),
+                                            {upload_time for upload_time, _ in removed}))
+            except pd.errors.EmptyDataError:
+                pass
+        if wal:
+            names = self._layout(base.split(b'\n', 1)[0])
+            for piece, upload_times in _wal_pieces(wal, removed):
+                if piece:
+                    frames.append(_drop_uploads(pd.read_csv(io.BytesIO(piece), encoding='utf-8', header=None,
+                                                            names=names, dtype=CSV_DTYPES), upload_times))
+        if not frames:
+            return empty_price_frame()
+        return pd.concat([normalize_frame(f) for f in frames], ignore_index=True)
+
+    def _read(self):
+        base, wal, removed = self._snapshot()
+        if base is None:
+            return self._parse(b'', wal, removed)
+        with base:
+            return self._parse(base.read(), wal, removed)
+
+    @storage_read('load')
+    def load(self):
+        return sort_latest_first(self._read())
+
+    @storage_read('iter_chunks')
+    def iter_chunks(self, chunksize=10000):
+        base, wal, removed = self._snapshot()
+        header_line = b''
+        if base is not None:
+            # 已打开的基础文件在合并替换后仍指向原来的内容
+            with base:
+                header_line = base.readline()
+                base.seek(0)
+                upload_times = {upload_time for upload_time, _ in removed}
+                try:
+                    for chunk in pd.read_csv(base, encoding='utf-8', dtype=CSV_DTYPES, chunksize=chunksize):
+                        chunk = _drop_uploads(chunk, upload_times)
+                        if not chunk.empty:
+                            yield normalize_frame(chunk)
+                except pd.errors.EmptyDataError:
+                    pass
+        for piece, upload_times in _wal_pieces(wal, removed) if wal else ():
+            if not piece:
+                continue
+            for chunk in pd.read_csv(io.BytesIO(piece), encoding='utf-8', header=None,
+                                     names=self._layout(header_line), dtype=CSV_DTYPES, chunksize=chunksize):
+                chunk = _drop_uploads(chunk, upload_times)
+                if not chunk.empty:
+                    yield normalize_frame(chunk)
+
+    def _repair_wal(self):
+        """截掉日志末尾不完整的行（调用方需持有排他锁）"""
+        try:
+            with open(self.wal_path, 'rb') as f:
+                wal = f.read()
+        except FileNotFoundError:
+            return
+        if wal and not wal.endswith(b'\n'):
+            with atomic_write(self.wal_path, 'wb') as f:
+                f.write(wal[:wal.rfind(b'\n') + 1])
+
+    def _base_header(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return f.readline()
+        except FileNotFoundError:
+            return b''
+
+    def _rewrite(self, columns):
+        """按新的列把全部数据写成基础文件并清空日志（调用方需持有排他锁）"""
+        df = self._read().reindex(columns=columns)
+        with atomic_write(self.path, newline='') as f:
+            df.to_csv(f, index=False, lineterminator='\n')
+        with atomic_write(self.wal_path, 'wb'):
+            pass
+        self._clear_removed()
+
+    def _clear_removed(self):
+        # 删除标记已经应用到基础文件中（调用方需持有排他锁）
+        try:
+            os.remove(self.removed_path)
+        except FileNotFoundError:
+            pass
+
+    def append(self, df):
+        with self.lock:
+            self._repair_wal()
+            header_line = self._base_header()
+            columns = self._layout(header_line)
+            if not set(df.columns).issubset(columns):
+                columns = frame_columns(price_columns_of(columns + list(df.columns)))
+                self._rewrite(columns)
+            data = df.reindex(columns=columns).to_csv(index=False, header=False, lineterminator='\n')
+            with open(self.wal_path, 'ab') as f:
+                f.write(data.encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+        if size > self.COMPACT_THRESHOLD:
+            threading.Thread(target=self.compact, name='csv-compact', daemon=True).start()
+
+    def compact(self):
+        """把追加日志和删除标记合并进基础文件，返回是否完成了合并
+
+        新文件在锁外准备好，只在替换文件时持有排他锁；准备期间如果有其他进程
+        合并、清空或删除了数据，本次合并直接放弃。
+        """
+        if not self._compacting.acquire(blocking=False):
+            return False
+        try:
+            base, wal, removed = self._snapshot()
+            if base is None:
+                base_bytes, base_ino = b'', None
+            else:
+                with base:
+                    base_bytes, base_ino = base.read(), os.fstat(base.fileno()).st_ino
+            if not wal and not removed:
+                return False
+
+            header_line = base_bytes.split(b'\n', 1)[0]
+            columns = self._layout(header_line)
+            if not removed and header_line.strip() == ','.join(columns).encode('utf-8'):
+                content = base_bytes if base_bytes.endswith(b'\n') else base_bytes + b'\n'
+                content += wal
+            else:
+                # 有删除标记，或旧版本写出的基础文件列不一致（例如清空后只有五列）时，
+                # 解析后按日志的列重新生成
+                content = (self._parse(base_bytes, wal, removed).reindex(columns=columns)
+                           .to_csv(index=False, lineterminator='\n').encode('utf-8'))
+
+            fd, tmp = make_temp_file(self.path)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+
+            with self.lock:
+                try:
+                    current_ino = os.stat(self.path).st_ino
+                except FileNotFoundError:
+                    current_ino = None
+                with open(self.wal_path, 'rb') as f:
+                    current_wal = f.read()
+                if (current_ino != base_ino or not current_wal.startswith(wal)
+                        or self._removed() != removed):
+                    os.remove(tmp)
+                    return False
+                try:
+                    os.replace(tmp, self.path)
+                except PermissionError:
+                    # Windows 下基础文件正被读取时无法替换，留到下次合并
+                    os.remove(tmp)
+                    return False
+                with atomic_write(self.wal_path, 'wb') as f:
+                    f.write(current_wal[len(wal):])
+                self._clear_removed()
+            return True
+        finally:
+            self._compacting.release()
+
+    def clear(self):
+        with self.lock:
+            with atomic_write(self.path) as f:
+                f.write(','.join(PRICE_COLUMNS) + '\n')
+            with atomic_write(self.wal_path, 'wb'):
+                pass
+            self._clear_removed()
+
+    def remove_uploads(self, upload_times):
+        # 只追加删除标记，成本和历史数据量无关；文件中的记录留到后台合并时再删除
+        upload_times = set(upload_times)
+        if not upload_times:
+            return None
+        with self.lock:
+            self._repair_wal()
+            try:
+                offset = os.path.getsize(self.wal_path)
+            except FileNotFoundError:
+                offset = 0
+            removed = self._removed() + [(upload_time, offset) for upload_time in upload_times]
+            with atomic_write(self.removed_path) as f:
+                json.dump(removed, f, ensure_ascii=False)
+        threading.Thread(target=self.compact, name='csv-compact', daemon=True).start()
+        return None
+
+    @storage_read('query_item')
+    def query_item(self, food_item):
+        df = self.load()
+        return df[df['品种'] == food_item].reset_index(drop=True)
+
+    @storage_read('query_date')
+    def query_date(self, date):
+        df = self.load()
+        return df[df['日期'] == date].reset_index(drop=True)
+
+
+class SqliteStorage:
+    """本地 SQLite 存储，(品种, 日期, 上传时间) 和 (日期, 上传时间) 上建有索引"""
+
+    kind = 'sqlite'
+
+    _SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS prices ('
+        + ', '.join(f'"{col}" TEXT' if col in BASE_COLUMNS else f'"{col}"' for col in PRICE_COLUMNS) + ')',
+        'CREATE INDEX IF NOT EXISTS idx_prices_item ON prices ("品种", "日期", "上传时间")',
+        'CREATE INDEX IF NOT EXISTS idx_prices_date ON prices ("日期", "上传时间")',
+        'CREATE INDEX IF NOT EXISTS idx_prices_upload ON prices ("上传时间")',
+        'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)',
+        "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)",
+    ]
+    _ORDER = ' ORDER BY "日期" DESC, "上传时间" DESC, rowid'
+
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path or DEFAULT_PATHS['sqlite'])
+        # SQLite 自身保证单条写入的原子性，这把锁用于协调跨多个步骤的写入
+        self.lock = FileLock(f'{self.path}.lock')
+        # 每个线程缓存一个只用于读取版本号的连接，见 signature
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in self._SCHEMA:
+                conn.execute(statement)
+
+    @property
+    def key(self):
+        return (self.kind, self.path)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _columns(conn):
+        return [row[1] for row in conn.execute('PRAGMA table_info(prices)')]
+
+    def _query(self, where='', params=()):
+        with self._connect() as conn:
+            df = pd.read_sql_query(f'SELECT * FROM prices{where}{self._ORDER}', conn, params=params)
+        return normalize_frame(df)
+
+    def signature(self):
+        # 每次请求都会检查版本号，不为此新建连接；其他连接提交写入后 data_version 才会变化，
+        # 只有这时才重新读取版本号
+        local = self._local
+        if getattr(local, 'conn', None) is None:
+            local.conn = sqlite3.connect(self.path, timeout=30)
+            local.data_version = None
+        data_version = local.conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != local.data_version:
+            local.version = local.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            local.data_version = data_version
+        return local.version
+
+    @storage_read('load')
+    def load(self):
+        return self._query()
+
+    @storage_read('iter_chunks')
+    def iter_chunks(self, chunksize=10000):
+        # 同一条查询语句在 WAL 模式下读到的是开始时的快照
+        with self._connect() as conn:
+            for chunk in pd.read_sql_query('SELECT * FROM prices ORDER BY rowid',
+                                           conn, chunksize=chunksize):
+                yield normalize_frame(chunk)
+
+    def append(self, df):
+        df = df.astype(object)
+        rows = df.where(df.notna(), None).itertuples(index=False, name=None)
+        columns = ', '.join(f'"{col}"' for col in df.columns)
+        placeholders = ', '.join('?' * len(df.columns))
+        with self._connect() as conn:
+            # 新的供应商增加一列，已有记录在该列中为空
+            for col in df.columns.difference(self._columns(conn), sort=False):
+                conn.execute(f'ALTER TABLE prices ADD COLUMN "{col}"')
+            conn.executemany(f'INSERT INTO prices ({columns}) VALUES ({placeholders})', rows)
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM prices')
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def remove_uploads(self, upload_times):
+        upload_times = set(upload_times)
+        times = sorted(upload_times - {None})
+        conditions = [f'"上传时间" IN ({", ".join("?" * len(times))})'] if times else []
+        if None in upload_times:
+            conditions.append('"上传时间" IS NULL')
+        if not conditions:
+            return 0
+        with self._connect() as conn:
+            removed = conn.execute(f'DELETE FROM prices WHERE {" OR ".join(conditions)}', times).rowcount
+            if removed:
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        return removed
+
+    @storage_read('query_item')
+    def query_item(self, food_item):
+        return self._query(' WHERE "品种" = ?', (food_item,))
+
+    @storage_read('query_date')
+    def query_date(self, date):
+        return self._query(' WHERE "日期" = ?', (date,))
+
+
+class ParquetStorage:
+    """按日期分区的 Parquet 存储（需要安装 pyarrow）
+
+    目录结构为 <root>/date=<日期>/<批次>.parquet，每次导入只新增文件；
+    按日期查询只读取对应分区，按品种查询通过过滤条件下推跳过无关行组。
+    """
+
+    kind = 'parquet'
+
+    def __init__(self, path=None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError('Parquet 存储需要安装 pyarrow：pip install pyarrow')
+        self.path = os.path.abspath(path or DEFAULT_PATHS['parquet'])
+        os.makedirs(self.path, exist_ok=True)
+        self._version_file = os.path.join(self.path, '_version')
+        self.lock = FileLock(os.path.join(self.path, '_lock'))
+
+    @property
+    def key(self):
+        return (self.kind, self.path)
+
+    def _partition_dir(self, date):
+        return os.path.join(self.path, f'date={date}')
+
+    def _files(self, date=None):
+        if date is not None:
+            dirs = [self._partition_dir(date)]
+        else:
+            dirs = [os.path.join(self.path, name) for name in os.listdir(self.path)
+                    if name.startswith('date=')]
+        files = []
+        for directory in dirs:
+            if os.path.isdir(directory):
+                files.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                             if name.endswith('.parquet'))
+        return files
+
+    def _read(self, files, filters=None):
+        frames = [pd.read_parquet(f, filters=filters) for f in files]
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return empty_price_frame()
+        return sort_latest_first(normalize_frame(pd.concat(frames, ignore_index=True)))
+
+    def _bump_version(self):
+        # 调用方需持有排他锁
+        version = self.signature() or 0
+        with atomic_write(self._version_file) as f:
+            f.write(str(version + 1))
+
+    def signature(self):
+        try:
+            with open(self._version_file) as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return None
+
+    @storage_read('load')
+    def load(self):
+        # 清空数据时会删除文件，读取期间持有共享锁
+        with self.lock.shared():
+            return self._read(self._files())
+
+    @storage_read('iter_chunks')
+    def iter_chunks(self, chunksize=10000):
+        import pyarrow.parquet as pq
+
+        with self.lock.shared():
+            files = self._files()
+        for path in files:
+            try:
+                parquet_file = pq.ParquetFile(path)
+            except FileNotFoundError:
+                # 读取期间数据被清空
+                return
+            with parquet_file:
+                for batch in parquet_file.iter_batches(batch_size=chunksize):
+                    yield normalize_frame(batch.to_pandas())
+
+    def append(self, df):
+        with self.lock:
+            self._append(df)
+
+    def _append(self, df):
+        df = df.reindex(columns=frame_columns(price_columns_of(df.columns)))
+        # Parquet 列类型必须一致，价格统一按文本保存，和 CSV 读出的结果相同
+        df = df.astype('string')
+        for date, part in df.groupby('日期', sort=False):
+            directory = self._partition_dir(date)
+            os.makedirs(directory, exist_ok=True)
+            name = f"{part['上传时间'].iloc[0].replace(' ', '_').replace(':', '')}-{uuid.uuid4().hex[:8]}"
+            tmp = os.path.join(directory, f'.{name}.tmp')
+            part.to_parquet(tmp, index=False)
+            os.replace(tmp, os.path.join(directory, f'{name}.parquet'))
+        self._bump_version()
+
+    def clear(self):
+        with self.lock:
+            for f in self._files():
+                os.remove(f)
+            self._bump_version()
+
+    def remove_uploads(self, upload_times):
+        # 只读出上传时间一列判断；整个文件都要删除时直接删除文件，否则重写该文件
+        removed = 0
+        with self.lock:
+            for path in self._files():
+                mask = upload_mask(pd.read_parquet(path, columns=['上传时间'])['上传时间'], upload_times)
+                if not mask.any():
+                    continue
+                removed += int(mask.sum())
+                if mask.all():
+                    os.remove(path)
+                    continue
+                tmp = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.tmp')
+                pd.read_parquet(path)[~mask.to_numpy()].to_parquet(tmp, index=False)
+                os.replace(tmp, path)
+            if removed:
+                self._bump_version()
+        return removed
+
+    @storage_read('query_item')
+    def query_item(self, food_item):
+        with self.lock.shared():
+            return self._read(self._files(), filters=[('品种', '==', food_item)])
+
+    @storage_read('query_date')
+    def query_date(self, date):
+        with self.lock.shared():
+            return self._read(self._files(date))
+
+
+class DataVersion:
+    """跨进程共享的数据版本计数器
+
+    每次导入或清空数据后加一，文件内容为 "版本号 修改时间戳"。
+    读取时按文件状态缓存，每次只需要一次 stat。
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.lock = FileLock(f'{self.path}.lock')
+        self._cached = None
+        self._cached_stat = None
+
+    def current(self):
+        """返回 (版本号, 修改时间戳)，从未写入过时为 (0, 0.0)"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return 0, 0.0
+        stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stat != self._cached_stat:
+            with open(self.path, encoding='utf-8') as f:
+                version, modified = f.read().split()
+            self._cached, self._cached_stat = (int(version), float(modified)), stat
+        return self._cached
+
+    def bump(self):
+        """版本号加一，返回新的版本号"""
+        with self.lock:
+            version = self.current()[0] + 1
+            with atomic_write(self.path) as f:
+                f.write(f'{version} {time.time():.6f}')
+        return version
+
+
+BACKENDS = {
+    'csv': CsvStorage,
+    'sqlite': SqliteStorage,
+    'parquet': ParquetStorage,
+}
+
+
+def create_storage(kind='csv', path=None):
+    """按名称创建存储后端"""
+    try:
+        backend = BACKENDS[kind]
+    except KeyError:
+        raise ValueError(f"未知的存储类型：{kind}，可选：{', '.join(BACKENDS)}")
+    return backend(path)
+
+
+def migrate_from_csv(target, csv_path=None, force=False):
+    """把现有的 CSV 价格数据一次性迁移到目标存储"""
+    source = CsvStorage(csv_path)
+    if not os.path.exists(source.path):
+        return False, f"找不到 CSV 文件：{source.path}"
+    if not force and not target.load().empty:
+        return False, "目标存储中已有数据，如需覆盖请使用 force=True"
+    df = source.load()
+    with target.lock:
+        target.clear()
+        target.append(df)
+    return True, f"已迁移 {len(df)} 条记录到 {target.kind} 存储"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='把 CSV 价格数据迁移到其他存储后端')
+    parser.add_argument('target', choices=[k for k in BACKENDS if k != 'csv'])
+    parser.add_argument('--csv', default=DEFAULT_PATHS['csv'], help='源 CSV 文件')
+    parser.add_argument('--path', help='目标存储路径')
+    parser.add_argument('--force', action='store_true', help='目标已有数据时仍然覆盖')
+    args = parser.parse_args()
+
+    success, message = migrate_from_csv(create_storage(args.target, args.path), args.csv, args.force)
+    print(message)
+    raise SystemExit(0 if success else 1)
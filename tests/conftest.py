@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# 项目模块都在仓库根目录下
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from food_price_tracker import FoodPriceTracker  # noqa: E402
+
+
+def price_frame(rows, date='2024-01-01', upload_time=None):
+    """按 [(品种, 单位, {供应商: 价格})] 生成一批报价"""
+    df = pd.DataFrame([{'日期': date, '品种': item, '单位': unit, **{f'{s}价': p for s, p in prices.items()}}
+                       for item, unit, prices in rows])
+    if upload_time is not None:
+        df['上传时间'] = upload_time
+    return df
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    return FoodPriceTracker(data_dir=str(tmp_path))
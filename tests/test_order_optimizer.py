@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from conftest import price_frame
+from order_optimizer import optimize_orders
+from price_store import clean_price_columns, price_columns_of
+from snapshot import LatestSnapshot
+
+NAN = np.nan
+
+
+@pytest.fixture
+def snapshot():
+    df = clean_price_columns(price_frame([
+        ('白菜', '斤', {'甲': 1.0, '乙': 1.2}),
+        ('萝卜', '斤', {'甲': 3.0, '乙': 2.5}),
+        ('土豆', '斤', {'甲': NAN, '乙': 4.0}),
+        ('洋葱', '斤', {'甲': 2.0, '乙': NAN}),
+    ], upload_time='2024-01-01 08:00:00'))
+    return LatestSnapshot.build(df, price_columns_of(df.columns))
+
+
+def suppliers(result):
+    return {item['品种']: item['供应商'] for item in result['items']}
+
+
+def test_cheapest_supplier_per_item(snapshot):
+    result = optimize_orders(snapshot, {'厨房': {'白菜': 10, '萝卜': 2, '不存在': 1}})['厨房']
+    assert suppliers(result) == {'白菜': '甲', '萝卜': '乙'}
+    assert result['total'] == pytest.approx(15.0)
+    assert result['by_supplier'] == pytest.approx({'甲': 10.0, '乙': 5.0})
+    assert result['single_supplier'] == pytest.approx({'甲': 16.0, '乙': 17.0})
+    assert result['missing'] == ['不存在']
+
+
+def test_preferred_within_tolerance(snapshot):
+    basket = {'厨房': {'白菜': 10, '萝卜': 2}}
+    result = optimize_orders(snapshot, basket, preferred='乙', tolerance=0.25)['厨房']
+    assert suppliers(result) == {'白菜': '乙', '萝卜': '乙'}
+    assert result['total'] == pytest.approx(17.0)
+
+    result = optimize_orders(snapshot, basket, preferred='乙', tolerance=0.1)['厨房']
+    assert suppliers(result) == {'白菜': '甲', '萝卜': '乙'}
+
+
+def test_min_order_moves_items_to_next_cheapest(snapshot):
+    baskets = {'一楼': {'白菜': 10, '萝卜': 2}, '二楼': {'萝卜': 10}}
+    results = optimize_orders(snapshot, baskets, min_order={'乙': 10})
+    # 一楼分给乙的金额不足起订额，改由甲供应；二楼达到起订额，保持不变
+    assert suppliers(results['一楼']) == {'白菜': '甲', '萝卜': '甲'}
+    assert results['一楼']['total'] == pytest.approx(16.0)
+    assert results['一楼']['below_minimum'] == []
+    assert suppliers(results['二楼']) == {'萝卜': '乙'}
+
+
+def test_min_order_keeps_items_without_alternative(snapshot):
+    result = optimize_orders(snapshot, {'厨房': {'洋葱': 1, '白菜': 1}}, min_order={'甲': 100})['厨房']
+    assert suppliers(result)['洋葱'] == '甲'
+    assert result['below_minimum'] == ['甲']
+
+
+def test_unknown_supplier(snapshot):
+    with pytest.raises(ValueError):
+        optimize_orders(snapshot, {'厨房': {'白菜': 1}}, preferred='丙')
+    with pytest.raises(ValueError):
+        optimize_orders(snapshot, {'厨房': {'白菜': 1}}, min_order={'丙': 10})
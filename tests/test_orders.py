@@ -0,0 +1,80 @@
+import pytest
+
+import app as web
+import orders
+from orders import OrderSessions
+from sites import SiteRegistry
+
+ORDER_ITEMS = [{'品种': '白菜', '数量': 10, '单位': '斤', '单价': 1.5, '小计': 15.0}]
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(orders.time, 'time', clock)
+    return clock
+
+
+def test_session_round_trip(tmp_path):
+    sessions = OrderSessions(str(tmp_path / 'orders.db'))
+    token = sessions.new_token()
+    sessions.put(token, 7, {'白菜': 10, '萝卜': 2.5})
+    assert sessions.get(token) == (7, {'白菜': 10, '萝卜': 2.5})
+    assert sessions.get(sessions.new_token()) is None
+    assert sessions.get(None) is None
+    sessions.delete(token)
+    assert sessions.get(token) is None
+
+
+def test_session_expires_after_ttl(tmp_path, clock):
+    sessions = OrderSessions(str(tmp_path / 'orders.db'), ttl=60)
+    sessions.put('a', 1, {'白菜': 1})
+    clock.now += 50
+    # 读取时顺延过期时间
+    assert sessions.get('a') == (1, {'白菜': 1})
+    clock.now += 50
+    assert sessions.get('a') is not None
+    clock.now += 61
+    assert sessions.get('a') is None
+
+
+def test_put_purges_expired_sessions(tmp_path, clock):
+    sessions = OrderSessions(str(tmp_path / 'orders.db'), ttl=60)
+    sessions.put('old', 1, {'白菜': 1})
+    clock.now += 120
+    sessions.put('new', 2, {'萝卜': 1})
+    with sessions._connect() as conn:
+        assert [row[0] for row in conn.execute('SELECT token FROM order_sessions')] == ['new']
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(web, 'sites', SiteRegistry(data_dir=str(tmp_path)))
+    web.app.config['TESTING'] = True
+    return web.app.test_client()
+
+
+def test_order_detail_only_for_own_session(client):
+    site = web.sites.get(web.sites.default)
+    own = site.tracker.save_order(ORDER_ITEMS, 15.0)
+    other = site.tracker.save_order(ORDER_ITEMS, 15.0)
+    token = site.order_sessions.new_token()
+    site.order_sessions.put(token, own, {'白菜': 10})
+
+    # 没有会话时任何订单都按不存在处理
+    assert client.get(f'/api/v1/orders/{own}').status_code == 404
+
+    with client.session_transaction() as session:
+        session['order_token'] = token
+    response = client.get(f'/api/v1/orders/{own}')
+    assert response.status_code == 200
+    assert response.get_json()['data']['items'][0]['品种'] == '白菜'
+    assert client.get(f'/api/v1/orders/{other}').status_code == 404
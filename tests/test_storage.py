@@ -0,0 +1,98 @@
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+from conftest import price_frame
+from storage import CsvStorage, ParquetStorage, SqliteStorage
+
+BACKENDS = {
+    'csv': lambda tmp_path: CsvStorage(str(tmp_path / 'prices.csv')),
+    'sqlite': lambda tmp_path: SqliteStorage(str(tmp_path / 'prices.db')),
+    'parquet': lambda tmp_path: ParquetStorage(str(tmp_path / 'prices_parquet')),
+}
+
+
+@pytest.fixture
+def csv_storage(tmp_path):
+    storage = CsvStorage(str(tmp_path / 'prices.csv'))
+    # 合并由测试显式调用，不在后台线程中进行
+    storage.COMPACT_THRESHOLD = float('inf')
+    return storage
+
+
+def items(storage):
+    return sorted(storage.load()['品种'])
+
+
+def test_csv_append_and_reload(csv_storage):
+    csv_storage.append(price_frame([('白菜', '斤', {'甲': 1.5})], upload_time='2024-01-01 08:00:00'))
+    signature = csv_storage.signature()
+    csv_storage.append(price_frame([('萝卜', '斤', {'甲': 2.0})], date='2024-01-08',
+                                   upload_time='2024-01-08 08:00:00'))
+    assert csv_storage.signature() != signature
+
+    reloaded = CsvStorage(csv_storage.path).load()
+    assert reloaded['品种'].tolist() == ['萝卜', '白菜']
+    assert reloaded['甲价'].tolist() == ['2.0', '1.5']
+
+
+def test_csv_new_supplier_adds_column(csv_storage):
+    csv_storage.append(price_frame([('白菜', '斤', {'甲': 1.5})], upload_time='t1'))
+    csv_storage.append(price_frame([('萝卜', '斤', {'乙': 2.0})], upload_time='t2'))
+    df = csv_storage.load().set_index('品种')
+    assert {'甲价', '乙价'} <= set(df.columns)
+    assert pd.isna(df.loc['白菜', '乙价'])
+    assert df.loc['萝卜', '乙价'] == '2.0'
+
+
+def test_csv_compact_keeps_data_and_empties_wal(csv_storage):
+    for i, item in enumerate(['白菜', '萝卜', '土豆']):
+        csv_storage.append(price_frame([(item, '斤', {'甲': i + 1})], upload_time=f't{i}'))
+    before = csv_storage.load()
+    assert os.path.getsize(csv_storage.wal_path) > 0
+
+    assert csv_storage.compact()
+    assert os.path.getsize(csv_storage.wal_path) == 0
+    pd.testing.assert_frame_equal(CsvStorage(csv_storage.path).load(), before)
+    chunks = list(csv_storage.iter_chunks(chunksize=2))
+    assert sum(len(chunk) for chunk in chunks) == 3
+
+
+def test_csv_remove_uploads_keeps_rows_appended_afterwards(csv_storage):
+    csv_storage.append(price_frame([('白菜', '斤', {'甲': 1})]))
+    csv_storage.compact()
+    csv_storage.append(price_frame([('萝卜', '斤', {'甲': 2})], upload_time='t1'))
+    csv_storage.append(price_frame([('土豆', '斤', {'甲': 3})], upload_time='t2'))
+    csv_storage.remove_uploads({'t1', None})
+    # 删除后再追加同一上传时间的记录（回滚时重新追加同一秒导入的其他批次）
+    csv_storage.append(price_frame([('洋葱', '斤', {'甲': 4})], upload_time='t1'))
+
+    assert items(csv_storage) == ['土豆', '洋葱']
+    assert sorted(pd.concat(csv_storage.iter_chunks(chunksize=1))['品种']) == ['土豆', '洋葱']
+    # 删除后会在后台合并，等合并结束后删除标记应已写入基础文件
+    for thread in threading.enumerate():
+        if thread.name == 'csv-compact':
+            thread.join()
+    csv_storage.compact()
+    assert not os.path.exists(csv_storage.removed_path)
+    assert items(CsvStorage(csv_storage.path)) == ['土豆', '洋葱']
+
+
+@pytest.mark.parametrize('kind', sorted(BACKENDS))
+def test_remove_uploads_and_clear(tmp_path, kind):
+    if kind == 'parquet':
+        pytest.importorskip('pyarrow')
+    storage = BACKENDS[kind](tmp_path)
+    storage.append(price_frame([('白菜', '斤', {'甲': 1})], upload_time='t1'))
+    storage.append(price_frame([('萝卜', '斤', {'甲': 2})], upload_time='t2'))
+    signature = storage.signature()
+
+    storage.remove_uploads({'t1'})
+    assert storage.signature() != signature
+    assert items(storage) == ['萝卜']
+    assert storage.query_item('萝卜')['上传时间'].tolist() == ['t2']
+
+    storage.clear()
+    assert storage.load().empty
@@ -0,0 +1,117 @@
+import pandas as pd
+import pytest
+
+from benchmark import generate_history
+from conftest import price_frame
+from price_store import PriceStore
+from validation import APPROVED
+
+
+def items(tracker):
+    return sorted(tracker.store.get_frame()['品种'])
+
+
+def history_dates(tracker, food_item):
+    return tracker.get_price_history(food_item)['日期'].tolist()
+
+
+def test_import_quarantine_and_approve(tracker):
+    assert tracker.import_frames([price_frame([('白菜', '斤', {'甲': 1.5}), ('萝卜', '斤', {'甲': 2.0})])]) == (2, 0)
+
+    # 单位和历史不一致的行进入隔离表，其余照常写入
+    written, quarantined = tracker.import_frames([price_frame(
+        [('白菜', '箱', {'甲': 30.0}), ('萝卜', '斤', {'甲': 2.1})], date='2024-01-08')])
+    assert (written, quarantined) == (1, 1)
+    pending = tracker.get_quarantine()
+    assert [record['品种'] for record in pending] == ['白菜']
+    assert '单位' in pending[0]['原因']
+    assert history_dates(tracker, '白菜') == ['2024-01-01']
+
+    assert tracker.review_quarantine([pending[0]['id']], approve=True) == (1, 1)
+    assert tracker.get_quarantine() == []
+    assert [record['品种'] for record in tracker.get_quarantine(status=APPROVED)] == ['白菜']
+    assert history_dates(tracker, '白菜') == ['2024-01-08', '2024-01-01']
+    # 已经审核过的编号忽略，不会导入两次
+    assert tracker.review_quarantine([pending[0]['id']], approve=True) == (0, 0)
+
+
+def test_reject_quarantine(tracker):
+    tracker.import_frames([price_frame([('白菜', '斤', {'甲': 1.5})])])
+    tracker.import_frames([price_frame([('白菜', '箱', {'甲': 30.0})], date='2024-01-08')])
+    record = tracker.get_quarantine()[0]
+    assert tracker.review_quarantine([record['id']], approve=False) == (1, 0)
+    assert tracker.get_quarantine() == []
+    assert history_dates(tracker, '白菜') == ['2024-01-01']
+
+
+def test_approve_requires_readable_price(tracker):
+    # 解析时已经隔离的行：价格文本中有多个数字
+    rows = price_frame([('白菜', '斤', {'甲': '1.5/2.0'})], upload_time='2024-01-01 08:00:00')
+    tracker.quarantine.add(rows.assign(原因='甲价无法识别'), ['甲价'])
+    record = tracker.get_quarantine()[0]
+
+    with pytest.raises(ValueError):
+        tracker.review_quarantine([record['id']], approve=True)
+    assert tracker.review_quarantine([record['id']], approve=True,
+                                     corrections={record['id']: {'甲价': 1.8}}) == (1, 1)
+    assert tracker.get_price_history('白菜')['甲价'].tolist() == [1.8]
+
+
+def test_rollback_and_restore_round_trip(tracker):
+    for day, item in [('2024-01-01', '白菜'), ('2024-01-08', '萝卜'), ('2024-01-15', '土豆')]:
+        tracker.import_frames([price_frame([(item, '斤', {'甲': 2.0})], date=day)])
+    first, second, third = [upload['id'] for upload in reversed(tracker.list_uploads())]
+    full = tracker.store.get_frame()
+
+    ok, _ = tracker.rollback_upload(first)
+    assert ok
+    assert items(tracker) == ['白菜']
+    assert [u['active'] for u in tracker.list_uploads()] == [False, False, True]
+    assert tracker.get_latest_snapshot().date == '2024-01-01'
+
+    assert tracker.restore_upload(third)[0]
+    assert items(tracker) == ['土豆', '白菜']
+    assert tracker.restore_upload(second)[0]
+    pd.testing.assert_frame_equal(tracker.store.get_frame().reset_index(drop=True),
+                                  full.reset_index(drop=True), check_like=True)
+
+    # 清空后仍可恢复
+    assert tracker.clear_price_data()[0]
+    assert tracker.store.get_frame().empty
+    assert tracker.restore_upload(first)[0]
+    assert items(tracker) == ['白菜']
+
+
+def test_rollback_unknown_upload(tracker):
+    tracker.import_frames([price_frame([('白菜', '斤', {'甲': 2.0})])])
+    ok, message = tracker.rollback_upload('no-such-upload')
+    assert not ok and 'no-such-upload' in message
+
+
+def test_apply_import_matches_full_reload(tracker):
+    history = generate_history(600, items=60, suppliers=('甲', '乙'))
+    with tracker.storage.lock:
+        tracker.storage.append(history)
+    store = tracker.store
+    # 先生成派生结构，导入后应当增量合并而不是丢弃
+    store.get_rollup(), store.get_search_index(), store.get_price_profile()
+
+    new = generate_history(120, items=120, suppliers=('甲', '乙'), seed=1).drop(columns='上传时间')
+    new['日期'] = '2030-01-01'
+    new.loc[new.index[:3], '品种'] = ['新品种一', '新品种二', '新品种三']
+    written, _ = tracker.import_frames([new], validate=False)
+    assert written == len(new)
+    assert 'rollup' in store._derived and 'search_index' in store._derived
+
+    reloaded = PriceStore(tracker.storage)
+    pd.testing.assert_frame_equal(store.get_frame().reset_index(drop=True),
+                                  reloaded.get_frame().reset_index(drop=True))
+    rollup, expected = store.get_rollup(), reloaded.get_rollup()
+    for item in reloaded.get_frame()['品种'].unique():
+        stats = rollup.item_stats(item)
+        assert stats.keys() == expected.item_stats(item).keys()
+        for supplier, values in expected.item_stats(item).items():
+            assert stats[supplier] == pytest.approx(values)
+    assert sorted(store.get_search_index().names) == sorted(reloaded.get_search_index().names)
+    pd.testing.assert_frame_equal(store.get_price_profile().stats.sort_index(),
+                                  reloaded.get_price_profile().stats.sort_index())
@@ -0,0 +1,238 @@
+"""价格时间序列：按固定周期重采样、滚动统计和预测
+
+每个供应商一个 (品种 × 周期) 价格矩阵，所有品种一起计算，不逐个品种循环：
+- 重采样：报价日期不固定，按周期（D 按日、W 按周一日期、M 按月）取该周期最新上传的报价，
+  没有报价的周期沿用上一个周期的价格（前向填充）
+- 滚动统计：最近 window 个周期的平均价格，以及周期涨跌幅的标准差（波动率）
+- 预测：带阻尼趋势的指数平滑（Holt），历史长度达到两个季节周期时加入加法季节项
+  （Holt-Winters），预测之后 horizon 个周期的价格
+
+整套矩阵在每个数据版本计算一次（PriceStore.get_timeseries），趋势页、价格比较、
+预算估计和接口都从这里读取。价格为 0 的报价（缺货等）不参与计算。
+"""
+from lazy_imports import lazy_module
+
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+
+FREQUENCIES = ('D', 'W', 'M')
+# 各周期对应的季节长度：一周 7 天、一年 52 周、一年 12 个月
+SEASON_LENGTH = {'D': 7, 'W': 52, 'M': 12}
+_GRID_FREQ = {'D': 'D', 'W': '7D', 'M': 'MS'}
+_LABEL_FORMAT = {'D': '%Y-%m-%d', 'W': '%Y-%m-%d', 'M': '%Y-%m'}
+
+
+def period_start(dates, freq):
+    """日期所在周期的起始日期"""
+    if freq == 'W':
+        return dates - pd.to_timedelta(dates.dt.weekday, unit='D')
+    if freq == 'M':
+        return dates.dt.to_period('M').dt.start_time
+    return dates.dt.normalize()
+
+
+def forward_fill(values):
+    """沿最后一维前向填充 NaN，第一个有效值之前保持 NaN"""
+    positions = np.arange(values.shape[-1])
+    last = np.where(np.isnan(values), 0, positions)
+    np.maximum.accumulate(last, axis=-1, out=last)
+    return np.take_along_axis(values, last, axis=-1)
+
+
+def _window_sum(values, window):
+    """沿最后一维计算最近 window 个元素之和（开头不足 window 个时取已有的）"""
+    total = np.cumsum(values, axis=-1)
+    total = np.concatenate([np.zeros(values.shape[:-1] + (1,)), total], axis=-1)
+    end = np.arange(1, values.shape[-1] + 1)
+    return total[..., end] - total[..., np.maximum(end - window, 0)]
+
+
+def rolling_mean(values, window):
+    """最近 window 个周期的平均值，忽略 NaN；全部为 NaN 时为 NaN"""
+    valid = ~np.isnan(values)
+    count = _window_sum(valid.astype('float64'), window)
+    total = _window_sum(np.where(valid, values, 0.0), window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def rolling_volatility(values, window):
+    """最近 window 个周期涨跌幅的样本标准差，少于两个涨跌幅时为 NaN"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = values[..., 1:] / values[..., :-1] - 1
+    returns = np.concatenate([np.full(values.shape[:-1] + (1,), np.nan), returns], axis=-1)
+    valid = ~np.isnan(returns)
+    count = _window_sum(valid.astype('float64'), window)
+    total = _window_sum(np.where(valid, returns, 0.0), window)
+    squares = _window_sum(np.where(valid, returns ** 2, 0.0), window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (squares - total ** 2 / count) / (count - 1)
+    return np.where(count > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+
+
+def _nanmean(values, axis):
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=axis, keepdims=True)
+    total = np.where(valid, values, 0.0).sum(axis=axis, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def exponential_smoothing(values, horizon, alpha=0.5, beta=0.1, phi=0.9, gamma=0.1, season=None):
+    """对每一行做带阻尼趋势的指数平滑，返回之后 horizon 个周期的预测 (行数 × horizon)
+
+    values 为 (行数 × 周期) 的等间隔序列，开头的 NaN 表示还没有数据；season 为季节长度，
+    周期数不足两个季节时不加季节项。按周期循环，每一步同时更新所有行。
+    """
+    rows, periods = values.shape
+    level = np.full(rows, np.nan)
+    trend = np.zeros(rows)
+    seasonal = np.zeros((rows, season or 1))
+    seasonal_enabled = bool(season) and periods >= 2 * season
+    if seasonal_enabled:
+        # 初始季节项：各完整季节内相对该季节均值的偏差，再按季节位置取平均
+        cycles = values[:, :periods // season * season].reshape(rows, -1, season)
+        seasonal = np.nan_to_num(_nanmean(cycles - _nanmean(cycles, axis=2), axis=1)[:, 0, :])
+
+    for t in range(periods):
+        x = values[:, t]
+        s = seasonal[:, t % season] if seasonal_enabled else 0.0
+        observed = ~np.isnan(x)
+        started = ~np.isnan(level)
+        first = observed & ~started
+        update = observed & started
+        new_level = np.where(update, alpha * (x - s) + (1 - alpha) * (level + phi * trend), level)
+        new_level = np.where(first, x - s, new_level)
+        trend = np.where(update, beta * (new_level - level) + (1 - beta) * phi * trend, trend)
+        if seasonal_enabled:
+            seasonal[:, t % season] = np.where(update, gamma * (x - new_level) + (1 - gamma) * s, s)
+        level = new_level
+
+    damping = np.cumsum(phi ** np.arange(1, horizon + 1))
+    forecast = level[:, None] + trend[:, None] * damping
+    if seasonal_enabled:
+        forecast += seasonal[:, (periods + np.arange(horizon)) % season]
+    # 价格不会为负数
+    return np.maximum(forecast, 0.0)
+
+
+class PriceSeries:
+    """所有品种、所有供应商的价格时间序列"""
+
+    def __init__(self, items, periods, forecast_periods, price_columns, freq, window,
+                 observed, prices, mean, volatility, forecast):
+        self.items = items
+        self.index = {item: i for i, item in enumerate(items)}
+        # 周期标签（W、D 为周期起始日期 YYYY-MM-DD，M 为 YYYY-MM）
+        self.periods = periods
+        self.forecast_periods = forecast_periods
+        self.price_columns = list(price_columns)
+        self.freq = freq
+        self.window = window
+        # 以下矩阵的形状均为 (供应商 × 品种 × 周期)，预测为 (供应商 × 品种 × horizon)
+        self.observed = observed
+        self.prices = prices
+        self.mean = mean
+        self.volatility = volatility
+        self.forecast = forecast
+        # 各品种每个预测周期的最低预测价格 (品种 × horizon)
+        self.best_forecast = np.fmin.reduce(forecast, axis=0)
+
+    @classmethod
+    def build(cls, df, price_columns, freq='W', window=4, horizon=4, alpha=0.5, beta=0.1, phi=0.9, gamma=0.1):
+        """从缓存数据（已按日期、上传时间倒序）生成时间序列，没有数据时返回 None"""
+        if freq not in FREQUENCIES:
+            raise ValueError(f"不支持的周期：{freq}，可选：{', '.join(FREQUENCIES)}")
+        dates = pd.to_datetime(df['日期'], errors='coerce')
+        valid = df['品种'].notna() & dates.notna()
+        df, dates = df[valid], dates[valid]
+        if df.empty:
+            return None
+
+        starts = period_start(dates, freq)
+        grid = pd.date_range(starts.min(), starts.max(), freq=_GRID_FREQ[freq])
+        forecast_grid = pd.date_range(grid[-1], periods=horizon + 1, freq=_GRID_FREQ[freq])[1:]
+        codes, items = pd.factorize(df['品种'], sort=True)
+        positions = grid.get_indexer(starts)
+        # 每个 (品种, 周期) 在展开后的矩阵中的位置
+        cells = codes.astype(np.int64) * len(grid) + positions
+
+        observed = np.full((len(price_columns), len(items), len(grid)), np.nan)
+        for s, col in enumerate(price_columns):
+            price = df[col].to_numpy(dtype='float64')
+            quoted = np.flatnonzero(price > 0)
+            # 数据按上传时间倒序，每个周期第一次出现的报价就是最新的
+            cell, first = np.unique(cells[quoted], return_index=True)
+            observed[s, cell // len(grid), cell % len(grid)] = price[quoted[first]]
+
+        prices = forward_fill(observed)
+        flat = prices.reshape(-1, len(grid))
+        forecast = exponential_smoothing(flat, horizon, alpha, beta, phi, gamma, SEASON_LENGTH[freq])
+        label = _LABEL_FORMAT[freq]
+        return cls(list(items), list(grid.strftime(label)), list(forecast_grid.strftime(label)), price_columns,
+                   freq, window, observed, prices, rolling_mean(prices, window), rolling_volatility(prices, window),
+                   forecast.reshape(len(price_columns), len(items), horizon))
+
+    def __contains__(self, food_item):
+        return food_item in self.index
+
+    def positions(self, food_items):
+        """品种在矩阵中的行号，找不到的品种为 -1"""
+        return np.array([self.index.get(item, -1) for item in food_items], dtype=np.int64)
+
+    def item_series(self, food_item, last=None):
+        """某个品种的序列，只取最近 last 个周期；品种不存在时返回 None
+
+        返回 {'周期': [...], '预测周期': [...], 供应商价格列: {'报价', '价格', '均价', '波动率', '预测'}}，
+        报价为该周期实际的报价（没有报价为 None），价格为前向填充后的价格。
+        """
+        i = self.index.get(food_item)
+        if i is None:
+            return None
+        window = slice(-last, None) if last else slice(None)
+        result = {'周期': self.periods[window], '预测周期': self.forecast_periods}
+        for s, col in enumerate(self.price_columns):
+            result[col] = {
+                '报价': _list(self.observed[s, i, window]),
+                '价格': _list(self.prices[s, i, window]),
+                '均价': _list(self.mean[s, i, window]),
+                '波动率': _list(self.volatility[s, i, window]),
+                '预测': _list(self.forecast[s, i]),
+            }
+        return result
+
+    def latest(self, food_items):
+        """品种当前的滚动均价、波动率和下一周期的预测价格
+
+        返回 {供应商价格列: {'均价', '波动率', '预测'}}，每项为与 food_items 对应的数组，找不到的品种为 NaN。
+        """
+        positions = self.positions(food_items)
+        found = positions >= 0
+        result = {}
+        for s, col in enumerate(self.price_columns):
+            values = {}
+            for name, matrix in (('均价', self.mean[s, :, -1]), ('波动率', self.volatility[s, :, -1]),
+                                 ('预测', self.forecast[s, :, 0])):
+                column = np.full(len(positions), np.nan)
+                column[found] = matrix[positions[found]]
+                values[name] = column
+            result[col] = values
+        return result
+
+    def forecast_frame(self, food_items=None):
+        """各品种的预测价格，列为 品种、周期、供应商价格列、最低价；每个 (品种, 预测周期) 一行"""
+        positions = np.arange(len(self.items)) if food_items is None else self.positions(food_items)
+        positions = positions[positions >= 0]
+        horizon = len(self.forecast_periods)
+        frame = {
+            '品种': np.repeat(np.array(self.items, dtype=object)[positions], horizon),
+            '周期': np.tile(np.array(self.forecast_periods, dtype=object), len(positions)),
+        }
+        for s, col in enumerate(self.price_columns):
+            frame[col] = self.forecast[s, positions].ravel()
+        frame['最低价'] = self.best_forecast[positions].ravel()
+        return pd.DataFrame(frame)
+
+
+def _list(values):
+    return [None if np.isnan(value) else round(value, 2) for value in values.tolist()]
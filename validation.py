@@ -0,0 +1,218 @@
+"""导入数据的校验和隔离
+
+导入时分两个阶段检查报价，不通过的行不写入价格数据，放进隔离表等待审核：
+
+1. 解析时（ingest.prepare_frame，在解析进程中）检查价格文本。文本中只有一个数字时去掉
+   其余字符（例如 12.5元 -> 12.5），没有数字时记为 0（缺货等）；出现多个数字时
+   （例如 12.5元/500g、8-10）无法确定价格，整行隔离，而不是把数字拼在一起。
+2. 写入前（FoodPriceTracker.import_frames）和历史数据比较：
+   - 单位：与该品种最近一次报价的单位不同
+   - 价格：与该品种、该供应商最近 depth 次报价相比，稳健 z 分数
+     0.6745 × (价格 - 中位数) / MAD 的绝对值超过阈值。MAD 至少取中位数的 MIN_SPREAD 倍，
+     历史价格一直不变时，正常的小幅波动不会被当作异常；报价少于 MIN_HISTORY 次时不判断
+
+两个阶段都是对上传数据整列计算，只遍历一次。历史报价的统计（PriceProfile）按数据版本
+缓存，导入后只合并新数据，不重新扫描全部历史。
+"""
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from lazy_imports import lazy_module
+
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+
+PENDING, APPROVED, REJECTED = 'pending', 'approved', 'rejected'
+STATUSES = (PENDING, APPROVED, REJECTED)
+# 参与统计的报价至少要有这么多次
+MIN_HISTORY = 3
+# MAD 的下限（相对于中位数）
+MIN_SPREAD = 0.1
+# 正态分布下 MAD 与标准差的换算系数
+_MAD_SCALE = 0.6745
+# 价格文本中的数字；数字之间的千位分隔符先去掉
+_NUMBER = r'\d+(?:\.\d+)?'
+_THOUSANDS = r'(?<=\d),(?=\d{3}(?!\d))'
+
+
+def _no_reasons(df):
+    return pd.Series('', index=df.index, dtype=object)
+
+
+def _add_reason(reasons, mask, message):
+    """给 mask 选中的行追加原因，message 为文本或与 reasons 对齐的 Series"""
+    mask = pd.Series(mask, index=reasons.index)
+    if not mask.any():
+        return reasons
+    if isinstance(message, pd.Series):
+        message = message[mask]
+    current = reasons[mask]
+    reasons = reasons.copy()
+    reasons[mask] = current.where(current == '', current + '；') + message
+    return reasons
+
+
+def _normalize_text(series):
+    return series.astype(str).str.normalize('NFKC').str.strip().str.lower()
+
+
+def price_format_issues(df, price_columns):
+    """价格文本中有多个数字、无法确定价格的行，返回每行的原因（没有问题为空字符串）"""
+    reasons = _no_reasons(df)
+    for col in price_columns:
+        values = df[col]
+        if pd.api.types.is_numeric_dtype(values):
+            continue
+        present = values.notna()
+        if not present.any():
+            continue
+        text = values[present].astype(str)
+        counts = text.str.normalize('NFKC').str.replace(_THOUSANDS, '', regex=True).str.count(_NUMBER)
+        bad = (counts > 1).reindex(df.index, fill_value=False)
+        reasons = _add_reason(reasons, bad, f'{col}无法识别：' + text.reindex(df.index, fill_value=''))
+    return reasons
+
+
+class PriceProfile:
+    """各品种最近的单位，以及各 (品种, 价格列) 最近 depth 次正报价的中位数和 MAD"""
+
+    def __init__(self, recent, depth):
+        # 每个 (品种, 价格列) 最多 depth 行，按日期、上传时间倒序
+        self.recent = recent
+        self.depth = depth
+        self.units = recent.drop_duplicates('品种').set_index('品种')['单位']
+        grouped = recent.groupby(['品种', '价格列'], sort=False)['价格']
+        deviation = (recent['价格'] - grouped.transform('median')).abs()
+        self.stats = pd.DataFrame({
+            '中位数': grouped.median(),
+            'MAD': deviation.groupby([recent['品种'], recent['价格列']], sort=False).median(),
+            '次数': grouped.size(),
+        })
+
+    @staticmethod
+    def _long(df, price_columns):
+        long = df.melt(id_vars=['品种', '单位', '日期', '上传时间'], value_vars=list(price_columns),
+                       var_name='价格列', value_name='价格')
+        return long[long['品种'].notna() & (long['价格'] > 0)]
+
+    @classmethod
+    def build(cls, df, price_columns, depth=8):
+        """从全部数据（已按日期、上传时间倒序）统计"""
+        long = cls._long(df, price_columns)
+        return cls(long.groupby(['品种', '价格列'], sort=False).head(depth).reset_index(drop=True), depth)
+
+    def update(self, df, price_columns):
+        """合并一批新数据，返回新的统计（不修改原对象，读取方无需加锁）"""
+        long = pd.concat([self._long(df, price_columns), self.recent], ignore_index=True)
+        long = long.sort_values(['日期', '上传时间'], ascending=False, kind='mergesort')
+        return type(self)(long.groupby(['品种', '价格列'], sort=False).head(self.depth)
+                          .reset_index(drop=True), self.depth)
+
+
+def history_issues(df, profile, price_columns, threshold=3.5):
+    """和历史报价比较，返回每行的原因（没有问题为空字符串）"""
+    reasons = _no_reasons(df)
+    if profile is None or df.empty:
+        return reasons
+
+    expected = df['品种'].map(profile.units)
+    mismatch = (expected.notna() & df['单位'].notna()
+                & (_normalize_text(df['单位']) != _normalize_text(expected.fillna(''))))
+    reasons = _add_reason(reasons, mismatch, '单位与历史不一致（历史为 ' + expected.fillna('').astype(str) + '）')
+
+    for col in price_columns:
+        keys = pd.MultiIndex.from_arrays([df['品种'], np.full(len(df), col, dtype=object)])
+        stats = profile.stats.reindex(keys)
+        median = stats['中位数'].to_numpy()
+        scale = np.maximum(stats['MAD'].to_numpy(), MIN_SPREAD * median)
+        price = df[col].to_numpy(dtype='float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            score = _MAD_SCALE * (price - median) / scale
+        outlier = (price > 0) & (stats['次数'].to_numpy() >= MIN_HISTORY) & (np.abs(score) > threshold)
+        if outlier.any():
+            medians = pd.Series(median, index=df.index).round(2).astype(str)
+            reasons = _add_reason(reasons, outlier, f'{col}异常（近期中位数 ' + medians + '）')
+    return reasons
+
+
+class QuarantineStore:
+    """未通过校验的报价，保存在 SQLite 中等待审核，所有 worker 进程共享"""
+
+    def __init__(self, db_path='quarantine.db'):
+        self.db_path = os.path.abspath(db_path)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS quarantine ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT, status TEXT, reviewed_at TEXT, '
+                         '"品种" TEXT, "单位" TEXT, "日期" TEXT, "上传时间" TEXT, "价格" TEXT, "原因" TEXT)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_quarantine_status ON quarantine (status, id)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, rows, price_columns):
+        """保存一批隔离的行（DataFrame，包含 原因 列），价格保留原始文本；返回保存的条数"""
+        if rows.empty:
+            return 0
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        prices = rows.reindex(columns=price_columns).astype(object)
+        prices = prices.where(prices.notna(), None).to_dict('records')
+        fields = rows.reindex(columns=['品种', '单位', '日期', '上传时间', '原因']).astype(object)
+        fields = fields.where(fields.notna(), None).itertuples(index=False, name=None)
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT INTO quarantine (created_at, status, "品种", "单位", "日期", "上传时间", "原因", "价格") '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                ((created_at, PENDING, *row, json.dumps(price, ensure_ascii=False, default=str))
+                 for row, price in zip(fields, prices)))
+        return len(rows)
+
+    def recent(self, limit=None, status=PENDING):
+        """按状态列出，最近隔离的在前；status 为 None 时列出全部"""
+        where, params = ('WHERE status = ?', (status,)) if status else ('', ())
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT * FROM quarantine {where} ORDER BY id DESC LIMIT ?',
+                                (*params, -1 if limit is None else limit)).fetchall()
+        return [self._record(row) for row in rows]
+
+    def get(self, ids):
+        """按编号取出仍待审核的行"""
+        ids = list(ids)
+        if not ids:
+            return []
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT * FROM quarantine WHERE status = ? AND id IN ({", ".join("?" * len(ids))}) '
+                                f'ORDER BY id', (PENDING, *ids)).fetchall()
+        return [self._record(row) for row in rows]
+
+    def pending_count(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT count(*) FROM quarantine WHERE status = ?', (PENDING,)).fetchone()[0]
+
+    def mark(self, ids, status):
+        """把待审核的行标记为已通过或已拒绝，返回更新的条数"""
+        if status not in STATUSES:
+            raise ValueError(f"未知的状态：{status}，可选：{', '.join(STATUSES)}")
+        ids = list(ids)
+        if not ids:
+            return 0
+        reviewed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._connect() as conn:
+            return conn.execute(f'UPDATE quarantine SET status = ?, reviewed_at = ? '
+                                f'WHERE status = ? AND id IN ({", ".join("?" * len(ids))})',
+                                (status, reviewed_at, PENDING, *ids)).rowcount
+
+    @staticmethod
+    def _record(row):
+        record = dict(row)
+        record['价格'] = json.loads(record['价格'])
+        return record